@@ -0,0 +1,119 @@
+"""
+Compare the in-process LOC counter with scc on the same trees.
+
+    python benchmarks/loc_counter_benchmark.py repos/camel [more trees...] --workers 8
+
+For every tree both counters run --repeat times; the script reports wall
+time, throughput and every file whose code count differs, and exits
+non-zero if any file or tree total disagrees.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from git_loc import SCC_PATH, scc_language_keys
+from languages import is_programming_language
+from loc_counter import NativeLocCounter, count_file, counted_by, gitignored, shebang_counted_by
+
+def scc_by_file(tree, scc_path):
+    output = subprocess.check_output([scc_path, '--by-file', '-f', 'json', tree], universal_newlines=True)
+    counts = {}
+    for lang_data in json.loads(output) or []:
+        for file_data in lang_data.get('Files') or []:
+            counts[os.path.relpath(file_data['Location'], tree)] = (lang_data['Name'], file_data['Code'])
+    return counts
+
+def native_by_file(tree, scc_keys):
+    """Per-file counts of the files the native counter counts itself, and the files it leaves to scc."""
+    counts, handed_to_scc = {}, set()
+    for dir_path, dir_names, file_names in os.walk(tree):
+        dir_names[:] = [d for d in dir_names if d not in ('.git', '.hg', '.svn')]
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            counter = None if os.path.islink(path) else counted_by(path, scc_keys)
+            if counter is None:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if counter == 'shebang':
+                counter = shebang_counted_by(data)
+            if counter == 'scc':
+                handed_to_scc.add(os.path.relpath(path, tree))
+                continue
+            result = count_file(path, data)
+            if result:
+                counts[os.path.relpath(path, tree)] = result
+    ignored = gitignored(tree, [os.path.join(tree, path) for path in set(counts) | handed_to_scc])
+    ignored = {os.path.relpath(path, tree) for path in ignored}
+    return {path: result for path, result in counts.items() if path not in ignored}, handed_to_scc - ignored
+
+def tree_bytes(tree):
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(tree):
+        dir_names[:] = [d for d in dir_names if d != '.git']
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            if not os.path.islink(path):
+                total += os.path.getsize(path)
+    return total
+
+def best_time(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def programming_total(counts):
+    return sum(code for language, code in counts.values() if is_programming_language(language))
+
+def compare_tree(tree, counter, scc_path, repeat):
+    size_mb = tree_bytes(tree) / (1024 * 1024)
+    scc_time, scc_counts = best_time(lambda: scc_by_file(tree, scc_path), repeat)
+    native_time, native_total = best_time(lambda: counter.tree_loc(tree), repeat)
+    native_counts, handed_to_scc = native_by_file(tree, scc_language_keys(scc_path))
+
+    mismatches = []
+    for path in sorted((set(scc_counts) | set(native_counts)) - handed_to_scc):
+        scc_code = scc_counts.get(path, (None, 0))[1]
+        native_code = native_counts.get(path, (None, 0))[1]
+        if scc_code != native_code:
+            mismatches.append((path, scc_code, native_code))
+
+    scc_total = programming_total(scc_counts)
+    scc_lines = sum(scc_counts[path][1] for path in handed_to_scc if path in scc_counts)
+    print(f"{tree}: {len(scc_counts)} files, {size_mb:.1f} MB, "
+          f"{len(handed_to_scc)} files ({scc_lines} code lines) handed to scc")
+    print(f"  scc    {scc_time:8.3f}s  {size_mb / scc_time:8.1f} MB/s  total {scc_total}")
+    print(f"  native {native_time:8.3f}s  {size_mb / native_time:8.1f} MB/s  total {native_total}"
+          f"  ({scc_time / native_time:.2f}x)")
+    for path, scc_code, native_code in mismatches[:20]:
+        print(f"  mismatch {path}: scc {scc_code}, native {native_code}")
+    if len(mismatches) > 20:
+        print(f"  ... {len(mismatches) - 20} more mismatches")
+    return not mismatches and scc_total == native_total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trees', nargs='+', help='checked-out source trees to count')
+    parser.add_argument('--scc', default=SCC_PATH, help='scc binary to compare against')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per counter; the fastest is reported')
+    args = parser.parse_args()
+
+    counter = NativeLocCounter(args.workers, args.scc)
+    try:
+        results = [compare_tree(tree, counter, args.scc, args.repeat) for tree in args.trees]
+    finally:
+        counter.close()
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == '__main__':
+    main()
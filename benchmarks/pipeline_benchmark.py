@@ -0,0 +1,189 @@
+"""
+Time each pipeline stage on synthetic repositories, offline.
+
+    python benchmarks/pipeline_benchmark.py --scale small --scale medium
+
+Every scale gets a generated git history (benchmarks/synthetic_repo.py) and
+runs the clone, mining, diff and effort stages against the stand-ins in
+benchmarks/stubs. The scc stand-in counts with the native counter, so the
+effort and effort_native timings only compare the two LOC backends when
+--scc points at a real scc binary. Timings are appended to benchmarks/results/history.jsonl
+together with the code version, and each run is compared with the last
+one recorded for the same scale.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import main as pipeline
+from loc_counter import NativeLocCounter
+from mirror_store import MirrorStore
+from result_streams import build_commit_index
+from synthetic_repo import generate
+
+# name -> (commits, files, churn)
+SCALES = {
+    'tiny': (50, 20, 2),
+    'small': (500, 100, 3),
+    'medium': (3000, 400, 4),
+    'large': (15000, 1500, 5),
+}
+
+HISTORY_FILE = os.path.join(BENCHMARKS_DIR, 'results', 'history.jsonl')
+
+# Slowdown against the previous run that is reported as a regression,
+# ignoring stages too short for the difference to be more than noise
+REGRESSION_THRESHOLD = 0.10
+REGRESSION_MIN_SECONDS = 0.05
+
+def code_version():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, universal_newlines=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+def timed(timings, stage, func):
+    start = time.perf_counter()
+    result = func()
+    timings[stage] = round(time.perf_counter() - start, 4)
+    return result
+
+def consume(records):
+    count = 0
+    for _ in records:
+        count += 1
+    return count
+
+def run_scale(scale, commits, files, churn, seed, shards, workers, scc_path=None):
+    """Run every stage once on a fresh synthetic repository; returns stage -> seconds."""
+    work_dir = tempfile.mkdtemp(prefix=f'benchmark_{scale}_')
+    cwd = os.getcwd()
+    try:
+        # main.py finds its tools under bin/ relative to the working directory
+        os.makedirs(os.path.join(work_dir, 'bin'))
+        tools = {'RefactoringMiner': os.path.join(BENCHMARKS_DIR, 'stubs', 'RefactoringMiner'),
+                 'scc': scc_path or os.path.join(BENCHMARKS_DIR, 'stubs', 'scc')}
+        for tool, target in tools.items():
+            os.symlink(target, os.path.join(work_dir, 'bin', tool))
+        source = generate(os.path.join(work_dir, 'source'), commits, files, churn, seed)
+        os.chdir(work_dir)
+
+        timings = {}
+        url = f'file://{source}'
+        mirrors = MirrorStore('mirrors')
+        repo_path, _ = timed(timings, 'clone', lambda: pipeline.clone_repo(url, 'repos', None, mirrors))
+        timed(timings, 'clone_incremental', lambda: pipeline.clone_repo(url, 'repos', None, mirrors))
+
+        refactorings_file = os.path.abspath('refactorings.json')
+        timed(timings, 'mine', lambda: pipeline.run_refactoring_miner(repo_path, refactorings_file))
+        if shards > 1:
+            timed(timings, f'mine_{shards}_shards', lambda: pipeline.run_refactoring_miner(
+                repo_path, os.path.abspath('refactorings_sharded.json'), 'main', shards
+            ))
+
+        commit_index = timed(timings, 'commit_index', lambda: build_commit_index(repo_path, refactorings_file))
+        timed(timings, 'diff', lambda: consume(
+            pipeline.analyze_diffs(repo_path, refactorings_file, commit_index)
+        ))
+        effort_records = timed(timings, 'effort', lambda: consume(
+            pipeline.analyze_developer_effort(repo_path, refactorings_file, None, commit_index)
+        ))
+        counter = NativeLocCounter(workers)
+        try:
+            native_records = timed(timings, 'effort_native', lambda: consume(pipeline.analyze_developer_effort(
+                repo_path, refactorings_file, None, commit_index, loc_counter=counter
+            )))
+        finally:
+            counter.close()
+        if not effort_records == native_records == len(commit_index):
+            raise RuntimeError(f'{scale}: effort analysis skipped commits, timings would be meaningless')
+        timings['refactoring_commits'] = len(commit_index)
+        return timings
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def previous_result(scale, parameters):
+    if not os.path.exists(HISTORY_FILE):
+        return None
+    previous = None
+    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['scale'] == scale and entry['parameters'] == parameters:
+                previous = entry
+    return previous
+
+def report(scale, timings, previous):
+    print(f"{scale}: {timings.get('refactoring_commits')} refactoring commits")
+    for stage, seconds in timings.items():
+        if stage == 'refactoring_commits':
+            continue
+        line = f"  {stage:<20} {seconds:9.3f}s"
+        old = previous['timings'].get(stage) if previous else None
+        if old:
+            change = (seconds - old) / old
+            line += f"  {change:+7.1%} vs {previous['version']}"
+            if change > REGRESSION_THRESHOLD and seconds - old > REGRESSION_MIN_SECONDS:
+                line += '  REGRESSION'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help='scale to run (repeatable; default: tiny and small)')
+    parser.add_argument('--commits', type=int, help='custom scale: number of commits')
+    parser.add_argument('--files', type=int, default=200, help='custom scale: initial source files')
+    parser.add_argument('--churn', type=int, default=3, help='custom scale: most files changed per commit')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--shards', type=int, default=4, help='also time sharded mining with this many shards')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='native LOC counter processes')
+    parser.add_argument('--scc', type=os.path.abspath, help='real scc binary to use instead of the stand-in')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scale; the fastest time per stage is kept')
+    parser.add_argument('--no-save', action='store_true', help='do not append to the history file')
+    args = parser.parse_args()
+
+    runs = [(scale, SCALES[scale]) for scale in args.scale or ['tiny', 'small']]
+    if args.commits:
+        runs = [(f'custom-{args.commits}', (args.commits, args.files, args.churn))]
+
+    version = code_version()
+    for scale, (commits, files, churn) in runs:
+        parameters = {'commits': commits, 'files': files, 'churn': churn, 'seed': args.seed, 'shards': args.shards}
+        if args.scc:
+            parameters['scc'] = 'real'
+        timings = {}
+        for _ in range(max(1, args.repeat)):
+            run = run_scale(scale, commits, files, churn, args.seed, args.shards, args.workers, args.scc)
+            for stage, seconds in run.items():
+                timings[stage] = min(timings.get(stage, seconds), seconds)
+        report(scale, timings, previous_result(scale, parameters))
+
+        if not args.no_save:
+            os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+            with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'time': time.time(), 'version': version, 'python': platform.python_version(),
+                    'host': platform.node(), 'cpus': os.cpu_count(), 'scale': scale,
+                    'parameters': parameters, 'timings': timings
+                }) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Generate a synthetic Java git history of a chosen size, offline.
+
+    python benchmarks/synthetic_repo.py /tmp/synthetic --commits 2000 --files 300 --churn 4
+
+The same arguments and --seed always produce the same history. Commits are
+written with `git fast-import`, so even large histories take seconds.
+"""
+import random
+import argparse
+import subprocess
+
+AUTHORS = [
+    ('Alice Example', 'alice@example.org'), ('Bob Example', 'bob@example.org'),
+    ('Carol Example', 'carol@example.org'), ('Dave Example', 'dave@example.org'),
+    ('Erin Example', 'erin@example.org'), ('Frank Example', 'frank@example.org'),
+]
+
+PACKAGES = ['core', 'io', 'util', 'model', 'service', 'web', 'storage', 'config']
+
+START_TIME = 1262304000  # 2010-01-01, so dates do not depend on when the benchmark runs
+
+def java_method(rng, name):
+    lines = [f'    /** Computes {name}. */', f'    public int {name}(int value) {{']
+    for index in range(rng.randint(2, 12)):
+        if rng.random() < 0.15:
+            lines.append(f'        // step {index}')
+        lines.append(f'        value = value * {rng.randint(2, 9)} + {rng.randint(0, 99)};')
+    lines.append('        return value;')
+    lines.append('    }')
+    return lines
+
+def java_file(package, class_name, methods):
+    lines = [
+        '/*',
+        ' * Synthetic source file for benchmarks.',
+        ' */',
+        f'package org.example.{package};',
+        '',
+        f'public class {class_name} {{',
+    ]
+    for method in methods:
+        lines.append('')
+        lines.extend(method)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+class SyntheticFile:
+    def __init__(self, rng, index):
+        self.package = rng.choice(PACKAGES)
+        self.class_name = f'Component{index}'
+        self.methods = [java_method(rng, f'step{n}') for n in range(rng.randint(1, 6))]
+        self.next_method = len(self.methods)
+
+    @property
+    def path(self):
+        return f'src/main/java/org/example/{self.package}/{self.class_name}.java'
+
+    def content(self):
+        return java_file(self.package, self.class_name, self.methods)
+
+    def mutate(self, rng):
+        """Edit, add or remove a method; sometimes rename the class."""
+        roll = rng.random()
+        if roll < 0.5 and self.methods:
+            self.methods[rng.randrange(len(self.methods))] = java_method(rng, f'step{self.next_method}')
+        elif roll < 0.8 or not self.methods:
+            self.methods.append(java_method(rng, f'step{self.next_method}'))
+        else:
+            self.methods.pop(rng.randrange(len(self.methods)))
+        self.next_method += 1
+        if rng.random() < 0.02:
+            self.class_name += 'Impl'
+
+def blob_command(data):
+    encoded = data.encode()
+    return b'data %d\n%s\n' % (len(encoded), encoded)
+
+def generate(path, commits=500, files=100, churn=3, seed=1):
+    """Create a git repository at path with the given history; returns its path."""
+    rng = random.Random(seed)
+    subprocess.run(['git', 'init', '--quiet', '--initial-branch=main', path], check=True)
+
+    live = [SyntheticFile(rng, index) for index in range(files)]
+    next_index = files
+    stream = []
+    for number in range(1, commits + 1):
+        name, email = rng.choice(AUTHORS)
+        when = START_TIME + number * 3600
+        changes = []
+        if number == 1:
+            touched = live
+        else:
+            touched = rng.sample(live, min(len(live), rng.randint(1, churn)))
+            for synthetic in touched:
+                old_path = synthetic.path
+                synthetic.mutate(rng)
+                if synthetic.path != old_path:
+                    changes.append(f'D {old_path}\n'.encode())
+            if rng.random() < 0.05:
+                synthetic = SyntheticFile(rng, next_index)
+                next_index += 1
+                live.append(synthetic)
+                touched.append(synthetic)
+            if rng.random() < 0.02 and len(live) > 1:
+                removed = live.pop(rng.randrange(len(live)))
+                touched = [synthetic for synthetic in touched if synthetic is not removed]
+                changes.append(f'D {removed.path}\n'.encode())
+
+        for synthetic in touched:
+            changes.append(f'M 100644 inline {synthetic.path}\n'.encode() + blob_command(synthetic.content()))
+
+        message = f'Change {number}'
+        stream.append(b'commit refs/heads/main\n')
+        stream.append(f'author {name} <{email}> {when} +0000\n'.encode())
+        stream.append(f'committer {name} <{email}> {when} +0000\n'.encode())
+        stream.append(blob_command(message))
+        stream.extend(changes)
+        stream.append(b'\n')
+
+    subprocess.run(
+        ['git', 'fast-import', '--quiet'],
+        cwd=path, input=b''.join(stream), check=True
+    )
+    subprocess.run(['git', 'checkout', '--quiet', '--force', 'main'], cwd=path, check=True)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='directory of the new repository')
+    parser.add_argument('--commits', type=int, default=500)
+    parser.add_argument('--files', type=int, default=100, help='source files in the first commit')
+    parser.add_argument('--churn', type=int, default=3, help='most files changed by one commit')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    generate(args.path, args.commits, args.files, args.churn, args.seed)
+
+if __name__ == '__main__':
+    main()
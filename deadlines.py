@@ -0,0 +1,171 @@
+import os
+import time
+import heapq
+import signal
+import itertools
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# Seconds between SIGTERM and SIGKILL for a process tree past its deadline
+KILL_GRACE_SECONDS = 5
+
+class DeadlineExceeded(Exception):
+    """A stage, commit or external tool ran past its time budget."""
+
+    def __init__(self, what, seconds=None):
+        self.what = what
+        self.seconds = seconds
+        budget = f' of {seconds:g}s' if seconds is not None else ''
+        super().__init__(f'{what} exceeded its time budget{budget}')
+
+class Watch:
+    def __init__(self, pid, what, seconds):
+        self.pid = pid
+        self.what = what  # Reported as what ran out of time
+        self.seconds = seconds
+        self.fired = False
+        self.cancelled = False
+
+class Watchdog:
+    """
+    One thread that kills process trees whose deadline has passed. Watched
+    processes must run in their own session (start_new_session=True), so
+    the whole group, e.g. a launcher script and its JVM, goes down together.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        self.counter = itertools.count()
+        self.thread = None
+
+    def watch(self, pid, seconds, what=None, budget=None):
+        """Kill pid's process group after seconds; what and budget end up in DeadlineExceeded."""
+        watch = Watch(pid, what, budget if budget is not None else seconds)
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            heapq.heappush(self.heap, (time.monotonic() + seconds, next(self.counter), watch, signal.SIGTERM))
+            self.condition.notify()
+        return watch
+
+    def cancel(self, watch):
+        with self.condition:
+            watch.cancelled = True
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.condition.wait(timeout)
+                _, _, watch, signal_number = heapq.heappop(self.heap)
+                if watch.cancelled:
+                    continue
+                watch.fired = True
+                if signal_number == signal.SIGTERM:
+                    heapq.heappush(self.heap, (
+                        time.monotonic() + KILL_GRACE_SECONDS, next(self.counter), watch, signal.SIGKILL
+                    ))
+            try:
+                os.killpg(watch.pid, signal_number)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+WATCHDOG = Watchdog()
+
+_local = threading.local()
+
+@contextmanager
+def deadline(seconds, what='stage'):
+    """
+    Give the enclosed block a time budget. Nested budgets only ever shrink;
+    external tools started through this module are killed when it runs out.
+    """
+    if not seconds:
+        yield
+        return
+    stack = _local.__dict__.setdefault('deadlines', [])
+    stack.append((time.monotonic() + seconds, what, seconds))
+    try:
+        yield
+    finally:
+        stack.pop()
+
+def current_deadlines():
+    """The enclosing deadlines of this thread, to hand to worker threads."""
+    return list(getattr(_local, 'deadlines', None) or [])
+
+@contextmanager
+def inherited_deadlines(deadlines):
+    """Run the enclosed block under deadlines taken from another thread."""
+    stack = _local.__dict__.setdefault('deadlines', [])
+    stack.extend(deadlines)
+    try:
+        yield
+    finally:
+        del stack[len(stack) - len(deadlines):]
+
+def _nearest_deadline():
+    stack = getattr(_local, 'deadlines', None)
+    if not stack:
+        return None
+    return min(stack)
+
+def remaining():
+    """Seconds left of the tightest enclosing deadline, or None if there is none."""
+    nearest = _nearest_deadline()
+    return nearest[0] - time.monotonic() if nearest else None
+
+def check_deadline():
+    """Raise DeadlineExceeded if the tightest enclosing deadline has passed."""
+    nearest = _nearest_deadline()
+    if nearest and time.monotonic() >= nearest[0]:
+        raise DeadlineExceeded(nearest[1], nearest[2])
+
+def _watch_limit(command, timeout):
+    """(seconds, what, budget) for the watchdog, or None without a time limit."""
+    left = remaining()
+    if left is not None and (not timeout or left < timeout):
+        check_deadline()
+        _, what, budget = _nearest_deadline()
+        return left, what, budget
+    if timeout:
+        return timeout, os.path.basename(command[0]), timeout
+    return None
+
+def start_watched(command, timeout=None, **kwargs):
+    """
+    Popen command in its own session and have the watchdog kill its process
+    tree after timeout seconds or when the enclosing deadline runs out.
+    Returns (process, watch); watch is None when there is no time limit.
+    """
+    limit = _watch_limit(command, timeout)
+    process = subprocess.Popen(command, start_new_session=True, **kwargs)
+    watch = WATCHDOG.watch(process.pid, *limit) if limit else None
+    return process, watch
+
+def finish_watched(process, watch):
+    """Stop watching process; raise DeadlineExceeded if the watchdog killed it."""
+    if watch is None:
+        return
+    WATCHDOG.cancel(watch)
+    if watch.fired:
+        raise DeadlineExceeded(watch.what, watch.seconds)
+
+def check_output(command, timeout=None, **kwargs):
+    """subprocess.check_output() under the watchdog."""
+    process, watch = start_watched(command, timeout, stdout=subprocess.PIPE, **kwargs)
+    try:
+        output, _ = process.communicate()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        finish_watched(process, watch)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, output)
+    return output
@@ -0,0 +1,134 @@
+import os
+import zlib
+import hashlib
+import threading
+from collections.abc import Mapping
+
+class DiffStore:
+    """
+    Content-addressed, zlib-compressed diff bodies of one repository. Each
+    distinct diff is stored once in an append-only pack file; an index file
+    maps its SHA-1 to the (offset, length) of the compressed bytes.
+    """
+
+    def __init__(self, prefix):
+        self.pack_path = f'{prefix}.pack'
+        self.index_path = f'{prefix}.idx'
+        self.lock = threading.Lock()
+        self.entries = {}
+        self._load_index()
+        self.pack = open(self.pack_path, 'ab')
+        self.index = open(self.index_path, 'a', encoding='ascii')
+        self.reader = None
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        with open(self.index_path, 'r', encoding='ascii', errors='replace') as f:
+            for line in f:
+                fields = line.split()
+                # A crash can leave a torn last line or an entry whose bytes never reached the pack
+                if len(fields) != 3 or not fields[1].isdigit() or not fields[2].isdigit():
+                    continue
+                offset, length = int(fields[1]), int(fields[2])
+                if offset + length <= pack_size:
+                    self.entries[fields[0]] = (offset, length)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def put(self, text):
+        """Store a diff body if it is new and return its key."""
+        key = self.key(text)
+        with self.lock:
+            if key in self.entries:
+                return key
+        data = zlib.compress(text.encode('utf-8', 'surrogateescape'))
+        with self.lock:
+            if key not in self.entries:
+                offset = self.pack.tell()
+                self.pack.write(data)
+                self.index.write(f'{key} {offset} {len(data)}\n')
+                self.entries[key] = (offset, len(data))
+        return key
+
+    def get(self, key):
+        """Return the diff body stored under key."""
+        with self.lock:
+            offset, length = self.entries[key]
+            self.pack.flush()
+            if self.reader is None:
+                self.reader = open(self.pack_path, 'rb')
+            self.reader.seek(offset)
+            data = self.reader.read(length)
+        return zlib.decompress(data).decode('utf-8', 'surrogateescape')
+
+    def flush(self):
+        """Make everything stored so far durable; call before results refer to it."""
+        with self.lock:
+            for f in (self.pack, self.index):
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.pack.close()
+            self.index.close()
+            if self.reader is not None:
+                self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def open_diff_store(prefix):
+    """The DiffStore at prefix, or None if nothing was ever stored there."""
+    if os.path.exists(f'{prefix}.idx'):
+        return DiffStore(prefix)
+    return None
+
+class LazyDiffContent(Mapping):
+    """Read-only {filename: diff} view that loads each diff on first access."""
+
+    def __init__(self, diff_store, refs):
+        self.diff_store = diff_store
+        self.refs = refs
+        self.loaded = {}
+
+    def __getitem__(self, filename):
+        if filename not in self.loaded:
+            self.loaded[filename] = self.diff_store.get(self.refs[filename])
+        return self.loaded[filename]
+
+    def __iter__(self):
+        return iter(self.refs)
+
+    def __len__(self):
+        return len(self.refs)
+
+def store_diff_content(records, diff_store):
+    """Replace each record's inline diff_content with diff_refs into diff_store."""
+    for record in records:
+        diff_content = record.pop('diff_content')
+        record['diff_refs'] = {
+            filename: diff_store.put(diff) for filename, diff in diff_content.items()
+        }
+        yield record
+
+def with_diff_content(record, diff_store, lazy=True):
+    """
+    Give a diff record a diff_content mapping again. With lazy the diffs are
+    only read when accessed; otherwise they are loaded into a plain dict.
+    """
+    if 'diff_refs' not in record:
+        return record
+    record = dict(record)
+    refs = record.pop('diff_refs')
+    content = LazyDiffContent(diff_store, refs)
+    record['diff_content'] = content if lazy else dict(content)
+    return record
@@ -0,0 +1,432 @@
+"""
+Per-developer, per-repository and per-period rollups of all results.
+
+    python effort_aggregates.py results --state results/aggregates.bin --by developer
+    python effort_aggregates.py results --state results/aggregates.bin --by repo developer --period year
+
+Refactoring commits of every repository are kept in one array-backed
+table (one typed array per column, strings dictionary-encoded). Each run
+only reads what was appended to the result files since the last one, and
+the rollups are adjusted row by row instead of being recomputed. main.py
+--aggregate PATH does the same for every repository as it finishes.
+"""
+import os
+import json
+import array
+import argparse
+import threading
+from effort_sampling import PERIODS, period_key
+from result_streams import iter_refactoring_commits
+
+MEASURES = ('commits', 'tloc', 'insertions', 'deletions', 'refactorings')
+
+# Rollups kept up to date as rows change; any other grouping is computed on demand
+ROLLUPS = (
+    ('developer',),
+    ('repo',),
+    ('window',),
+    ('repo', 'developer'),
+    ('developer', 'window'),
+)
+
+DIMENSIONS = ('repo', 'developer', 'window')
+
+# Typed arrays backing the table, in the order they are saved
+COLUMNS = (
+    ('repo', 'I'),
+    ('developer', 'I'),
+    ('author_time', 'q'),
+    ('tloc', 'q'),
+    ('insertions', 'q'),
+    ('deletions', 'q'),
+    ('refactorings', 'q'),
+)
+
+SHA_BYTES = 20
+UNKNOWN_TIME = -1
+
+# Bytes before a file's ingested offset remembered to notice rewritten files
+TAIL_BYTES = 64
+
+class Dictionary:
+    """Strings encoded as small integers; code 0 stands for a missing value."""
+
+    def __init__(self, values=None):
+        self.values = values or [None]
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        if value is None:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+class EffortAggregates:
+    """
+    One row per (repository, refactoring commit) with its developer, author
+    time, tloc, diff insertions/deletions and number of refactorings. The
+    effort, diff and refactoring outputs fill in their columns of a row
+    whenever they arrive, and every maintained rollup is updated by the
+    row's old and new contribution.
+    """
+
+    def __init__(self, path=None, period='quarter'):
+        self.path = path
+        self.period = period
+        self.lock = threading.Lock()
+        self.repos = Dictionary()
+        self.developers = Dictionary()
+        self.windows = Dictionary()
+        self.window_codes = {}  # UTC day -> window code
+        self.columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+        self.shas = bytearray()
+        self.sources = {}  # repo -> {kind: how far it was read}
+        self.rows = {}
+        self.rollups = {dims: {} for dims in ROLLUPS}
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.columns['repo'])
+
+    # Table
+
+    def _window_code(self, row):
+        author_time = self.columns['author_time'][row]
+        if author_time == UNKNOWN_TIME:
+            return 0
+        day = author_time // 86400  # Windows are whole UTC days
+        code = self.window_codes.get(day)
+        if code is None:
+            code = self.window_codes[day] = self.windows.encode(period_key(author_time, self.period))
+        return code
+
+    def _key(self, row, dims):
+        key = []
+        for dim in dims:
+            if dim == 'window':
+                key.append(self._window_code(row))
+            else:
+                key.append(self.columns[dim][row])
+        return tuple(key)
+
+    def _measures(self, row):
+        columns = self.columns
+        return (1, columns['tloc'][row], columns['insertions'][row], columns['deletions'][row],
+                columns['refactorings'][row])
+
+    def _contribute(self, row, sign):
+        values = self._measures(row)
+        for dims, rollup in self.rollups.items():
+            key = self._key(row, dims)
+            totals = rollup.get(key)
+            if totals is None:
+                totals = rollup[key] = [0] * len(MEASURES)
+            for index, value in enumerate(values):
+                totals[index] += sign * value
+            if not totals[0]:
+                del rollup[key]
+
+    def _row(self, repo_code, sha):
+        key = (repo_code, sha)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self)
+            self.shas += bytes.fromhex(sha)
+            for name, column in self.columns.items():
+                column.append(repo_code if name == 'repo' else UNKNOWN_TIME if name == 'author_time' else 0)
+            self._contribute(row, 1)
+        return row
+
+    def _set(self, repo_code, sha, **values):
+        """Overwrite some columns of a row, creating it if needed."""
+        row = self._row(repo_code, sha)
+        self._contribute(row, -1)
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self._contribute(row, 1)
+
+    def _drop_repo(self, repo_code):
+        """Remove every row of a repository, e.g. because its results were rewritten."""
+        keep = [row for row in range(len(self)) if self.columns['repo'][row] != repo_code]
+        if len(keep) == len(self):
+            return
+        for row in range(len(self)):
+            if self.columns['repo'][row] == repo_code:
+                self._contribute(row, -1)
+        self.columns = {
+            name: array.array(column.typecode, (column[row] for row in keep))
+            for name, column in self.columns.items()
+        }
+        shas = bytearray()
+        for row in keep:
+            shas += self.shas[row * SHA_BYTES:(row + 1) * SHA_BYTES]
+        self.shas = shas
+        self._index_rows()
+
+    def _index_rows(self):
+        repo_column = self.columns['repo']
+        self.rows = {
+            (repo_column[row], self.shas[row * SHA_BYTES:(row + 1) * SHA_BYTES].hex()): row
+            for row in range(len(self))
+        }
+
+    # Ingestion
+
+    @staticmethod
+    def _tail(f, offset):
+        f.seek(max(0, offset - TAIL_BYTES))
+        return f.read(min(offset, TAIL_BYTES)).hex()
+
+    def _rewritten(self, path, source):
+        """Whether path changed before the offset read last time, instead of only growing."""
+        if not source or not source['offset']:
+            return False
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < source['offset']:
+                return True
+            return self._tail(f, source['offset']) != source['tail']
+
+    def _iter_appended(self, path, source):
+        """Yield the records appended to an NDJSON file since source, and move source past them."""
+        with open(path, 'rb') as f:
+            offset = source['offset']
+            f.seek(offset)
+            try:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Still being written; left for next time
+                    if line.strip():
+                        yield json.loads(line)
+                    offset += len(line)
+            finally:
+                source['offset'] = offset
+                source['tail'] = self._tail(f, offset)
+
+    def _read_effort(self, repo_code, records):
+        for record in records:
+            self._set(
+                repo_code, record['commit_hash'],
+                developer=self.developers.encode(record.get('developer')), tloc=record.get('tloc') or 0
+            )
+
+    def _read_diffs(self, repo_code, records):
+        for record in records:
+            stats = record.get('diff_stats') or {}
+            values = {
+                'insertions': sum(file_stats['insertions'] for file_stats in stats.values()),
+                'deletions': sum(file_stats['deletions'] for file_stats in stats.values()),
+            }
+            if record.get('author_time') is not None:
+                values['author_time'] = record['author_time']
+            self._set(repo_code, record['commit_hash'], **values)
+
+    def _read_refactorings(self, repo_code, refactorings_file):
+        for commit_info in iter_refactoring_commits(refactorings_file):
+            refactorings = commit_info.get('refactorings') or []
+            if refactorings:
+                self._set(repo_code, commit_info['sha1'], refactorings=len(refactorings))
+
+    def update_repo(self, results_dir, repo=None):
+        """
+        Bring the rows of one repository up to date with its result files in
+        results_dir (<repo>_effort_analysis.ndjson, _diff_analysis.ndjson,
+        _refactorings.json). Returns the number of rows afterwards.
+        """
+        repo = repo or os.path.basename(os.path.normpath(results_dir))
+        paths = {
+            'effort': os.path.join(results_dir, f'{repo}_effort_analysis.ndjson'),
+            'diff': os.path.join(results_dir, f'{repo}_diff_analysis.ndjson'),
+            'refactorings': os.path.join(results_dir, f'{repo}_refactorings.json'),
+        }
+        with self.lock:
+            repo_code = self.repos.encode(repo)
+            sources = self.sources.setdefault(repo, {})
+            ndjson = [kind for kind in ('effort', 'diff') if os.path.exists(paths[kind])]
+            if any(self._rewritten(paths[kind], sources.get(kind)) for kind in ndjson):
+                # Not just appended to: start the repository over
+                self._drop_repo(repo_code)
+                sources.clear()
+
+            for kind in ndjson:
+                source = sources.setdefault(kind, {'offset': 0, 'tail': ''})
+                records = self._iter_appended(paths[kind], source)
+                if kind == 'effort':
+                    self._read_effort(repo_code, records)
+                else:
+                    self._read_diffs(repo_code, records)
+
+            # RefactoringMiner output is rewritten as a whole, so it is re-read when it changes
+            if os.path.exists(paths['refactorings']):
+                stat = os.stat(paths['refactorings'])
+                signature = [stat.st_size, stat.st_mtime_ns]
+                if sources.get('refactorings') != signature:
+                    self._read_refactorings(repo_code, paths['refactorings'])
+                    sources['refactorings'] = signature
+            return sum(1 for code in self.columns['repo'] if code == repo_code)
+
+    def update(self, results_root):
+        """Update every repository directory under results_root."""
+        for name in sorted(os.listdir(results_root)):
+            results_dir = os.path.join(results_root, name)
+            if os.path.isdir(results_dir) and os.path.exists(os.path.join(results_dir, f'{name}_manifest.json')):
+                self.update_repo(results_dir, name)
+
+    # Queries
+
+    def _label(self, dim, code):
+        if dim == 'repo':
+            return self.repos.decode(code)
+        if dim == 'developer':
+            return self.developers.decode(code) or 'unknown'
+        return self.windows.decode(code) or 'unknown'
+
+    def rollup(self, by=('developer',), where=None):
+        """
+        Totals of every measure grouped by the dimensions in by (repo,
+        developer, window), largest tloc first. where ({dimension: value})
+        restricts the rows; maintained rollups are read directly, anything
+        else takes one pass over the columns.
+        """
+        by = tuple(by)
+        for dim in list(by) + list(where or ()):
+            if dim not in DIMENSIONS:
+                raise ValueError(f'unknown dimension {dim!r}; use one of {", ".join(DIMENSIONS)}')
+        with self.lock:
+            if by in self.rollups and not where:
+                groups = {key: list(totals) for key, totals in self.rollups[by].items()}
+            else:
+                groups = self._group(by, where or {})
+            result = []
+            for key, totals in groups.items():
+                entry = {dim: self._label(dim, code) for dim, code in zip(by, key)}
+                entry.update(zip(MEASURES, totals))
+                result.append(entry)
+        result.sort(key=lambda entry: (-entry['tloc'], [str(entry[dim]) for dim in by]))
+        return result
+
+    def _group(self, by, where):
+        wanted = {}
+        for dim, value in where.items():
+            dictionary = {'repo': self.repos, 'developer': self.developers, 'window': self.windows}[dim]
+            if value not in dictionary.codes:
+                return {}
+            wanted[dim] = dictionary.codes[value]
+        window_codes = None
+        if 'window' in by or 'window' in wanted:
+            window_codes = array.array('I', (self._window_code(row) for row in range(len(self))))
+        keys = {
+            'repo': self.columns['repo'], 'developer': self.columns['developer'], 'window': window_codes
+        }
+        groups = {}
+        measures = [self.columns[name] for name in MEASURES[1:]]
+        for row in range(len(self)):
+            if any(keys[dim][row] != code for dim, code in wanted.items()):
+                continue
+            key = tuple(keys[dim][row] for dim in by)
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = [0] * len(MEASURES)
+            totals[0] += 1
+            for index, column in enumerate(measures, 1):
+                totals[index] += column[row]
+        return groups
+
+    # Persistence
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('period') != self.period:
+                return  # Windows of another length: rebuild from the result files
+            self.repos = Dictionary(header['repos'])
+            self.developers = Dictionary(header['developers'])
+            self.windows = Dictionary(header['windows'])
+            self.sources = header['sources']
+            rows = header['rows']
+            for name, typecode in COLUMNS:
+                column = array.array(typecode)
+                column.fromfile(f, rows)
+                self.columns[name] = column
+            self.shas = bytearray(f.read(rows * SHA_BYTES))
+            self.rollups = {
+                tuple(dims): {tuple(key): totals for key, totals in entries}
+                for dims, entries in header['rollups']
+            }
+        self._index_rows()
+
+    def save(self, path=None):
+        """Write the table, rollups and read positions to one file, atomically."""
+        path = path or self.path
+        with self.lock:
+            header = {
+                'period': self.period,
+                'rows': len(self),
+                'repos': self.repos.values,
+                'developers': self.developers.values,
+                'windows': self.windows.values,
+                'sources': self.sources,
+                'rollups': [
+                    [list(dims), [[list(key), totals] for key, totals in rollup.items()]]
+                    for dims, rollup in self.rollups.items()
+                ],
+            }
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                for name, _ in COLUMNS:
+                    self.columns[name].tofile(f)
+                f.write(self.shas)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+def print_table(entries, by):
+    columns = list(by) + list(MEASURES)
+    widths = {
+        column: max([len(column)] + [len(str(entry[column])) for entry in entries]) for column in columns
+    }
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for entry in entries:
+        print('  '.join(str(entry[column]).ljust(widths[column]) for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('results_dir', help='directory with one sub-directory of results per repository')
+    parser.add_argument('--state', default=None,
+                        help='file that keeps the table between runs, so only new results are read')
+    parser.add_argument('--by', nargs='+', choices=DIMENSIONS, default=['developer'],
+                        help='dimensions to group by (default: developer)')
+    parser.add_argument('--where', action='append', default=[], metavar='DIMENSION=VALUE',
+                        help='only count rows with this value (repeatable)')
+    parser.add_argument('--period', choices=PERIODS, default='quarter', help='length of a time window')
+    parser.add_argument('--limit', type=int, default=None, help='print only the first rows')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    where = {}
+    for item in args.where:
+        dim, _, value = item.partition('=')
+        if dim not in DIMENSIONS or not value:
+            parser.error(f'--where expects one of {", ".join(DIMENSIONS)}=VALUE')
+        where[dim] = value
+
+    aggregates = EffortAggregates(args.state, args.period)
+    aggregates.update(args.results_dir)
+    if args.state:
+        aggregates.save()
+    entries = aggregates.rollup(args.by, where)[:args.limit]
+    if args.json:
+        print(json.dumps(entries, indent=2))
+    else:
+        print_table(entries, args.by)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import math
+import time
+import random
+import datetime
+from statistics import NormalDist
+from git_commits import iter_commits
+from deadlines import check_deadline
+
+PERIODS = ('month', 'quarter', 'year')
+
+# Commits measured in every stratum before more go where they help most
+PILOT_SAMPLES = 5
+
+# Weight, in degrees of freedom, of the pooled variance in each stratum's variance
+PRIOR_DEGREES = 4
+
+def period_key(timestamp, period='quarter'):
+    """Calendar period of a Unix timestamp, e.g. '2019-Q3'."""
+    if timestamp is None:
+        return 'unknown'
+    day = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    if period == 'year':
+        return f'{day.year}'
+    if period == 'month':
+        return f'{day.year}-{day.month:02d}'
+    return f'{day.year}-Q{(day.month - 1) // 3 + 1}'
+
+def commit_times(repo_path, commit_index):
+    """{sha: author time} for the commits of commit_index, from one git pass."""
+    return {
+        commit['hash']: commit['author_time']
+        for commit in iter_commits(repo_path, (commit_ref.sha for commit_ref in commit_index), patches=False)
+    }
+
+class Stratum:
+    """Commits of one developer in one period, and running sums of the tloc sampled so far."""
+
+    def __init__(self, developer, period, commits):
+        self.developer = developer
+        self.period = period
+        self.pending = commits  # Shuffled; sampled from the end
+        self.population = len(commits)
+        self.sampled = 0
+        self.value_sum = 0.0
+        self.square_sum = 0.0
+
+    @property
+    def exhausted(self):
+        return not self.pending
+
+    def add(self, value):
+        self.sampled += 1
+        self.value_sum += value
+        self.square_sum += value * value
+
+    def mean(self):
+        return self.value_sum / self.sampled
+
+    def sample_variance(self):
+        n = self.sampled
+        if n < 2:
+            return None
+        return max(0.0, (self.square_sum - self.value_sum ** 2 / n) / (n - 1))
+
+    def total(self):
+        return self.population * self.mean() if self.sampled else 0.0
+
+    def variance(self, pooled_variance):
+        """
+        Sample variance shrunk toward pooled_variance. A few similar values
+        (often several zero-tloc commits) say little about the rest of the
+        stratum, and stopping as soon as a variance looks small would
+        otherwise make the intervals too narrow.
+        """
+        variance = self.sample_variance()
+        if variance is None:
+            return None
+        degrees = self.sampled - 1
+        return (degrees * variance + PRIOR_DEGREES * pooled_variance) / (degrees + PRIOR_DEGREES)
+
+    def total_variance_terms(self):
+        """
+        (a, b) such that total_variance(pooled_variance) is a + b *
+        pooled_variance, or None while the variance is unknown. The pooled
+        variance moves with every sample; the terms only with this stratum.
+        """
+        n = self.sampled
+        if n >= self.population:
+            return 0.0, 0.0
+        variance = self.sample_variance()
+        if variance is None:
+            return None
+        degrees = n - 1
+        scale = self.population ** 2 * (1 - n / self.population) / n / (degrees + PRIOR_DEGREES)
+        return scale * degrees * variance, scale * PRIOR_DEGREES
+
+    def total_variance(self, pooled_variance=0.0):
+        """Variance of the estimated stratum total, with finite population correction."""
+        terms = self.total_variance_terms()
+        if terms is None:
+            return None
+        return terms[0] + terms[1] * pooled_variance
+
+    def gain(self, pooled_variance=0.0):
+        """How much the next sample is expected to shrink the variance of the total."""
+        n = self.sampled
+        variance = self.variance(pooled_variance)
+        if variance is None:
+            return math.inf
+        return self.population ** 2 * variance * (1 / n - 1 / (n + 1))
+
+def stratify(commit_index, times, period='quarter', seed=None):
+    """Group commit_index into shuffled (developer, period) strata."""
+    rng = random.Random(seed)
+    groups = {}
+    for commit_ref in commit_index:
+        key = (commit_ref.developer, period_key(times.get(commit_ref.sha), period))
+        groups.setdefault(key, []).append(commit_ref)
+    strata = []
+    for (developer, period_name), commits in sorted(groups.items()):
+        rng.shuffle(commits)
+        strata.append(Stratum(developer, period_name, commits))
+    return strata
+
+class DeveloperEstimates:
+    """
+    The per-developer figures behind developer_estimates(), kept between
+    samples. A sample only recomputes its own stratum's figures, and the
+    developer's sums are refreshed from the figures kept for the others.
+    """
+
+    def __init__(self, strata):
+        self.parts = {}       # developer -> {stratum: its figures, see update()}
+        self.developers = {}  # developer -> the sums of its strata's figures
+        for stratum in strata:
+            self.update(stratum)
+
+    def update(self, stratum):
+        """Account for a stratum that was sampled or lost a commit since the last update."""
+        terms = stratum.total_variance_terms()
+        variance = stratum.sample_variance()
+        degrees = stratum.sampled - 1 if variance is not None else 0
+        parts = self.parts.setdefault(stratum.developer, {})
+        # Estimated total, variance terms a and b, sampled, population, whether the variance
+        # is unknown, and the stratum's share of the pooled variance
+        parts[stratum] = (
+            stratum.total(), *(terms or (0.0, 0.0)), stratum.sampled, stratum.population, terms is None,
+            degrees * variance if degrees else 0.0, degrees
+        )
+        # fsum keeps the sums exact, so a developer whose commits were all measured gets a zero-width interval
+        columns = list(zip(*parts.values()))
+        self.developers[stratum.developer] = [
+            math.fsum(column) if index in (0, 1, 2, 6) else sum(column) for index, column in enumerate(columns)
+        ]
+
+    def pooled_variance(self):
+        """Within-stratum variance pooled over all strata with at least two samples."""
+        degrees = sum(sums[7] for sums in self.developers.values())
+        return math.fsum(sums[6] for sums in self.developers.values()) / degrees if degrees else 0.0
+
+    def estimates(self, confidence=0.95):
+        """
+        Per-developer estimated total tloc with a normal-approximation
+        confidence interval; half_width is None while some stratum of the
+        developer has too few samples to estimate its variance.
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        pooled = self.pooled_variance()
+        estimates = {}
+        for developer, (tloc, a, b, sampled, total, unknown, _, _) in self.developers.items():
+            half_width = None if unknown else z * math.sqrt(a + b * pooled)
+            estimates[developer] = {
+                'estimated_tloc': tloc,
+                'sampled_commits': sampled,
+                'total_commits': total,
+                'half_width': half_width,
+                'ci_low': max(0.0, tloc - half_width) if half_width is not None else None,
+                'ci_high': tloc + half_width if half_width is not None else None
+            }
+        return estimates
+
+def developer_estimates(strata, confidence=0.95):
+    """Per-developer estimates of strata, see DeveloperEstimates.estimates()."""
+    return DeveloperEstimates(strata).estimates(confidence)
+
+def meets_target(estimate, error_target):
+    if estimate['half_width'] is None:
+        return False
+    return estimate['half_width'] <= error_target * estimate['estimated_tloc']
+
+def sample_effort(strata, measure, error_target=0.1, time_budget=None, confidence=0.95, on_sample=None):
+    """
+    Measure commits until every developer's confidence interval is within
+    error_target of the estimate (relative half-width), time_budget seconds
+    have passed, or every commit was measured. measure(commit_ref) returns
+    the tloc of a commit or raises; failing commits leave the population.
+    Every stratum first gets PILOT_SAMPLES commits, then each further
+    commit goes to the stratum of an unfinished developer where it shrinks
+    the variance most. Returns (estimates, reason for stopping).
+    """
+    started = time.monotonic()
+    running = DeveloperEstimates(strata)
+
+    def take(stratum):
+        commit_ref = stratum.pending.pop()
+        try:
+            tloc = measure(commit_ref)
+        except Exception:
+            stratum.population -= 1
+            running.update(stratum)
+            return
+        stratum.add(tloc)
+        running.update(stratum)
+        if on_sample:
+            on_sample(commit_ref, stratum, tloc)
+
+    def out_of_time():
+        check_deadline()  # An enclosing stage deadline ends sampling with an error instead
+        return time_budget is not None and time.monotonic() - started >= time_budget
+
+    for stratum in strata:
+        while stratum.sampled < PILOT_SAMPLES and not stratum.exhausted:
+            if out_of_time():
+                return running.estimates(confidence), 'time budget'
+            take(stratum)
+
+    while True:
+        estimates = running.estimates(confidence)
+        unfinished = {
+            developer for developer, estimate in estimates.items()
+            if not meets_target(estimate, error_target)
+        }
+        candidates = [
+            stratum for stratum in strata
+            if stratum.developer in unfinished and not stratum.exhausted
+        ]
+        if not unfinished:
+            return estimates, 'error target'
+        if not candidates:
+            return estimates, 'all commits measured'
+        if out_of_time():
+            return estimates, 'time budget'
+        pooled = running.pooled_variance()
+        take(max(candidates, key=lambda stratum: stratum.gain(pooled)))
@@ -0,0 +1,179 @@
+import os
+import codecs
+import subprocess
+import threading
+
+# Separators that cannot appear at the start of a patch line
+COMMIT_MARKER = b'\x1e'
+FIELD_SEP = '\x1f'
+LOG_FORMAT = '%x1e%H%x1f%P%x1f%an%x1f%ae%x1f%at'
+
+def _unquote_path(path):
+    """Undo git's C-style quoting of unusual path names."""
+    path = path.rstrip('\t')
+    if len(path) >= 2 and path.startswith('"') and path.endswith('"'):
+        raw = codecs.escape_decode(path[1:-1].encode('utf-8', 'surrogateescape'))[0]
+        return raw.decode('utf-8', 'surrogateescape')
+    return path
+
+def _strip_prefix(path):
+    """Turn 'a/src/x' or 'b/src/x' into 'src/x', and /dev/null into None."""
+    path = _unquote_path(path)
+    if path == '/dev/null':
+        return None
+    if path[:2] in ('a/', 'b/'):
+        return path[2:]
+    return path
+
+def _paths_from_header(header):
+    """Best-effort paths from 'diff --git a/x b/x' when nothing better exists."""
+    rest = header[len('diff --git '):]
+    if rest.startswith('"'):
+        return None, None
+    half = 2 + (len(rest) - 5) // 2
+    path = rest[2:half]
+    return path, path
+
+class _FileDiff:
+    def __init__(self, header):
+        self.old_path, self.new_path = _paths_from_header(header)
+        self.insertions = 0
+        self.deletions = 0
+        self.lines = []
+        self.in_body = False
+
+    def header_line(self, line):
+        if line.startswith('--- '):
+            self.old_path = _strip_prefix(line[4:])
+        elif line.startswith('+++ '):
+            self.new_path = _strip_prefix(line[4:])
+        elif line.startswith('rename from '):
+            self.old_path = _unquote_path(line[len('rename from '):])
+        elif line.startswith('rename to '):
+            self.new_path = _unquote_path(line[len('rename to '):])
+        elif line.startswith('new file mode'):
+            self.old_path = None
+        elif line.startswith('deleted file mode'):
+            self.new_path = None
+
+    def body_line(self, line):
+        if line.startswith('+'):
+            self.insertions += 1
+        elif line.startswith('-'):
+            self.deletions += 1
+        self.lines.append(line)
+
+    def to_dict(self):
+        path = self.new_path or self.old_path or ''
+        return {
+            'filename': os.path.basename(path),
+            'path': path,
+            'old_path': self.old_path,
+            'insertions': self.insertions,
+            'deletions': self.deletions,
+            'diff': '\n'.join(self.lines)
+        }
+
+def _parse_commit_header(line):
+    commit_hash, parents, author_name, author_email, author_time = line[1:].split(FIELD_SEP)
+    return {
+        'hash': commit_hash,
+        'parents': parents.split(),
+        'author_name': author_name,
+        'author_email': author_email,
+        'author_time': int(author_time) if author_time else None,
+        'files': []
+    }
+
+def existing_commits(repo_path, commit_hashes):
+    """Drop hashes that do not name a commit, in one cat-file process."""
+    commit_hashes = list(commit_hashes)
+    result = subprocess.run(
+        ['git', 'cat-file', '--batch-check=%(objecttype)'],
+        cwd=repo_path,
+        input=''.join(f'{commit_hash}\n' for commit_hash in commit_hashes),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    object_types = result.stdout.splitlines()
+    return [
+        commit_hash for commit_hash, object_type in zip(commit_hashes, object_types)
+        if object_type == 'commit'
+    ]
+
+def iter_commits(repo_path, commit_hashes, patches=True):
+    """
+    Stream metadata and per-file diffs for many commits from one
+    `git log --no-walk --stdin` process. Commits come back in the order the
+    hashes were given; unknown hashes are skipped. Merge commits have no
+    files, matching pydriller's modified_files.
+    """
+    command = [
+        'git', '-c', 'core.quotePath=false', 'log',
+        '--no-walk=unsorted', '--stdin',
+        '--no-color', f'--format={LOG_FORMAT}'
+    ]
+    commit_hashes = existing_commits(repo_path, commit_hashes)
+    if patches:
+        command += ['-p', '-M', '--no-ext-diff', '--no-textconv']
+
+    process = subprocess.Popen(
+        command,
+        cwd=repo_path,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+
+    def feed():
+        try:
+            for commit_hash in commit_hashes:
+                process.stdin.write(f'{commit_hash}\n'.encode())
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    commit = None
+    file_diff = None
+    try:
+        for raw_line in process.stdout:
+            line = raw_line.rstrip(b'\n').decode('utf-8', 'ignore')
+            if raw_line.startswith(COMMIT_MARKER):
+                if commit is not None:
+                    if file_diff is not None:
+                        commit['files'].append(file_diff.to_dict())
+                    yield commit
+                commit = _parse_commit_header(line)
+                file_diff = None
+            elif line.startswith('diff --git '):
+                if file_diff is not None:
+                    commit['files'].append(file_diff.to_dict())
+                file_diff = _FileDiff(line)
+            elif file_diff is not None:
+                if line.startswith('@@'):
+                    file_diff.in_body = True
+                    file_diff.lines.append(line)
+                elif file_diff.in_body:
+                    file_diff.body_line(line)
+                else:
+                    file_diff.header_line(line)
+
+        if commit is not None:
+            if file_diff is not None:
+                commit['files'].append(file_diff.to_dict())
+            yield commit
+    finally:
+        process.stdout.close()
+        feeder.join()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
@@ -0,0 +1,281 @@
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+from languages import is_programming_language
+from deadlines import check_output, deadline
+
+SCC_PATH = os.path.join('bin', 'scc')
+
+# Submodules (gitlinks) and symlinks are not files scc would count
+SKIPPED_MODES = {'160000', '120000'}
+
+# Upper bound on blobs materialised for a single scc run
+SCC_BATCH_SIZE = 2000
+
+def language_key(path):
+    """Return the part of a path scc uses to pick a language."""
+    filename = os.path.basename(path)
+    _, ext = os.path.splitext(filename)
+    return ext.lower() if ext else filename
+
+def scc_tree_loc(path, scc_path=SCC_PATH):
+    """Programming-language LOC of a checked-out tree, counted by scc."""
+    scc_output = check_output(
+        [scc_path, '-f', 'json', path],
+        universal_newlines=True
+    )
+    scc_data = json.loads(scc_output)
+
+    total_loc = 0
+    for lang_data in scc_data:
+        if is_programming_language(lang_data['Name']):
+            total_loc += lang_data['Code']
+    return total_loc
+
+class GitObjectReader:
+    """Read blobs through one long-lived `git cat-file --batch` process."""
+
+    def __init__(self, repo_path):
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.lock = threading.Lock()
+
+    def read_blob(self, blob_sha):
+        """Return the raw content of a blob, or None if it is missing."""
+        with self.lock:
+            self.process.stdin.write(f'{blob_sha}\n'.encode())
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().decode().split()
+            if len(header) < 3 or header[1] == 'missing':
+                return None
+            size = int(header[2])
+            data = self.process.stdout.read(size)
+            self.process.stdout.read(1)  # Trailing newline after each object
+            return data
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+def list_tree(repo_path, commit_hash):
+    """Return {path: blob_sha} for every countable file in a commit's tree."""
+    output = subprocess.check_output(
+        ['git', 'ls-tree', '-r', '-z', '--full-tree', commit_hash],
+        cwd=repo_path,
+        stderr=subprocess.DEVNULL
+    )
+
+    blobs = {}
+    for entry in output.decode('utf-8', 'surrogateescape').split('\0'):
+        if not entry:
+            continue
+        meta, path = entry.split('\t', 1)
+        mode, obj_type, obj_sha = meta.split(' ')
+        if obj_type == 'blob' and mode not in SKIPPED_MODES:
+            blobs[path] = obj_sha
+    return blobs
+
+def diff_tree(repo_path, previous_commit_hash, commit_hash):
+    """
+    Return the files that differ between two commits as
+    (path, old_blob_sha, new_blob_sha) tuples. A side that does not hold
+    a countable file is None.
+    """
+    output = subprocess.check_output(
+        ['git', 'diff-tree', '-r', '-z', '--no-renames', '--raw',
+         previous_commit_hash, commit_hash],
+        cwd=repo_path,
+        stderr=subprocess.DEVNULL
+    )
+
+    changes = []
+    fields = output.decode('utf-8', 'surrogateescape').split('\0')
+    for meta, path in zip(fields[0::2], fields[1::2]):
+        if not meta.startswith(':'):
+            continue
+        old_mode, new_mode, old_sha, new_sha, _ = meta[1:].split(' ')
+        old_blob = None if old_mode == '000000' or old_mode in SKIPPED_MODES else old_sha
+        new_blob = None if new_mode == '000000' or new_mode in SKIPPED_MODES else new_sha
+        if old_blob or new_blob:
+            changes.append((path, old_blob, new_blob))
+    return changes
+
+class BlobLocCache:
+    """LOC per (blob SHA, language key), optionally persisted as JSON."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (IOError, ValueError):
+                self.entries = {}
+
+    @staticmethod
+    def key(blob_sha, path):
+        return f'{blob_sha}:{language_key(path)}'
+
+    def get(self, blob_sha, path):
+        """Return (language, code) for a blob, or None if not counted yet."""
+        return self.entries.get(self.key(blob_sha, path))
+
+    def put(self, blob_sha, path, language, code):
+        with self.lock:
+            self.entries[self.key(blob_sha, path)] = [language, code]
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with self.lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+def scc_language_keys(scc_path=SCC_PATH):
+    """Extensions and file names scc assigns a language to, lower case, from `scc --languages`."""
+    keys = set()
+    for line in check_output([scc_path, '--languages'], universal_newlines=True).splitlines():
+        if line.endswith(')') and ' (' in line:
+            keys.update(line[line.rindex(' (') + 2:-1].lower().split(','))
+    return keys
+
+def count_files_scc(files, scc_path=SCC_PATH):
+    """
+    Count files with a single scc run. files is an iterable of (path, data);
+    returns {file index: (language, code)} for the files scc recognised.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='loc_blobs_')
+    try:
+        for index, (path, data) in enumerate(files):
+            if data is None:
+                continue
+            blob_dir = os.path.join(tmp_dir, str(index))
+            os.mkdir(blob_dir)
+            with open(os.path.join(blob_dir, os.path.basename(path)), 'wb') as f:
+                f.write(data)
+
+        scc_output = check_output(
+            [scc_path, '--by-file', '-f', 'json', tmp_dir],
+            universal_newlines=True
+        )
+        scc_data = json.loads(scc_output) or []
+
+        counts = {}
+        for lang_data in scc_data:
+            for file_data in lang_data.get('Files') or []:
+                rel_path = os.path.relpath(file_data['Location'], tmp_dir)
+                index = int(rel_path.split(os.sep)[0])
+                counts[index] = (lang_data['Name'], file_data['Code'])
+        return counts
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def count_blobs_scc(reader, blobs, scc_path=SCC_PATH):
+    """
+    Count blobs with a single scc run. blobs is a list of (path, blob_sha);
+    returns {blob index: (language, code)} for the files scc recognised.
+    """
+    return count_files_scc(((path, reader.read_blob(blob_sha)) for path, blob_sha in blobs), scc_path)
+
+class BlobLocEngine:
+    """
+    Measure LOC of commits straight from the object database. Each blob is
+    counted once per language; a commit's LOC is derived from its parent's
+    LOC plus the blobs that changed between them.
+    """
+
+    def __init__(self, repo_path, cache=None, counter=count_blobs_scc):
+        self.repo_path = repo_path
+        self.cache = cache if cache is not None else BlobLocCache()
+        self.counter = counter
+        self.reader = GitObjectReader(repo_path)
+        self.commit_loc_memo = {}
+
+    def _ensure_counted(self, blobs):
+        """Count every (path, blob_sha) that is not in the cache yet."""
+        missing = []
+        seen = set()
+        for path, blob_sha in blobs:
+            key = self.cache.key(blob_sha, path)
+            if key not in seen and self.cache.get(blob_sha, path) is None:
+                seen.add(key)
+                missing.append((path, blob_sha))
+
+        for start in range(0, len(missing), SCC_BATCH_SIZE):
+            batch = missing[start:start + SCC_BATCH_SIZE]
+            counts = self.counter(self.reader, batch)
+            for index, (path, blob_sha) in enumerate(batch):
+                language, code = counts.get(index, (None, 0))
+                self.cache.put(blob_sha, path, language, code)
+
+    def _blob_loc(self, blob_sha, path):
+        language, code = self.cache.get(blob_sha, path)
+        if language and is_programming_language(language):
+            return code
+        return 0
+
+    def tree_loc(self, commit_hash):
+        """Return the total programming-language LOC of a commit."""
+        if commit_hash not in self.commit_loc_memo:
+            blobs = list(list_tree(self.repo_path, commit_hash).items())
+            self._ensure_counted(blobs)
+            self.commit_loc_memo[commit_hash] = sum(
+                self._blob_loc(blob_sha, path) for path, blob_sha in blobs
+            )
+        return self.commit_loc_memo[commit_hash]
+
+    def commit_loc(self, previous_commit_hash, commit_hash):
+        """Return (loc_before, loc_after) for a commit and its parent."""
+        loc_before = self.tree_loc(previous_commit_hash)
+        if commit_hash in self.commit_loc_memo:
+            return loc_before, self.commit_loc_memo[commit_hash]
+
+        changes = diff_tree(self.repo_path, previous_commit_hash, commit_hash)
+        changed_blobs = []
+        for path, old_blob, new_blob in changes:
+            if old_blob:
+                changed_blobs.append((path, old_blob))
+            if new_blob:
+                changed_blobs.append((path, new_blob))
+        self._ensure_counted(changed_blobs)
+
+        loc_after = loc_before
+        for path, old_blob, new_blob in changes:
+            if old_blob:
+                loc_after -= self._blob_loc(old_blob, path)
+            if new_blob:
+                loc_after += self._blob_loc(new_blob, path)
+
+        self.commit_loc_memo[commit_hash] = loc_after
+        return loc_before, loc_after
+
+    def close(self):
+        self.reader.close()
+        self.cache.save()
+
+def iter_blob_locs(engine, commit_index, commit_timeout=None):
+    """
+    Yield (commit_ref, loc_before, loc_after, error) for every commit, in
+    order; scc runs past commit_timeout seconds end in DeadlineExceeded.
+    """
+    for commit_ref in commit_index:
+        try:
+            with deadline(commit_timeout, 'commit'):
+                loc_before, loc_after = engine.commit_loc(commit_ref.parent, commit_ref.sha)
+        except Exception as e:
+            yield commit_ref, None, None, e
+            continue
+        yield commit_ref, loc_before, loc_after, None
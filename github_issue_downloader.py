@@ -2,15 +2,265 @@ import requests
 import json
 import os
 import time
-from urllib.parse import urlparse
+import argparse
+import hashlib
+import threading
+import collections
+import concurrent.futures
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+from requests.adapters import HTTPAdapter
+from manifest import atomic_write_json
+from result_streams import NdjsonWriter, write_json_array
+
+PER_PAGE = 100
+
+# Attempts per request while GitHub answers that a rate limit is hit
+MAX_ATTEMPTS = 5
+
+# Core API budget per hour assumed for a token GitHub has not reported on yet
+DEFAULT_LIMIT = 5000
+
+# Pause of a token after a secondary rate limit response without Retry-After
+SECONDARY_LIMIT_SECONDS = 60
+
+class RateLimiter:
+    """Paces the requests of all threads: at most requests_per_second are started."""
+
+    def __init__(self, requests_per_second=10):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        """Block until this thread may send its next request."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def token_id(token):
+    """Short fingerprint of a token, safe to log and store."""
+    if not token:
+        return 'anonymous'
+    return hashlib.sha256(token.encode()).hexdigest()[:12]
+
+class Token:
+    """One token's view of its rate limits, from the headers of its last responses."""
+
+    def __init__(self, value):
+        self.value = value
+        self.id = token_id(value)
+        self.remaining = None  # Unknown until the first response
+        self.reset = 0.0  # Epoch seconds at which remaining is refilled
+        self.blocked_until = 0.0  # Epoch seconds; set by secondary rate limits
+
+    def budget(self, now):
+        if self.remaining is None or now >= self.reset:
+            return DEFAULT_LIMIT if self.remaining is None else max(self.remaining, DEFAULT_LIMIT)
+        return self.remaining
+
+    def ready_at(self, now):
+        """When this token may be used again."""
+        ready = self.blocked_until
+        if self.budget(now) <= 0:
+            ready = max(ready, self.reset)
+        return ready
+
+class TokenPool:
+    """
+    Hands each request to the token with the most remaining budget. Every
+    token tracks its own reset time and secondary rate limit back-off, so
+    only when all of them are spent do requests wait.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = [Token(value) for value in tokens] or [Token(None)]
+        self.condition = threading.Condition()
+
+    def acquire(self, prefer=None):
+        """
+        Pick a token for one request, waiting while none is usable. prefer
+        (a token id) is taken if it is usable: GitHub ETags are per token.
+        """
+        with self.condition:
+            while True:
+                now = time.time()
+                usable = [token for token in self.tokens if token.ready_at(now) <= now]
+                if usable:
+                    preferred = [token for token in usable if token.id == prefer]
+                    token = preferred[0] if preferred else max(usable, key=lambda token: token.budget(now))
+                    if token.remaining is not None:
+                        # Spread concurrent requests before their responses report the real budget
+                        token.remaining = token.budget(now) - 1
+                    return token
+                wait = min(token.ready_at(now) for token in self.tokens) - now
+                print(f"All {len(self.tokens)} tokens are rate limited. Sleeping for {wait:.0f} seconds...")
+                self.condition.wait(wait + 1)
+
+    def update(self, token, response):
+        """
+        Record the rate limit headers of token's response. Returns True if
+        the request hit a rate limit and should be retried.
+        """
+        headers = response.headers
+        with self.condition:
+            now = time.time()
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+                token.remaining = int(headers['X-RateLimit-Remaining'])
+                token.reset = int(headers['X-RateLimit-Reset'])
+            if response.status_code not in (403, 429):
+                return False
+            if is_secondary_limit(response):
+                # Secondary rate limit: back off this token only
+                retry_after = int(headers.get('Retry-After', SECONDARY_LIMIT_SECONDS))
+                token.blocked_until = max(token.blocked_until, now + retry_after)
+                print(f"Secondary rate limit on token {token.id}. Pausing it for {retry_after} seconds...")
+            elif headers.get('X-RateLimit-Remaining') != '0':
+                return False  # Permissions, SAML enforcement and the like: not worth a retry
+            self.condition.notify_all()
+            return True
+
+def is_secondary_limit(response):
+    """
+    Whether a 403/429 response is one of GitHub's secondary rate limits:
+    a 429, a Retry-After header or the message saying so. Other 403s
+    without a spent primary limit are permission errors.
+    """
+    if response.status_code == 429 or 'Retry-After' in response.headers:
+        return True
+    try:
+        message = response.json().get('message', '')
+    except ValueError:
+        return False
+    message = message.lower()
+    return 'secondary rate limit' in message or 'abuse' in message
+
+def page_number(url):
+    """The page query parameter of a pagination link."""
+    return int(parse_qs(urlparse(url).query)['page'][0])
+
+class GraphQLError(Exception):
+    """Errors a GraphQL response reported."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(error.get('message', str(error)) for error in errors))
+        self.errors = errors
+
+def too_big(error):
+    """
+    Whether a GraphQL request failed for asking too much at once, so that
+    a smaller one should succeed. GitHub answers queries it cannot finish
+    in time with 502.
+    """
+    if isinstance(error, GraphQLError):
+        return any(
+            e.get('type') == 'MAX_NODE_LIMIT_EXCEEDED' or 'timeout' in e.get('message', '').lower()
+            for e in error.errors
+        )
+    return isinstance(error, requests.exceptions.HTTPError) and error.response.status_code in (502, 504)
+
+# Items of each nested connection fetched with an issue, and per follow-up query
+NESTED_PAGE_SIZE = 100
+
+# Fields of an issue in GraphQL mode
+ISSUE_FIELDS = 'id databaseId number title body state stateReason url createdAt updatedAt closedAt author { login }'
+
+# An issue or pull request another item points at
+REFERENCED_ITEM = (
+    '__typename ... on Issue { number url state repository { nameWithOwner } }'
+    ' ... on PullRequest { number url state merged repository { nameWithOwner } }'
+)
+
+# Connections fetched with every issue: field -> (extra arguments, selection of a node)
+ISSUE_CONNECTIONS = {
+    'labels': ('', 'name'),
+    'comments': ('', 'databaseId author { login } body createdAt updatedAt'),
+    'timelineItems': (
+        'itemTypes: [CROSS_REFERENCED_EVENT, CONNECTED_EVENT, DISCONNECTED_EVENT, MARKED_AS_DUPLICATE_EVENT]',
+        f'''__typename
+    ... on CrossReferencedEvent {{ createdAt willCloseTarget source {{ {REFERENCED_ITEM} }} }}
+    ... on ConnectedEvent {{ createdAt subject {{ {REFERENCED_ITEM} }} }}
+    ... on DisconnectedEvent {{ createdAt subject {{ {REFERENCED_ITEM} }} }}
+    ... on MarkedAsDuplicateEvent {{ createdAt canonical {{ {REFERENCED_ITEM} }} }}'''
+    ),
+}
+
+def connection_selection(field, after=None):
+    arguments, selection = ISSUE_CONNECTIONS[field]
+    arguments = ', '.join(filter(None, [f'first: {NESTED_PAGE_SIZE}', f'after: {after}' if after else '', arguments]))
+    return f'{field}({arguments}) {{ pageInfo {{ hasNextPage endCursor }} nodes {{ {selection} }} }}'
+
+ISSUES_QUERY = f'''query($owner: String!, $name: String!, $pageSize: Int!, $after: String) {{
+  rateLimit {{ cost remaining resetAt }}
+  repository(owner: $owner, name: $name) {{
+    issues(first: $pageSize, after: $after, orderBy: {{field: CREATED_AT, direction: ASC}}) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{ {ISSUE_FIELDS} {' '.join(connection_selection(field) for field in ISSUE_CONNECTIONS)} }}
+    }}
+  }}
+}}'''
+
+def connections_query(fields):
+    """
+    Query for the next items of several issue connections at once: the
+    k-th is fields[k] of the issue $id<k>, after the cursor $after<k>.
+    """
+    variables = ', '.join(f'$id{k}: ID!, $after{k}: String' for k in range(len(fields)))
+    nodes = '\n  '.join(
+        f'i{k}: node(id: $id{k}) {{ ... on Issue {{ {connection_selection(field, f"$after{k}")} }} }}'
+        for k, field in enumerate(fields)
+    )
+    return f'''query({variables}) {{
+  rateLimit {{ cost remaining resetAt }}
+  {nodes}
+}}'''
+
+def items_for_cost(max_cost, requests_per_item, base_requests=0):
+    """
+    Most items (up to 100) a query may fetch for GitHub to price it at no
+    more than max_cost points: it counts one request per connection to
+    fill, divides by 100 and rounds.
+    """
+    items = 100
+    while items > 1 and round((base_requests + items * requests_per_item) / 100) > max(1, max_cost):
+        items -= 1
+    return items
 
 class GitHubIssuesDownloader:
-    def __init__(self, token=None):
-        """Initialize the downloader with optional GitHub token."""
-        self.headers = {}
-        if token:
-            self.headers = {'Authorization': f'token {token}'}
-        self.base_url = "https://api.github.com"
+    def __init__(self, token=None, base_url="https://api.github.com", workers=1, rate_limiter=None,
+                 timeout=60, tokens=None):
+        """
+        Initialize the downloader with an optional GitHub token, or a list of
+        tokens that requests are spread over. Requests share one pooled
+        session; with workers > 1 the pages of a repository are fetched in
+        parallel, and one downloader may serve several threads.
+        """
+        self.headers = {'Accept': 'application/vnd.github+json'}
+        self.token_pool = TokenPool(tokens or ([token] if token else []))
+        self.base_url = base_url.rstrip('/')
+        # GitHub Enterprise serves REST under /api/v3 and GraphQL at /api/graphql
+        if self.base_url.endswith('/v3'):
+            self.graphql_url = self.base_url[:-len('/v3')] + '/graphql'
+        else:
+            self.graphql_url = self.base_url + '/graphql'
+        self.workers = workers
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, workers * 2))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.page_executor = None
+        if workers > 1:
+            self.page_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def close(self):
+        if self.page_executor:
+            self.page_executor.shutdown()
+        self.session.close()
 
     def extract_repo_info(self, github_url):
         """Extract owner and repo name from GitHub URL."""
@@ -19,49 +269,232 @@ class GitHubIssuesDownloader:
             return path_parts[0], path_parts[1]
         return None, None
 
+    def request(self, method, url, etag=None, etag_token=None, **kwargs):
+        """
+        Send a request through the shared session, rate limiter and token
+        pool; retried on another token while one hits a rate limit. With
+        etag the request is conditional, preferably on etag_token that the
+        ETag came from, and may come back as 304 Not Modified, which GitHub
+        does not count. response.token_id names the token used.
+        """
+        for _ in range(MAX_ATTEMPTS):
+            self.rate_limiter.wait()
+            token = self.token_pool.acquire(etag_token if etag else None)
+            headers = dict(self.headers)
+            if token.value:
+                headers['Authorization'] = f'token {token.value}'
+            if etag:
+                headers['If-None-Match'] = etag
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            response.token_id = token.id
+            if not self.token_pool.update(token, response):
+                break
+        response.raise_for_status()
+        return response
+
+    def get(self, url, params=None, etag=None, etag_token=None):
+        return self.request('GET', url, etag, etag_token, params=params)
+
+    def graphql(self, query, variables):
+        """
+        Run a GraphQL query and return its data. Raises GraphQLError with
+        the errors GitHub reports, even if part of the data came back.
+        """
+        result = self.request('POST', self.graphql_url, json={'query': query, 'variables': variables}).json()
+        if result.get('errors'):
+            raise GraphQLError(result['errors'])
+        return result['data']
+
     def get_all_issues(self, owner, repo):
         """Download all issues for a repository including closed ones."""
+        url = f"{self.base_url}/repos/{owner}/{repo}/issues"
+        params = {'state': 'all', 'per_page': PER_PAGE}
         issues = []
-        page = 1
-        per_page = 100
+        seen = set()
+        try:
+            for _, batch, _ in self.iter_pages(url, params):
+                # Issues opened during the download shift later pages and repeat a few entries
+                for issue in batch:
+                    if issue['id'] not in seen:
+                        seen.add(issue['id'])
+                        issues.append(issue)
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading issues for {owner}/{repo}: {str(e)}")
+            return None
+        return issues
 
-        while True:
-            url = f"{self.base_url}/repos/{owner}/{repo}/issues"
-            params = {
-                'state': 'all',
-                'per_page': per_page,
-                'page': page
-            }
+    def iter_pages(self, url, params, first_page=1, etag=None):
+        """
+        Yield (page number, issues, response) for every page from first_page
+        on, in order. When the Link header tells the last page, up to two
+        pages per worker are fetched ahead in parallel. With etag, a (token
+        id, ETag) pair, the first page is conditional; if it is not
+        modified, (first_page, None, response) is the only item.
+        """
+        def fetch(page, etag=(None, None)):
+            return self.get(url, dict(params, page=page), etag[1], etag[0])
 
-            try:
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
+        response = fetch(first_page, etag or (None, None))
+        if response.status_code == 304:
+            yield first_page, None, response
+            return
+        batch = response.json()
+        yield first_page, batch, response
 
+        if 'last' not in response.links:
+            page = first_page
+            while len(batch) == params['per_page']:
+                page += 1
+                response = fetch(page)
                 batch = response.json()
-                if not batch:
-                    break
+                yield page, batch, response
+            return
 
-                issues.extend(batch)
-                page += 1
+        pages = iter(range(first_page + 1, page_number(response.links['last']['url']) + 1))
+        if not self.page_executor:
+            for page in pages:
+                response = fetch(page)
+                yield page, response.json(), response
+            return
 
-                # Handle GitHub API rate limiting
-                if 'X-RateLimit-Remaining' in response.headers:
-                    remaining = int(response.headers['X-RateLimit-Remaining'])
-                    if remaining <= 1:
-                        reset_time = int(response.headers['X-RateLimit-Reset'])
-                        sleep_time = reset_time - time.time() + 1
-                        if sleep_time > 0:
-                            print(f"Rate limit reached. Sleeping for {sleep_time:.0f} seconds...")
-                            time.sleep(sleep_time)
+        # A bounded window keeps pages in order and memory flat
+        in_flight = collections.deque()
+        for page in pages:
+            in_flight.append((page, self.page_executor.submit(fetch, page)))
+            if len(in_flight) >= self.workers * 2:
+                page, future = in_flight.popleft()
+                response = future.result()
+                yield page, response.json(), response
+        while in_flight:
+            page, future = in_flight.popleft()
+            response = future.result()
+            yield page, response.json(), response
 
-            except requests.exceptions.RequestException as e:
-                print(f"Error downloading issues for {owner}/{repo}: {str(e)}")
-                return None
+    def issues_path(self, owner, repo, output_dir="issues"):
+        return os.path.join(output_dir, f"{owner}_{repo}_issues.json")
 
-            # Small delay to be nice to GitHub's API
-            time.sleep(0.5)
+    def ndjson_path(self, owner, repo, output_dir="issues"):
+        return os.path.join(output_dir, f"{owner}_{repo}_issues.ndjson")
 
-        return issues
+    def sync_path(self, owner, repo, output_dir="issues"):
+        return os.path.join(output_dir, f"{owner}_{repo}_sync.json")
+
+    def sync_issues(self, owner, repo, output_dir="issues", full=False, legacy_json=False):
+        """
+        Bring <owner>_<repo>_issues.ndjson up to date. The first run (or
+        full=True) downloads everything, oldest issue first, appending pages
+        as they arrive and resuming an interrupted download at its last
+        page. Later runs only ask for issues updated since the last sync,
+        conditionally on the ETag of the last such request, and merge the
+        changes into the file. With legacy_json the indented JSON array is
+        written as well. Returns (number of issues saved, number changed),
+        or None after an error.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        ndjson_file = self.ndjson_path(owner, repo, output_dir)
+        sync_file = self.sync_path(owner, repo, output_dir)
+        state = {}
+        if not full and os.path.exists(sync_file):
+            with open(sync_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+
+        # A state without since (e.g. null from older versions) counts as never synced
+        if state.get('since') and 'cursor' not in state and os.path.exists(ndjson_file):
+            result = self.download_changes(owner, repo, ndjson_file, sync_file, state)
+        else:
+            result = self.download_all(owner, repo, ndjson_file, sync_file, state.get('cursor'))
+
+        if result is not None and legacy_json:
+            write_json_array(iter_ndjson_reversed(ndjson_file), self.issues_path(owner, repo, output_dir))
+        return result
+
+    def download_all(self, owner, repo, ndjson_file, sync_file, cursor=None):
+        """
+        Stream every issue into ndjson_file, checkpointing a cursor after
+        each page. Oldest first, so issues opened meanwhile only add pages
+        at the end and a resumed download sees the same earlier pages. The
+        next run asks for the changes since the download began: issues
+        updated on pages already fetched, or opened after the last page was
+        known, are missing from it. The cursor keeps that start time, so a
+        resumed download counts from its first attempt.
+        """
+        url = f"{self.base_url}/repos/{owner}/{repo}/issues"
+        params = {'state': 'all', 'per_page': PER_PAGE, 'sort': 'created', 'direction': 'asc'}
+        partial_file = f'{ndjson_file}.partial'
+        # Cursors of older versions do not say when their download began, so it starts over
+        if cursor and (not os.path.exists(partial_file) or 'started' not in cursor):
+            cursor = None
+        if cursor:
+            print(f"Resuming {owner}/{repo} after page {cursor['page']}")
+        count = cursor['issues'] if cursor else 0
+        started = cursor['started'] if cursor else None
+
+        try:
+            with NdjsonWriter(partial_file, resume_offset=cursor['offset'] if cursor else None) as writer:
+                for page, batch, response in self.iter_pages(url, params, cursor['page'] + 1 if cursor else 1):
+                    if started is None:
+                        started = server_time(response)
+                    if not batch:
+                        continue
+                    for issue in batch:
+                        writer.write(issue)
+                    count += len(batch)
+                    os.fsync(writer.file.fileno())
+                    atomic_write_json(sync_file, {'cursor': {
+                        'page': page, 'offset': writer.file.tell(), 'issues': count, 'started': started
+                    }})
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading issues for {owner}/{repo}: {str(e)}")
+            return None
+
+        os.replace(partial_file, ndjson_file)
+        # Never the newest updated_at fetched: changes made during the download are older than that
+        self.save_sync_state(sync_file, started, None, count)
+        return count, count
+
+    def download_changes(self, owner, repo, ndjson_file, sync_file, state):
+        """
+        Fetch the issues updated since state['since'], most recently updated
+        first so every change shows on the first page, and merge them into
+        ndjson_file. Only the changes are held in memory.
+        """
+        url = f"{self.base_url}/repos/{owner}/{repo}/issues"
+        since = state['since']
+        params = {'state': 'all', 'per_page': PER_PAGE, 'since': since, 'sort': 'updated', 'direction': 'desc'}
+        # Stored as [token id, ETag]; a bare ETag from older runs is ignored
+        stored_etag = tuple(state['etag']) if isinstance(state.get('etag'), list) else None
+
+        changed = {}
+        etag = stored_etag
+        try:
+            for page, batch, response in self.iter_pages(url, params, 1, stored_etag):
+                if batch is None:
+                    break  # 304 Not Modified
+                if page == 1:
+                    etag = (response.token_id, response.headers.get('ETag'))
+                for issue in batch:
+                    changed.setdefault(issue['id'], issue)
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading issues for {owner}/{repo}: {str(e)}")
+            return None
+
+        # since is inclusive, so the issues updated at that very second come back every time
+        if not any(issue['updated_at'] > since for issue in changed.values()):
+            # Keep asking the same question, so the stored ETag keeps matching
+            if etag != stored_etag:
+                self.save_sync_state(sync_file, since, etag, state['issues'])
+            return state['issues'], 0
+
+        newest = newest_update(changed.values())
+        updated = sum(1 for issue in changed.values() if issue['updated_at'] > since)
+        count = merge_issues(ndjson_file, changed)
+        self.save_sync_state(sync_file, newest, None, count)
+        return count, updated
+
+    def save_sync_state(self, sync_file, since, etag, issue_count):
+        atomic_write_json(sync_file, {
+            'since': since, 'etag': etag, 'issues': issue_count, 'synced_at': time.time()
+        })
 
     def save_issues(self, issues, owner, repo, output_dir="issues"):
         """Save issues to a JSON file."""
@@ -69,7 +502,7 @@ class GitHubIssuesDownloader:
             return False
 
         os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.join(output_dir, f"{owner}_{repo}_issues.json")
+        filename = self.issues_path(owner, repo, output_dir)
 
         try:
             with open(filename, 'w', encoding='utf-8') as f:
@@ -79,39 +512,248 @@ class GitHubIssuesDownloader:
             print(f"Error saving issues for {owner}/{repo}: {str(e)}")
             return False
 
+    def context_path(self, owner, repo, output_dir="issues"):
+        return os.path.join(output_dir, f"{owner}_{repo}_issue_context.ndjson")
+
+    def download_context(self, owner, repo, output_dir="issues", max_cost=1, full=False):
+        """
+        Stream every issue with its labels, comments and cross-references
+        (timeline events linking other issues and pull requests) into
+        <owner>_<repo>_issue_context.ndjson through the GraphQL API, oldest
+        first. Pages are sized to cost at most max_cost rate limit points
+        and halved when GitHub gives up on one; issues with more nested
+        items than fit in a page get follow-up queries. An interrupted
+        download resumes after its last page unless full is set. Returns
+        (issues saved, queries, points spent), or None after an error.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        context_file = self.context_path(owner, repo, output_dir)
+        partial_file = f'{context_file}.partial'
+        state_file = os.path.join(output_dir, f"{owner}_{repo}_context_sync.json")
+        cursor = None
+        if not full and os.path.exists(state_file) and os.path.exists(partial_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                cursor = json.load(f).get('cursor')
+        if cursor:
+            print(f"Resuming {owner}/{repo} after {cursor['issues']} issues")
+        else:
+            cursor = {'after': None, 'offset': None, 'issues': 0, 'queries': 0, 'cost': 0}
+        # The page of issues plus one connection per issue and nested field
+        page_size = items_for_cost(max_cost, len(ISSUE_CONNECTIONS), 1)
+        batch_size = items_for_cost(max_cost, 1)
+
+        try:
+            with NdjsonWriter(partial_file, resume_offset=cursor['offset']) as writer:
+                while True:
+                    variables = {'owner': owner, 'name': repo, 'pageSize': page_size, 'after': cursor['after']}
+                    try:
+                        data = self.graphql(ISSUES_QUERY, variables)
+                    except (GraphQLError, requests.exceptions.HTTPError) as e:
+                        if not too_big(e) or page_size == 1:
+                            raise
+                        page_size //= 2
+                        print(f"GraphQL page too large for {owner}/{repo}; retrying with {page_size} issues")
+                        continue
+                    cursor['queries'] += 1
+                    cursor['cost'] += data['rateLimit']['cost']
+                    issues = data['repository']['issues']
+                    self.complete_issues(issues['nodes'], batch_size, cursor)
+                    for issue in issues['nodes']:
+                        writer.write(issue)
+                    cursor['issues'] += len(issues['nodes'])
+                    cursor['after'] = issues['pageInfo']['endCursor']
+                    os.fsync(writer.file.fileno())
+                    cursor['offset'] = writer.file.tell()
+                    atomic_write_json(state_file, {'cursor': cursor})
+                    if not issues['pageInfo']['hasNextPage']:
+                        break
+        except (requests.exceptions.RequestException, GraphQLError) as e:
+            print(f"Error downloading issue context for {owner}/{repo}: {str(e)}")
+            return None
+
+        os.replace(partial_file, context_file)
+        remaining = data['rateLimit']['remaining']
+        atomic_write_json(state_file, {
+            'issues': cursor['issues'], 'queries': cursor['queries'], 'cost': cursor['cost'],
+            'remaining': remaining, 'synced_at': time.time()
+        })
+        print(f"{owner}/{repo}: {cursor['queries']} GraphQL queries cost {cursor['cost']} points "
+              f"({remaining} left on the token)")
+        return cursor['issues'], cursor['queries'], cursor['cost']
+
+    def complete_issues(self, issues, batch_size, totals):
+        """
+        Replace the connections of issues by lists of all their nodes. The
+        items past the first page are fetched batch_size connections per
+        query; the queries and their cost are added to totals.
+        """
+        pending = []
+        for issue in issues:
+            for field in ISSUE_CONNECTIONS:
+                connection = issue[field]
+                issue[field] = connection['nodes']
+                if connection['pageInfo']['hasNextPage']:
+                    pending.append((issue, field, connection['pageInfo']['endCursor']))
+
+        while pending:
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            variables = {}
+            for k, (issue, _, after) in enumerate(batch):
+                variables[f'id{k}'] = issue['id']
+                variables[f'after{k}'] = after
+            try:
+                data = self.graphql(connections_query([field for _, field, _ in batch]), variables)
+            except (GraphQLError, requests.exceptions.HTTPError) as e:
+                if not too_big(e) or batch_size == 1:
+                    raise
+                batch_size //= 2
+                pending = batch + pending
+                continue
+            totals['queries'] += 1
+            totals['cost'] += data['rateLimit']['cost']
+            for k, (issue, field, _) in enumerate(batch):
+                connection = data[f'i{k}'][field]
+                issue[field].extend(connection['nodes'])
+                if connection['pageInfo']['hasNextPage']:
+                    pending.append((issue, field, connection['pageInfo']['endCursor']))
+
+def server_time(response):
+    """GitHub's clock when it answered, from the Date header, as an ISO 8601 timestamp."""
+    try:
+        answered = parsedate_to_datetime(response.headers['Date']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        answered = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(answered))
+
+def newest_update(issues):
+    """Latest updated_at of issues (ISO 8601 strings sort by time), or None."""
+    return max((issue['updated_at'] for issue in issues), default=None)
+
+def merge_issues(ndjson_file, changed):
+    """
+    Rewrite ndjson_file with the issues of changed ({id: issue}) replacing
+    their old lines and new ones appended, oldest first. Returns the number
+    of issues in the file.
+    """
+    changed = dict(changed)
+    count = 0
+    tmp_file = f'{ndjson_file}.tmp'
+    with open(ndjson_file, 'r', encoding='utf-8') as source, NdjsonWriter(tmp_file) as writer:
+        for line in source:
+            if not line.strip():
+                continue
+            issue_id = json.loads(line)['id']
+            if issue_id in changed:
+                writer.write(changed.pop(issue_id))
+            else:
+                writer.file.write(line)
+            count += 1
+        for issue in sorted(changed.values(), key=lambda issue: issue['number']):
+            writer.write(issue)
+            count += 1
+        writer.file.flush()
+        os.fsync(writer.file.fileno())
+    os.replace(tmp_file, ndjson_file)
+    return count
+
+def iter_ndjson_reversed(path, block_size=1 << 16):
+    """Records of an NDJSON file from the last line to the first, reading it backwards in blocks."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        rest = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + rest).split(b'\n')
+            rest = lines.pop(0)  # May continue in the previous block
+            for line in reversed(lines):
+                if line.strip():
+                    yield json.loads(line)
+        if rest.strip():
+            yield json.loads(rest)
+
+def download_repository(downloader, url, output_dir, full=False, legacy_json=False, graphql=False, max_query_cost=1):
+    owner, repo = downloader.extract_repo_info(url)
+    if not owner or not repo:
+        print(f"Invalid GitHub URL: {url}")
+        return
+
+    print(f"Downloading issues for {owner}/{repo}...")
+    if graphql:
+        result = downloader.download_context(owner, repo, output_dir, max_query_cost, full)
+    else:
+        result = downloader.sync_issues(owner, repo, output_dir, full, legacy_json)
+
+    if result is None:
+        print(f"Failed to save issues for {owner}/{repo}")
+    elif graphql:
+        print(f"Successfully saved {result[0]} issues with their comments, labels and cross-references for {owner}/{repo}")
+    else:
+        total, changed = result
+        print(f"Successfully saved {total} issues for {owner}/{repo} ({changed} new or changed)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Download all issues of the repositories in urls.txt.')
+    parser.add_argument('--token', action='append', default=[],
+                        help='GitHub token (repeatable; default: the comma-separated $GITHUB_TOKENS or '
+                             '$GITHUB_TOKEN); requests go to the token with the most budget left')
+    parser.add_argument('--urls', default='urls.txt', help='file with one repository URL per line')
+    parser.add_argument('--output-dir', default='github_issues')
+    parser.add_argument('--api-url', default='https://api.github.com', help='GitHub API root')
+    parser.add_argument('--workers', type=int, default=4, help='pages fetched in parallel')
+    parser.add_argument('--repo-workers', type=int, default=2, help='repositories downloaded in parallel')
+    parser.add_argument('--full', action='store_true',
+                        help='download every issue again instead of only those changed since the last run')
+    parser.add_argument('--legacy-json', action='store_true',
+                        help='also write <owner>_<repo>_issues.json, the indented JSON array of earlier versions')
+    parser.add_argument('--graphql', action='store_true',
+                        help='download issues with their comments, labels and cross-references through the '
+                             'GraphQL API into <owner>_<repo>_issue_context.ndjson')
+    parser.add_argument('--max-query-cost', type=int, default=1,
+                        help='rate limit points a GraphQL page may cost; sets the issues per page (default 1)')
+    parser.add_argument('--requests-per-second', type=float, default=None,
+                        help='most requests started per second, over all threads (default: 10 per token)')
+    args = parser.parse_args()
+    if not args.token:
+        tokens = os.getenv('GITHUB_TOKENS') or os.getenv('GITHUB_TOKEN') or ''
+        args.token = [token.strip() for token in tokens.split(',') if token.strip()]
+    if args.requests_per_second is None:
+        args.requests_per_second = 10 * max(1, len(args.token))
+    return args
+
 def main():
+    args = parse_args()
+
     # Create output directory
-    output_dir = "github_issues"
+    output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
 
     # Initialize downloader
-    # If you have a GitHub token, pass it to the constructor
-    token = "ADD YOUR TOKEN HERE"
-    downloader = GitHubIssuesDownloader(token)
+    downloader = GitHubIssuesDownloader(
+        None, args.api_url, args.workers, RateLimiter(args.requests_per_second), tokens=args.token
+    )
 
     # Read URLs from file
     try:
-        with open('urls.txt', 'r') as f:
+        with open(args.urls, 'r') as f:
             urls = [line.strip() for line in f if line.strip()]
     except IOError as e:
-        print(f"Error reading urls.txt: {str(e)}")
+        print(f"Error reading {args.urls}: {str(e)}")
         return
 
-    # Process each repository
-    for url in urls:
-        owner, repo = downloader.extract_repo_info(url)
-        if not owner or not repo:
-            print(f"Invalid GitHub URL: {url}")
-            continue
-
-        print(f"Downloading issues for {owner}/{repo}...")
-        issues = downloader.get_all_issues(owner, repo)
-
-        if issues is not None:
-            if downloader.save_issues(issues, owner, repo, output_dir):
-                print(f"Successfully saved {len(issues)} issues for {owner}/{repo}")
-            else:
-                print(f"Failed to save issues for {owner}/{repo}")
+    # Process the repositories, a few at a time
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.repo_workers) as executor:
+            futures = [
+                executor.submit(download_repository, downloader, url, output_dir, args.full, args.legacy_json,
+                                args.graphql, args.max_query_cost)
+                for url in urls
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        downloader.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,309 @@
+"""
+Bulk Jira issue export through the REST API, used by jirascraper.py.
+
+One /rest/api/2/search request returns a page of issues together with their
+changelog, rendered comments and issue links, where the Selenium scraper
+loads and clicks through a web page per issue. Records have the layout of
+jirascraper.scrape_issue(), so either backend feeds the same analysis.
+"""
+import os
+import re
+import time
+import requests
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+from result_streams import write_json_array
+
+# Fields requested for every issue of a search page
+SEARCH_FIELDS = [
+    'summary', 'status', 'resolution', 'description', 'issuelinks', 'comment', 'issuetype', 'priority', 'created'
+]
+
+# Issues asked for per search request; Jira may cap it lower and pages follow what it returns
+PAGE_SIZE = 100
+
+# Attempts per request while Jira answers 429 or a 5xx error
+MAX_ATTEMPTS = 5
+
+# Pause after a 429 or 5xx response without Retry-After
+RETRY_SECONDS = 10
+
+# What the Selenium scraper records for an element missing from the page
+NOT_FOUND = "Not found"
+
+# Elements after which rendered HTML continues on a new line
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'pre', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol'}
+
+class HtmlText(HTMLParser):
+    """Collects the visible text of rendered HTML, one line per block element."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+def html_to_text(markup):
+    """Text of rendered Jira HTML, close to what a browser shows (WebElement.text)."""
+    if not markup:
+        return ''
+    parser = HtmlText()
+    parser.feed(markup)
+    parser.close()
+    lines = (re.sub(r'[ \t\r\f\v]+', ' ', line).strip() for line in ''.join(parser.parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def jira_base_url(url):
+    """Root of the Jira instance an issue URL belongs to, e.g. https://issues.apache.org/jira."""
+    match = re.match(r'(.*?)/(?:browse|projects)/', url)
+    return match.group(1) if match else None
+
+def retry_after(value):
+    """Seconds a Retry-After header asks to wait; it holds either seconds or an HTTP date."""
+    if not value:
+        return RETRY_SECONDS
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0, int(parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return RETRY_SECONDS
+
+class JiraRestClient:
+    """
+    Jira REST API over one pooled session. Requests are retried after 429
+    and 5xx responses, waiting as long as Retry-After asks.
+    """
+
+    def __init__(self, base_url, token=None, timeout=60, page_size=PAGE_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=4))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=4))
+        self.session.headers['Accept'] = 'application/json'
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        self.requests = 0
+
+    def close(self):
+        self.session.close()
+
+    def get(self, path, params=None):
+        url = f"{self.base_url}/rest/api/2/{path}"
+        for attempt in range(MAX_ATTEMPTS):
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            self.requests += 1
+            if response.status_code != 429 and response.status_code < 500 or attempt == MAX_ATTEMPTS - 1:
+                break
+            wait = retry_after(response.headers.get('Retry-After'))
+            print(f"Jira answered {response.status_code} for {path}. Retrying in {wait} seconds...")
+            time.sleep(wait)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_issues(self, jql):
+        """Yield every issue jql matches with its changelog, comments and links complete."""
+        start_at = 0
+        while True:
+            page = self.get('search', {
+                'jql': jql,
+                'startAt': start_at,
+                'maxResults': self.page_size,
+                'fields': ','.join(SEARCH_FIELDS),
+                'expand': 'changelog,renderedFields'
+            })
+            for issue in page['issues']:
+                self.complete(issue)
+                yield issue
+            start_at += len(page['issues'])
+            if not page['issues'] or start_at >= page['total']:
+                return
+
+    def complete(self, issue):
+        """
+        Fetch the comments and changelog entries a search page leaves out;
+        it returns a limited number of each per issue. Adds
+        issue['rendered_comments'], the comments paired with their HTML.
+        """
+        comment = issue['fields'].get('comment') or {'comments': [], 'total': 0}
+        rendered = (issue.get('renderedFields') or {}).get('comment') or {'comments': []}
+        comments = list(zip(comment['comments'], rendered['comments']))
+        if len(comments) < len(comment['comments']) or comment.get('total', 0) > len(comments):
+            comments = []
+            while True:
+                page = self.get(f"issue/{issue['key']}/comment", {
+                    'startAt': len(comments), 'maxResults': self.page_size, 'expand': 'renderedBody'
+                })
+                comments.extend((entry, {'body': entry.get('renderedBody', '')}) for entry in page['comments'])
+                if not page['comments'] or len(comments) >= page['total']:
+                    break
+        issue['rendered_comments'] = comments
+
+        changelog = issue.get('changelog') or {'histories': [], 'total': 0}
+        if changelog.get('total', 0) > len(changelog['histories']):
+            issue['changelog'] = self.get(f"issue/{issue['key']}", {'fields': 'summary', 'expand': 'changelog'})['changelog']
+
+    def remote_links(self, key):
+        return self.get(f"issue/{key}/remotelink")
+
+def named(field, key='name'):
+    return field.get(key) if field else None
+
+def issue_link(base_url, link):
+    """One entry of linking_module['links'] from an issuelinks item."""
+    linked = link.get('outwardIssue') or link.get('inwardIssue')
+    fields = linked.get('fields', {})
+    link_data = {
+        "relation": link['type']['outward' if 'outwardIssue' in link else 'inward'],
+        "key": linked['key'],
+        "url": f"{base_url}/browse/{linked['key']}",
+        "summary": fields.get('summary', '')
+    }
+    if fields.get('issuetype'):
+        link_data["issue_type"] = {"title": fields['issuetype']['name'], "icon_url": fields['issuetype'].get('iconUrl')}
+    if fields.get('priority'):
+        link_data["priority"] = {"title": fields['priority']['name'], "icon_url": fields['priority'].get('iconUrl')}
+    if fields.get('status'):
+        link_data["status"] = {"text": fields['status']['name'], "tooltip": fields['status'].get('description', '')}
+    return link_data
+
+def remote_link(remote):
+    """One entry of linking_module['links_to'] or ['mentioned_in'] from a remote link."""
+    link_object = remote.get('object', {})
+    icon = link_object.get('icon', {})
+    return {
+        "remote_link_id": str(remote['id']),
+        "requires_async": False,
+        "favicon": {"url": icon.get('url16x16'), "title": icon.get('title'), "alt": icon.get('title')},
+        "title": link_object.get('title'),
+        "url": link_object.get('url'),
+        "text": link_object.get('title'),
+        "summary": link_object.get('summary') or ""
+    }
+
+def linking_module(base_url, issue, remote_links=()):
+    """The linking_module of an issue, or None when it links to nothing (no module on the page)."""
+    links = [issue_link(base_url, link) for link in issue['fields'].get('issuelinks') or []]
+    if not links and not remote_links:
+        return None
+    linking_data = {"content": "", "links": links, "links_to": [], "mentioned_in": []}
+    for remote in remote_links:
+        section = "mentioned_in" if remote.get('relationship') == 'mentioned in' else "links_to"
+        linking_data[section].append(remote_link(remote))
+
+    # The module's text: links grouped under their relation, then the remote links
+    lines = []
+    for relation in dict.fromkeys(link['relation'] for link in links):
+        lines.append(relation)
+        for link in links:
+            if link['relation'] == relation:
+                lines.append(f"{link['key']} {link['summary']}")
+                if 'status' in link:
+                    lines.append(link['status']['text'])
+    for title, section in (("links to", "links_to"), ("mentioned in", "mentioned_in")):
+        if linking_data[section]:
+            lines.append(title)
+            lines.extend(link['title'] or '' for link in linking_data[section])
+    linking_data["content"] = '\n'.join(lines)
+    return linking_data
+
+def author_name(entry):
+    return named(entry.get('author') or entry.get('updateAuthor'), 'displayName') or 'Anonymous'
+
+def issue_actions(issue):
+    """Entries of the All tab: comments and change history, oldest first, with the page's element ids."""
+    actions = []
+    for comment, rendered in issue['rendered_comments']:
+        actions.append((comment['created'], {
+            "type": f"comment-{comment['id']}",
+            "content": f"{author_name(comment)} added a comment - {comment['created']}\n"
+                       f"{html_to_text(rendered.get('body'))}"
+        }))
+    for history in (issue.get('changelog') or {}).get('histories', []):
+        changes = '\n'.join(
+            f"{item['field']}\t{item.get('fromString') or ''}\t{item.get('toString') or ''}" for item in history['items']
+        )
+        actions.append((history['created'], {
+            "type": f"changehistory-{history['id']}",
+            "content": f"{author_name(history)} made changes - {history['created']}\n"
+                       f"Field\tOriginal Value\tNew Value\n{changes}"
+        }))
+    actions.sort(key=lambda action: action[0])
+    return [action for _, action in actions]
+
+def issue_record(base_url, issue, remote_links=()):
+    """
+    The record scrape_issue() would produce for issue, a search result
+    completed by JiraRestClient.complete(). Text is taken from the rendered
+    HTML where the page shows rendered HTML. Dates are Jira's ISO 8601
+    timestamps: the comment endpoint does not render them, and one format
+    keeps inline and re-fetched comments alike. The page-wide text blobs
+    (mod_content, issue_panel_wrapper) have no REST equivalent and are left
+    out.
+    """
+    fields = issue['fields']
+    rendered = issue.get('renderedFields') or {}
+    description = html_to_text(rendered.get('description')) or fields.get('description')
+    issue_data = {
+        "url": f"{base_url}/browse/{issue['key']}",
+        "issue_key": issue['key'],
+        "summary": fields.get('summary') or NOT_FOUND,
+        "status": named(fields.get('status')) or NOT_FOUND,
+        "resolution": named(fields.get('resolution')) or "Unresolved",
+        "description": description or NOT_FOUND
+    }
+    linking_data = linking_module(base_url, issue, remote_links)
+    if linking_data is not None:
+        issue_data["linking_module"] = linking_data
+    issue_data["issue_actions"] = issue_actions(issue)
+    issue_data["comments"] = [
+        {
+            "author": author_name(comment),
+            "date": comment['created'],
+            "content": html_to_text(rendered_comment.get('body'))
+        }
+        for comment, rendered_comment in issue['rendered_comments']
+    ]
+    return issue_data
+
+def export_project(base_url, project, start_number, path, token=None, remote_links=False):
+    """
+    Write the records of project's issues numbered start_number and below,
+    highest first like the Selenium scraper, to the JSON file at path.
+    Remote links (links_to, mentioned_in) take one more request per issue
+    and are only fetched with remote_links. Returns (issues, requests made).
+    """
+    client = JiraRestClient(base_url, token)
+    jql = f'project = "{project}" AND issuekey <= {project}-{start_number} ORDER BY issuekey DESC'
+    count = 0
+
+    def records():
+        nonlocal count
+        for issue in client.iter_issues(jql):
+            remote = client.remote_links(issue['key']) if remote_links else ()
+            count += 1
+            if count % 1000 == 0:
+                print(f"Process {os.getpid()} exported {count} issues of {project}")
+            yield issue_record(client.base_url, issue, remote)
+
+    tmp_path = f'{path}.tmp'
+    try:
+        write_json_array(records(), tmp_path, indent=4)
+        os.replace(tmp_path, path)
+    finally:
+        client.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count, client.requests
@@ -1,17 +1,25 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, StaleElementReferenceException
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException, StaleElementReferenceException
+except ImportError:  # Only the Selenium fallback needs it
+    webdriver = None
 import time
 import json
 import re
+import argparse
+import functools
 import multiprocessing
 from multiprocessing import Pool
 import os
+from jira_rest import export_project, jira_base_url
 
 def setup_driver():
+    if webdriver is None:
+        raise RuntimeError("the Selenium backend needs selenium (pip install selenium)")
     driver_path = '/usr/bin/chromedriver'
     service = Service(driver_path)
     driver = webdriver.Chrome(service=service)
@@ -380,17 +388,63 @@ def scrape_project(start_url):
         if driver:
             driver.quit()
 
+def export_project_rest(start_url, remote_links=False):
+    """
+    Save the same project_data file as scrape_project() from Jira's REST
+    search API, a page of issues per request. Raises when the API is
+    unavailable or answers with something unexpected.
+    """
+    print(f"Process {os.getpid()} exporting {start_url} through the REST API")
+    project, _, start_number = get_project_info(start_url)
+    base_url = jira_base_url(start_url)
+    if not project or not start_number or not base_url:
+        print(f"Invalid URL format: {start_url}")
+        return None
+
+    os.makedirs('project_data', exist_ok=True)
+    filename = os.path.join('project_data', f"{project}_issues_data.json")
+    count, request_count = export_project(base_url, project, start_number, filename,
+                                          os.getenv('JIRA_TOKEN'), remote_links)
+    print(f"Process {os.getpid()} exported {count} issues of {project} in {request_count} requests")
+    return project
+
+def collect_project(start_url, backend='auto', remote_links=False):
+    """Export a project with the chosen backend; 'auto' falls back to Selenium if the REST API fails."""
+    if backend != 'selenium':
+        try:
+            return export_project_rest(start_url, remote_links)
+        except Exception as e:
+            # Like scrape_project(), one failed project must not lose the others' results
+            if backend == 'rest':
+                print(f"Process {os.getpid()} could not export {start_url}: {type(e).__name__}: {e}")
+                return None
+            print(f"REST API failed for {start_url} ({type(e).__name__}: {e}); falling back to Selenium")
+    return scrape_project(start_url)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Collect the Jira issues of the projects in jira_urls.txt.')
+    parser.add_argument('--urls', default='jira_urls.txt',
+                        help='file with one issue URL per project; issues from that number down are collected')
+    parser.add_argument('--backend', choices=['auto', 'rest', 'selenium'], default='auto',
+                        help='rest uses the search API, selenium scrapes every issue page; '
+                             'auto uses the API and falls back to Selenium (default)')
+    parser.add_argument('--remote-links', action='store_true',
+                        help='also fetch the "links to" and "mentioned in" remote links over REST, one request per issue')
+    parser.add_argument('--processes', type=int, default=None, help='projects collected at once (default: CPU cores)')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     try:
         # Create project_data directory if it doesn't exist
         os.makedirs('project_data', exist_ok=True)
 
         # Read URLs from file
-        with open('jira_urls.txt', 'r') as file:
+        with open(args.urls, 'r') as file:
             start_urls = [line.strip() for line in file if line.strip()]
 
         if not start_urls:
-            print("No URLs found in jira_urls.txt")
+            print(f"No URLs found in {args.urls}")
             return
 
         # Get the number of CPU cores
@@ -398,13 +452,14 @@ def main():
         print(f"Found {num_cores} CPU cores")
 
         # Use the minimum of number of URLs and CPU cores
-        num_processes = min(len(start_urls), num_cores)
+        num_processes = min(len(start_urls), args.processes or num_cores)
         print(f"Using {num_processes} processes")
 
         # Create a pool of workers
         with Pool(processes=num_processes) as pool:
             # Map the URLs to the pool of workers
-            completed_projects = pool.map(scrape_project, start_urls)
+            collect = functools.partial(collect_project, backend=args.backend, remote_links=args.remote_links)
+            completed_projects = pool.map(collect, start_urls)
 
         # Print summary
         print("\nScraping Summary:")
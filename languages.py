@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+# Set of programming languages to consider
+PROGRAMMING_LANGUAGES = {
+    "FoxPro", "1C:Enterprise", "4th Dimension", "ABAP", "ABC", "ActionScript", "Ada", "Agilent VEE",
+    "Algol", "Alice", "Angelscript", "Apex", "APL", "Applescript", "Arc", "AspectJ", "Assembly",
+    "ATLAS", "AutoHotkey", "AutoIt", "AutoLISP", "Automator", "Avenue", "Awk", "B4X", "Ballerina",
+    "Bash", "Basic", "BBC BASIC", "bc", "BCPL", "BETA", "BlitzMax", "Boo", "Bourne shell", "Brainfuck",
+    "C shell", "C#", "C++", "C++/CLI", "C-Omega", "C", "Caml", "Carbon", "Ceylon", "CFML", "cg", "Ch",
+    "Chapel", "CHILL", "CIL", "Citrine", "CL", "Clarion", "Clean", "Clipper", "CLIPS", "Clojure", "CLU",
+    "COBOL", "Cobra", "CoffeeScript", "COMAL", "Common Lisp", "CORAL 66", "Crystal", "cT", "Curl", "D",
+    "Dart", "DCL", "Delphi", "DiBOL", "Dylan", "E", "ECMAScript", "EGL", "Eiffel", "Elixir", "Elm",
+    "Emacs Lisp", "Emerald", "Erlang", "Etoys", "Euphoria", "EXEC", "F#", "Factor", "Falcon", "Fantom",
+    "Felix", "Forth", "Fortran", "Fortress", "FreeBASIC", "Gambas", "GAMS", "GLSL", "GML", "GNU Octave",
+    "Go", "Gosu", "Groovy", "Hack", "Harbour", "Haskell", "Haxe", "Heron", "HPL", "HyperTalk", "Icon",
+    "IDL", "Idris", "Inform", "Informix-4GL", "INTERCAL", "Io", "Ioke", "J#", "J", "JADE", "Java",
+    "JavaFX Script", "JavaScript", "JScript", "JScript.NET", "Julia", "Korn shell", "Kotlin", "LabVIEW",
+    "Ladder Logic", "Lasso", "Limbo", "Lingo", "Lisp", "LiveCode", "Logo", "LotusScript", "LPC", "Lua",
+    "Lustre", "M4", "MAD", "Magic", "Magik", "Malbolge", "MANTIS", "Maple", "MATLAB", "Max/MSP",
+    "MAXScript", "MDX", "MEL", "Mercury", "Miva", "ML", "Modula-2", "Modula-3", "Mojo", "Monkey", "MOO",
+    "Moto", "MQL5", "MS-DOS batch", "MUMPS", "NATURAL", "Nemerle", "NetLogo", "Nim", "Nix", "NQC",
+    "NSIS", "NXT-G", "Oberon", "Object Rexx", "Objective-C", "OCaml", "Occam", "OpenCL", "OpenEdge ABL",
+    "OPL", "Oxygene", "Oz", "Paradox", "Pascal", "Perl", "PHP", "Pike", "PILOT", "PL/I", "PL/SQL",
+    "Pliant", "Pony", "PostScript", "POV-Ray", "PowerBasic", "PowerScript", "PowerShell", "Processing",
+    "Programming Without Coding Technology", "Prolog", "Pure Data", "PureBasic", "Python", "Q", "R",
+    "Racket", "Raku", "REBOL", "Red", "REXX", "Ring", "RPG", "Ruby", "Rust", "S-PLUS", "S", "SAS",
+    "Sather", "Scala", "Scheme", "Scratch", "sed", "Seed7", "SIGNAL", "Simula", "Simulink", "Slate",
+    "Small Basic", "Smalltalk", "Smarty", "Snap!", "SNOBOL", "Solidity", "SPARK", "SPSS", "SQL", "SQR",
+    "Squeak", "Squirrel", "Standard ML", "Stata", "Structured Text", "Suneido", "SuperCollider", "Swift",
+    "SystemVerilog", "TACL", "Tcl", "tcsh", "Tex", "thinBasic", "TOM", "Transact-SQL", "TypeScript",
+    "Uniface", "Vala", "VBScript", "VHDL", "Visual Basic", "WebAssembly", "WebDNA", "Whitespace",
+    "Wolfram", "X++", "X10", "xBase", "XBase++", "XC", "Xen", "Xojo", "XPL", "XQuery", "XSLT", "Xtend",
+    "yacc", "Yorick", "Z shell", "Zig"
+}
+
+@lru_cache(maxsize=None)
+def is_programming_language(lang_name):
+    """Return True if an scc language name matches PROGRAMMING_LANGUAGES."""
+    return any(pl.lower() in lang_name.lower() for pl in PROGRAMMING_LANGUAGES)
@@ -0,0 +1,525 @@
+import os
+import subprocess
+import threading
+import multiprocessing
+import concurrent.futures
+from metrics import METRICS
+from languages import is_programming_language
+from git_loc import SCC_BATCH_SIZE, SCC_PATH, count_files_scc, scc_language_keys
+
+# What a token opens; strings are told apart by how they end
+LINE_COMMENT = 0
+BLOCK_COMMENT = 1
+STRING = 2       # At a closing quote that no backslash escapes; may span lines
+RAW_STRING = 3   # At the next closing quote; backslashes are literal (Go `...`, C# @"...")
+DOCSTRING = 4    # A string that counts as comment when nothing precedes it on its line
+LINE_STRING = 5  # A string that also ends with its line unless the line ends in a backslash (C)
+NUL = 6          # A NUL byte; in code after anything else on its line, it makes scc skip the file as binary
+
+# The only bytes scc treats as blank; form feeds and vertical tabs are code
+WHITESPACE = b' \t\r'
+
+DQ = (b'"', b'"', STRING)
+SQ = (b"'", b"'", STRING)
+BACKTICK = (b'`', b'`', STRING)
+C_STRING = (b'"', b'"', LINE_STRING)
+TRIPLE_QUOTES = ((b'"""', b'"""', STRING), (b"'''", b"'''", STRING), DQ, SQ)
+C_COMMENTS = ((b'//',), ((b'/*', b'*/'),))
+
+C_STYLE = C_COMMENTS + ((DQ, SQ), False, False)
+HASH_STYLE = ((b'#',), (), (DQ, SQ), False, False)
+XML_STYLE = ((), ((b'<!--', b'-->'),), (DQ,), False, False)
+NO_COMMENTS = ((), (), (), False, False)
+
+# scc language name -> (extensions, filenames, syntax), where syntax is (line comments,
+# block comments, quotes, whether block comments nest, whether a backslash at the end of
+# a line comment carries it on to the next line)
+LANGUAGES = {
+    'Java': (['java'], [], C_STYLE),
+    'Kotlin': (['kt', 'kts'], [], C_COMMENTS + ((DQ,), True, False)),
+    'Scala': (['scala', 'sc'], [], C_COMMENTS + ((DQ,), True, False)),
+    'Groovy': (['groovy', 'grt', 'gtpl', 'gvy'], [], C_COMMENTS + (TRIPLE_QUOTES, False, False)),
+    'Gradle': (['gradle'], [], C_COMMENTS + (TRIPLE_QUOTES, False, False)),
+    'JavaScript': (['js', 'cjs', 'mjs'], [], C_COMMENTS + ((DQ, SQ, BACKTICK), False, False)),
+    'JSX': (['jsx'], [], C_COMMENTS + ((DQ,), False, False)),
+    'TypeScript': (['ts', 'tsx', 'cts', 'mts'], [], C_COMMENTS + ((DQ, SQ, BACKTICK), False, False)),
+    'C': (['c', 'ec', 'pgc'], [], C_COMMENTS + ((C_STRING,), False, True)),
+    'C Header': (['h'], [], C_COMMENTS + ((C_STRING,), False, True)),
+    'C++': (['cc', 'cpp', 'cxx', 'c++', 'pcc', 'ino', 'ccm', 'cppm', 'cxxm', 'c++m', 'mxx'], [],
+            C_COMMENTS + (((b'R"(', b')"', RAW_STRING), C_STRING), False, True)),
+    'C++ Header': (['hh', 'hpp', 'hxx', 'inl', 'ipp', 'h++', 'ixx', 'tpp'], [],
+                   C_COMMENTS + (((b'R"(', b')"', RAW_STRING), C_STRING), False, True)),
+    'C#': (['cs', 'csx'], [], C_COMMENTS + (((b'@"', b'"', RAW_STRING), DQ, SQ), False, False)),
+    'Objective C++': (['mm'], [], C_COMMENTS + ((C_STRING,), False, True)),
+    'Go': (['go'], [], C_COMMENTS + ((DQ, SQ, (b'`', b'`', RAW_STRING)), False, False)),
+    'Rust': (['rs'], [], C_COMMENTS + ((
+        (b'r###"', b'"###', RAW_STRING), (b'r##"', b'"##', RAW_STRING), (b'r#"', b'"#', RAW_STRING),
+        (b'r"', b'"', RAW_STRING), (b"b'", b"'", STRING), DQ
+    ), True, False)),
+    'Swift': (['swift'], [], C_COMMENTS + ((DQ,), True, False)),
+    'Dart': (['dart'], [], C_COMMENTS + ((DQ,), True, False)),
+    'PHP': (['php'], [], ((b'#', b'//'), ((b'/*', b'*/'),), (DQ, SQ), False, False)),
+    'Protocol Buffers': (['proto'], [], C_COMMENTS + ((DQ,), False, False)),
+    'Thrift': (['thrift'], [], ((b'#', b'//'), ((b'/*', b'*/'),), (DQ, SQ), False, False)),
+    'CSS': (['css'], [], C_COMMENTS + ((DQ,), False, False)),
+    'Sass': (['sass', 'scss'], [], C_COMMENTS + ((DQ,), False, False)),
+    'LESS': (['less'], [], C_COMMENTS + ((DQ,), False, False)),
+    'Python': (['py', 'pyw', 'pyi'], [], ((b'#',), (), (
+        (b'"""', b'"""', DOCSTRING), (b"'''", b"'''", DOCSTRING), (b'r"""', b'"""', DOCSTRING),
+        (b"r'''", b"'''", DOCSTRING), (b'f"""', b'"""', DOCSTRING), (b"f'''", b"'''", DOCSTRING),
+        (b'r"', b'"', RAW_STRING), (b"r'", b"'", RAW_STRING), DQ, SQ
+    ), False, False)),
+    'Ruby': (['rb'], [], ((b'#',), ((b'=begin', b'=end'),), (DQ, SQ), False, False)),
+    'Perl': (['pl', 'pm', 'plx'], [], ((b'#',), ((b'=pod', b'=cut'),), (DQ, SQ), False, False)),
+    'Shell': (['sh'], ['.tcshrc'], HASH_STYLE),
+    'BASH': (['bash', 'bash_login', 'bash_logout', 'bash_profile', 'bashrc'],
+             ['.bash_login', '.bash_logout', '.bash_profile', '.bashrc'], HASH_STYLE),
+    'Zsh': (['zsh', 'zshenv', 'zlogin', 'zlogout', 'zprofile', 'zshrc'],
+            ['.zshenv', '.zlogin', '.zlogout', '.zprofile', '.zshrc'], HASH_STYLE),
+    'R': (['r'], [], ((b'#',), (), (), False, False)),
+    'Julia': (['jl'], [], ((b'#',), ((b'#=', b'=#'),), ((b'"""', b'"""', STRING), DQ), True, False)),
+    'Makefile': (['makefile', 'mak', 'mk', 'bp'], ['makefile', 'gnumakefile'], ((b'#',), (), (), False, False)),
+    'Dockerfile': (['dockerfile'], ['dockerfile'], HASH_STYLE),
+    'YAML': (['yaml', 'yml'], [], ((b'#',), (), (), False, False)),
+    'TOML': (['toml'], [], ((b'#',), (), TRIPLE_QUOTES, False, False)),
+    'Properties File': (['properties'], [], ((b'#',), (), (), False, False)),
+    'INI': (['ini'], [], ((b'#', b';'), (), (), False, False)),
+    'SQL': (['sql', 'dml', 'ddl', 'dql'], [], ((b'--',), ((b'/*', b'*/'),), ((b"'", b"'", RAW_STRING),), False, False)),
+    'Lua': (['lua'], [], ((b'--',), ((b'--[[', b']]'),), ((b'[[', b']]', RAW_STRING), DQ, SQ), False, False)),
+    'Haskell': (['hs'], [], ((b'--',), ((b'{-', b'-}'),), (), True, False)),
+    'Erlang': (['erl', 'hrl'], [], ((b'%',), (), (), False, False)),
+    'Elixir': (['ex', 'exs'], [], ((b'#',), (), TRIPLE_QUOTES, False, False)),
+    'Clojure': (['clj', 'cljc'], [], ((b';',), (), (), False, False)),
+    'XML': (['xml'], [], XML_STYLE),
+    'XML Schema': (['xsd'], [], NO_COMMENTS),
+    'Extensible Stylesheet Language Transformations': (['xslt', 'xsl'], [], NO_COMMENTS),
+    'HTML': (['html', 'htm'], [], XML_STYLE),
+    'SVG': (['svg'], [], XML_STYLE),
+    'JavaServer Pages': (['jsp'], [], C_STYLE),
+    'Freemarker Template': (['ftl'], [], ((), ((b'<#--', b'-->'),), (), False, False)),
+    'Vue': (['vue'], [], ((b'//',), ((b'<!--', b'-->'), (b'/*', b'*/')), (DQ,), False, False)),
+    'Gherkin Specification': (['feature'], [], ((b'#',), (), (), False, False)),
+    'JSON': (['json'], [], NO_COMMENTS),
+    'Markdown': (['md', 'markdown'], [], NO_COMMENTS),
+    'ReStructuredText': (['rst'], [], NO_COMMENTS),
+    'AsciiDoc': (['adoc'], [], NO_COMMENTS),
+    'Plain Text': (['text', 'txt'], [], NO_COMMENTS),
+    'CSV': (['csv'], [], NO_COMMENTS),
+    'License': ([], ['license', 'licence', 'copying', 'copying3', 'unlicense', 'unlicence', 'license-apache',
+                     'licence-apache', 'license-mit', 'licence-mit', 'copyright'], NO_COMMENTS),
+}
+
+# Interpreter on the #! line of a file without extension -> scc language name. Files
+# naming other interpreters are left to scc.
+SHEBANGS = {
+    b'sh': 'Shell', b'bash': 'BASH', b'zsh': 'Zsh', b'python': 'Python', b'python2': 'Python',
+    b'python3': 'Python', b'perl': 'Perl', b'perl5': 'Perl', b'ruby': 'Ruby', b'node': 'JavaScript',
+    b'php': 'PHP', b'lua': 'Lua', b'Rscript': 'R', b'escript': 'Erlang',
+}
+
+# File names scc skips by default (its --exclude-file list)
+SCC_EXCLUDED_FILES = {'package-lock.json', 'Cargo.lock', 'yarn.lock', 'pubspec.lock', 'Podfile.lock', 'pnpm-lock.yaml'}
+
+def build_lookup_tables():
+    """Precompute extension, filename and interpreter -> (language, counts toward LOC, syntax)."""
+    by_extension = {}
+    by_filename = {}
+    # Earlier entries win on clashes, as they do in scc's language database
+    for name, (extensions, filenames, syntax) in LANGUAGES.items():
+        entry = (name, is_programming_language(name), syntax)
+        for extension in extensions:
+            by_extension.setdefault(extension, entry)
+        for filename in filenames:
+            by_filename.setdefault(filename, entry)
+    by_shebang = {
+        interpreter: (name, is_programming_language(name), LANGUAGES[name][2]) for interpreter, name in SHEBANGS.items()
+    }
+    return by_extension, by_filename, by_shebang
+
+BY_EXTENSION, BY_FILENAME, BY_SHEBANG = build_lookup_tables()
+
+# Bytes scanned for a NUL when deciding whether a file is binary, as scc does
+BINARY_CHECK_BYTES = 10000
+
+# Token that finds NUL bytes while checking whether a file is binary
+NUL_TOKEN = (b'\0', NUL, None)
+
+# Target payload handed to one pool task
+CHUNK_BYTES = 4 * 1024 * 1024
+
+# Bytes read from a file without extension to find its #! line
+SHEBANG_BYTES = 1024
+
+def detect_language(path):
+    """Return (language, counts toward LOC, syntax) for a path, or None if unknown."""
+    filename = os.path.basename(path).lower()
+    if filename in BY_FILENAME:
+        return BY_FILENAME[filename]
+    _, ext = os.path.splitext(filename)
+    return BY_EXTENSION.get(ext[1:]) if ext else None
+
+def _find_close(line, position, end, kind):
+    """
+    Index of the quote that closes a string of the given kind, or -1 if the
+    line does not close it.
+    """
+    if kind == RAW_STRING:
+        return line.find(end, position)
+    while True:
+        close = line.find(end, position)
+        if close == -1:
+            return -1
+        backslashes = 0
+        while close - backslashes - 1 >= position and line[close - backslashes - 1] == 0x5c:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return close
+        position = close + 1
+
+def _skip_comment(line, position, start, end, depth, nested):
+    """Position after the block comment open at position, and how many levels are still open."""
+    while depth:
+        close = line.find(end, position)
+        if nested:
+            opening = line.find(start, position)
+            if opening != -1 and (close == -1 or opening < close):
+                depth += 1
+                position = opening + len(start)
+                continue
+        if close == -1:
+            return len(line), depth
+        depth -= 1
+        position = close + len(end)
+    return position, 0
+
+def _syntax_tokens(syntax):
+    """(token, kind, state opened) for every token that changes state, longest first."""
+    line_comments, block_comments, quotes, _, continued = syntax
+    tokens = [(comment, LINE_COMMENT, (LINE_COMMENT, comment, None, 0) if continued else None)
+              for comment in line_comments]
+    tokens += [(start, BLOCK_COMMENT, (BLOCK_COMMENT, start, end, 1)) for start, end in block_comments]
+    tokens += [(start, kind, (kind, start, end, 0)) for start, end, kind in quotes]
+    # Longer tokens win where several start at the same place, e.g. ''' over '
+    tokens.sort(key=lambda token: -len(token[0]))
+    return tokens
+
+def _classify_line(line, syntax, tokens, state):
+    """
+    Classify a stripped line. state is the block comment or string the
+    previous line left open, as (kind, opening token, closing token, depth),
+    or None. Returns (is_code, state left open after this line); is_code is
+    None when tokens include NUL_TOKEN and a NUL follows code on the line.
+    """
+    nested = syntax[3]
+    has_code = False
+    position = 0
+    length = len(line)
+
+    while True:
+        if state is not None:
+            kind, start, end, depth = state
+            if kind == LINE_COMMENT:
+                return False, state if line.endswith(b'\\') else None
+            if kind == BLOCK_COMMENT:
+                position, depth = _skip_comment(line, position, start, end, depth, nested)
+                if depth:
+                    return has_code, (kind, start, end, depth)
+                state = None
+                continue
+            close = _find_close(line, position, end, kind)
+            if close == -1:
+                if kind == LINE_STRING and not line.endswith(b'\\'):
+                    return True, None
+                return has_code or kind != DOCSTRING, state
+            position = close + len(end)
+            state = None
+            # A docstring is a comment unless code follows it on its closing line
+            if kind == DOCSTRING and not has_code and not line[position:].strip(WHITESPACE):
+                return False, None
+            has_code = True
+            continue
+
+        # Find the earliest token that changes state
+        next_position, token = length, None
+        for candidate in tokens:
+            found = line.find(candidate[0], position, next_position + len(candidate[0]))
+            # A one-character quote right after a backslash does not open a string
+            while found > 0 and STRING <= candidate[1] <= LINE_STRING and len(candidate[0]) == 1 \
+                    and line[found - 1] == 0x5c:
+                found = line.find(candidate[0], found + 1, next_position + len(candidate[0]))
+            if found != -1 and found < next_position:
+                next_position, token = found, candidate
+
+        if line[position:next_position].strip(WHITESPACE):
+            has_code = True
+        if token is None:
+            return has_code, None
+        if token[1] == NUL:
+            if has_code:
+                return None, None
+            has_code = True
+            position = next_position + 1
+            continue
+        if token[1] == LINE_COMMENT:
+            return has_code, token[2] if token[2] and line.endswith(b'\\') else None
+        state = token[2]
+        if token[1] == DOCSTRING and has_code:
+            # After code, scc reads docstring quotes as a string that backslashes do not escape
+            state = (RAW_STRING,) + state[1:]
+        elif token[1] != BLOCK_COMMENT and token[1] != DOCSTRING:
+            has_code = True
+        position = next_position + len(token[0])
+
+def count_lines(data, syntax):
+    """
+    Return (code, comment, blank) line counts for the bytes of one file.
+    Block comments and strings carry over line ends: lines inside a string
+    are code, lines inside a comment or docstring are comments even when
+    blank.
+    """
+    tokens = _syntax_tokens(syntax)
+    triggers = tuple(token for token, _, _ in tokens)
+    code = comment = blank = 0
+    state = None
+
+    lines = data.split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    for line in lines:
+        line = line.strip(WHITESPACE)
+        if state is None:
+            if not line:
+                blank += 1
+                continue
+            # Fast path: most lines hold no comment or string tokens at all
+            if not any(token in line for token in triggers):
+                code += 1
+                continue
+        is_code, state = _classify_line(line, syntax, tokens, state)
+        if is_code:
+            code += 1
+        else:
+            comment += 1
+    return code, comment, blank
+
+def is_binary(data, syntax):
+    """
+    Whether scc skips data as binary: a NUL among its first
+    BINARY_CHECK_BYTES bytes that is read as code and follows something
+    else on its line. NULs in strings, comments, at the start of a line or
+    as the last byte of the file do not count.
+    """
+    head = data[:min(BINARY_CHECK_BYTES, len(data) - 1)]
+    if b'\0' not in head:
+        return False
+    tokens = _syntax_tokens(syntax) + [NUL_TOKEN]
+    state = None
+    for line in head.split(b'\n'):
+        is_code, state = _classify_line(line.strip(WHITESPACE), syntax, tokens, state)
+        if is_code is None:
+            return True
+    return False
+
+def shebang_interpreter(data):
+    """
+    The interpreter a #! line names, read the way scc reads it: the last
+    part of the first path, or the word after it for /usr/bin/env.
+    """
+    if not data or not data.startswith(b'#!'):
+        return None
+    line = data[2:].split(b'\n', 1)[0]
+    slash = line.find(b'/')
+    if slash == -1:
+        return None
+    words = line[slash:].split()
+    interpreter = words[0].rsplit(b'/', 1)[-1]
+    if interpreter == b'env':
+        return words[1] if len(words) > 1 else None
+    return interpreter
+
+def has_extension(path):
+    return bool(os.path.splitext(os.path.basename(path))[1])
+
+def count_file(path, data):
+    """Return (language, code) for one file, or None if the table cannot count it."""
+    if data is None:
+        return None
+    language = detect_language(path)
+    if language is None and not has_extension(path):
+        language = BY_SHEBANG.get(shebang_interpreter(data))
+    if language is None:
+        return None
+    name, _, syntax = language
+    if is_binary(data, syntax):
+        return None
+    return name, count_lines(data, syntax)[0]
+
+def counted_by(path, scc_keys):
+    """
+    Who counts the file at path, going by its name: 'native' for the table,
+    'scc' for names only scc knows, 'shebang' when a file without extension
+    has to be read to decide, or None when scc would not count it.
+    """
+    name = os.path.basename(path)
+    if name in SCC_EXCLUDED_FILES:
+        return None
+    name = name.lower()
+    # Whole file names such as CMakeLists.txt come before extensions in scc
+    if '.' in name and name in scc_keys and name not in BY_FILENAME:
+        return 'scc'
+    if detect_language(path):
+        return 'native'
+    _, ext = os.path.splitext(name)
+    if (ext[1:] if ext else name) in scc_keys:
+        return 'scc'
+    return None if ext else 'shebang'
+
+def shebang_counted_by(data):
+    """Who counts a file without extension, going by its #! line."""
+    if shebang_interpreter(data) in BY_SHEBANG:
+        return 'native'
+    return 'scc' if data and data.startswith(b'#!') else None
+
+def gitignored(root, paths):
+    """
+    The paths under root that .gitignore files exclude, tracked or not, as
+    scc skips them. Nothing is excluded unless root is the top of a git
+    checkout; scc does not read the ignore files of enclosing repositories.
+    """
+    if not paths or not os.path.exists(os.path.join(root, '.git')):
+        return set()
+    result = subprocess.run(
+        ['git', 'check-ignore', '--no-index', '--stdin', '-z'],
+        cwd=root,
+        input=b'\0'.join(os.path.relpath(path, root).encode() for path in paths),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    if result.returncode not in (0, 1):
+        return set()
+    return {os.path.join(root, path.decode()) for path in result.stdout.split(b'\0') if path}
+
+def _count_chunk(items):
+    return [count_file(path, data) for path, data in items]
+
+def _read_file(path, size=-1):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(size)
+    except OSError:
+        return None
+
+def _count_paths(paths):
+    results = []
+    for path in paths:
+        results.append(count_file(path, _read_file(path)))
+    return results
+
+class NativeLocCounter:
+    """
+    In-process replacement for the scc subprocess. Files are classified
+    line by line with per-language comment rules, and large batches are
+    spread over a process pool that lives as long as the counter. Files in
+    languages outside LANGUAGES are handed to scc in one run per batch.
+    """
+
+    def __init__(self, workers=None, scc_path=SCC_PATH):
+        self.workers = workers or os.cpu_count() or 1
+        self.scc_path = scc_path
+        self.scc_keys = None
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _scc_keys(self):
+        with self.lock:
+            if self.scc_keys is None:
+                if os.path.exists(self.scc_path):
+                    self.scc_keys = scc_language_keys(self.scc_path)
+                else:
+                    METRICS.log(f"{self.scc_path} not found; files in languages outside loc_counter.LANGUAGES "
+                                "are not counted")
+                    self.scc_keys = set()
+            return self.scc_keys
+
+    def _pool(self):
+        with self.lock:
+            if self.executor is None and self.workers > 1:
+                # forkserver: the pool is started from a program that already runs threads
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+            return self.executor
+
+    def _map_chunks(self, func, chunks):
+        pool = self._pool() if len(chunks) > 1 else None
+        if pool is None:
+            return [result for chunk in chunks for result in func(chunk)]
+        return [result for results in pool.map(func, chunks) for result in results]
+
+    def count_blobs(self, reader, blobs):
+        """Counter for BlobLocEngine: {blob index: (language, code)} of recognised blobs."""
+        scc_keys = self._scc_keys()
+        chunks, chunk, chunk_bytes = [], [], 0
+        scc_files, scc_indexes = [], []
+        for index, (path, blob_sha) in enumerate(blobs):
+            counter = counted_by(path, scc_keys)
+            data = reader.read_blob(blob_sha) if counter else None
+            if counter == 'shebang':
+                counter = shebang_counted_by(data)
+            if counter == 'scc':
+                scc_files.append((path, data))
+                scc_indexes.append(index)
+                data = None
+            chunk.append((path, data))
+            chunk_bytes += len(data) if data else 0
+            if chunk_bytes >= CHUNK_BYTES:
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+        if chunk:
+            chunks.append(chunk)
+
+        counts = {}
+        for index, result in enumerate(self._map_chunks(_count_chunk, chunks)):
+            if result is not None:
+                counts[index] = result
+        if scc_files:
+            for position, result in count_files_scc(scc_files, self.scc_path).items():
+                counts[scc_indexes[position]] = result
+        return counts
+
+    def tree_loc(self, root):
+        """Programming-language LOC of a checked-out tree; same total as scc_tree_loc."""
+        scc_keys = self._scc_keys()
+        paths, scc_paths = [], []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [d for d in dir_names if d not in ('.git', '.hg', '.svn')]
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                if os.path.islink(path):
+                    continue
+                counter = counted_by(file_name, scc_keys)
+                if counter == 'shebang':
+                    counter = shebang_counted_by(_read_file(path, SHEBANG_BYTES))
+                language = detect_language(file_name)
+                if counter == 'native' and (language is None or language[1]):
+                    paths.append(path)
+                elif counter == 'scc':
+                    scc_paths.append(path)
+        ignored = gitignored(root, paths + scc_paths)
+        paths = [path for path in paths if path not in ignored]
+        scc_paths = [path for path in scc_paths if path not in ignored]
+
+        chunk_size = max(1, len(paths) // (self.workers * 4) or 1)
+        chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+        total = sum(result[1] for result in self._map_chunks(_count_paths, chunks) if result)
+        for start in range(0, len(scc_paths), SCC_BATCH_SIZE):
+            batch = scc_paths[start:start + SCC_BATCH_SIZE]
+            counts = count_files_scc(((path, _read_file(path)) for path in batch), self.scc_path)
+            total += sum(code for language, code in counts.values() if is_programming_language(language))
+        return total
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -1,123 +1,106 @@
 import os
+import argparse
 import subprocess
-import json
 #import requests if python complains, remove comment and install requests
 #import time
+import random
 import shutil
-from pydriller import Repository
-import concurrent.futures
 import threading
-from urllib.parse import urlparse, urlunparse
-
-# Set of programming languages to consider
-PROGRAMMING_LANGUAGES = {
-    "FoxPro", "1C:Enterprise", "4th Dimension", "ABAP", "ABC", "ActionScript", "Ada", "Agilent VEE",
-    "Algol", "Alice", "Angelscript", "Apex", "APL", "Applescript", "Arc", "AspectJ", "Assembly",
-    "ATLAS", "AutoHotkey", "AutoIt", "AutoLISP", "Automator", "Avenue", "Awk", "B4X", "Ballerina",
-    "Bash", "Basic", "BBC BASIC", "bc", "BCPL", "BETA", "BlitzMax", "Boo", "Bourne shell", "Brainfuck",
-    "C shell", "C#", "C++", "C++/CLI", "C-Omega", "C", "Caml", "Carbon", "Ceylon", "CFML", "cg", "Ch",
-    "Chapel", "CHILL", "CIL", "Citrine", "CL", "Clarion", "Clean", "Clipper", "CLIPS", "Clojure", "CLU",
-    "COBOL", "Cobra", "CoffeeScript", "COMAL", "Common Lisp", "CORAL 66", "Crystal", "cT", "Curl", "D",
-    "Dart", "DCL", "Delphi", "DiBOL", "Dylan", "E", "ECMAScript", "EGL", "Eiffel", "Elixir", "Elm",
-    "Emacs Lisp", "Emerald", "Erlang", "Etoys", "Euphoria", "EXEC", "F#", "Factor", "Falcon", "Fantom",
-    "Felix", "Forth", "Fortran", "Fortress", "FreeBASIC", "Gambas", "GAMS", "GLSL", "GML", "GNU Octave",
-    "Go", "Gosu", "Groovy", "Hack", "Harbour", "Haskell", "Haxe", "Heron", "HPL", "HyperTalk", "Icon",
-    "IDL", "Idris", "Inform", "Informix-4GL", "INTERCAL", "Io", "Ioke", "J#", "J", "JADE", "Java",
-    "JavaFX Script", "JavaScript", "JScript", "JScript.NET", "Julia", "Korn shell", "Kotlin", "LabVIEW",
-    "Ladder Logic", "Lasso", "Limbo", "Lingo", "Lisp", "LiveCode", "Logo", "LotusScript", "LPC", "Lua",
-    "Lustre", "M4", "MAD", "Magic", "Magik", "Malbolge", "MANTIS", "Maple", "MATLAB", "Max/MSP",
-    "MAXScript", "MDX", "MEL", "Mercury", "Miva", "ML", "Modula-2", "Modula-3", "Mojo", "Monkey", "MOO",
-    "Moto", "MQL5", "MS-DOS batch", "MUMPS", "NATURAL", "Nemerle", "NetLogo", "Nim", "Nix", "NQC",
-    "NSIS", "NXT-G", "Oberon", "Object Rexx", "Objective-C", "OCaml", "Occam", "OpenCL", "OpenEdge ABL",
-    "OPL", "Oxygene", "Oz", "Paradox", "Pascal", "Perl", "PHP", "Pike", "PILOT", "PL/I", "PL/SQL",
-    "Pliant", "Pony", "PostScript", "POV-Ray", "PowerBasic", "PowerScript", "PowerShell", "Processing",
-    "Programming Without Coding Technology", "Prolog", "Pure Data", "PureBasic", "Python", "Q", "R",
-    "Racket", "Raku", "REBOL", "Red", "REXX", "Ring", "RPG", "Ruby", "Rust", "S-PLUS", "S", "SAS",
-    "Sather", "Scala", "Scheme", "Scratch", "sed", "Seed7", "SIGNAL", "Simula", "Simulink", "Slate",
-    "Small Basic", "Smalltalk", "Smarty", "Snap!", "SNOBOL", "Solidity", "SPARK", "SPSS", "SQL", "SQR",
-    "Squeak", "Squirrel", "Standard ML", "Stata", "Structured Text", "Suneido", "SuperCollider", "Swift",
-    "SystemVerilog", "TACL", "Tcl", "tcsh", "Tex", "thinBasic", "TOM", "Transact-SQL", "TypeScript",
-    "Uniface", "Vala", "VBScript", "VHDL", "Visual Basic", "WebAssembly", "WebDNA", "Whitespace",
-    "Wolfram", "X++", "X10", "xBase", "XBase++", "XC", "Xen", "Xojo", "XPL", "XQuery", "XSLT", "Xtend",
-    "yacc", "Yorick", "Z shell", "Zig"
-}
-
-def create_authenticated_url(url, token):
-    """Convert a regular GitHub URL to an authenticated URL with token."""
-    parsed = urlparse(url)
-    if parsed.hostname and 'github.com' in parsed.hostname:
-        netloc = f'{token}@{parsed.hostname}'
-        return urlunparse(parsed._replace(netloc=netloc))
-    return url
+from mirror_store import MirrorStore
+from scheduler import RepoJob, ResourceScheduler, estimate_repo, estimate_repos, total_memory_mb
+from work_queue import QueueWorker, WorkQueue
+from manifest import RepoManifest, atomic_write_json
+from metrics import METRICS
+from deadlines import DeadlineExceeded, check_deadline, deadline
+from effort_sampling import PERIODS, commit_times, sample_effort, stratify
+from results_store import ResultsStore, StoreWriter
+from effort_aggregates import EffortAggregates
+from diff_store import DiffStore, open_diff_store, store_diff_content, with_diff_content
+from pipeline import Pipeline, PrefetchBudget, RepoTask, ScheduledStage, Stage, WriteStage, directory_size
+from git_loc import BlobLocCache, BlobLocEngine, count_blobs_scc, iter_blob_locs, scc_tree_loc
+from loc_counter import NativeLocCounter
+from worktree_pool import iter_worktree_locs
+from git_commits import iter_commits
+from result_streams import NdjsonWriter, build_commit_index, iter_ndjson, ndjson_to_json, write_json_array
+from refactoring_shards import (
+    REFACTORING_MINER_PATH, merge_refactoring_files, refactoring_miner_env, run_sharded_refactoring_miner
+)
 
 def read_urls(file_path):
     with open(file_path, 'r') as file:
         return [line.strip() for line in file if line.strip()]
 
-def clone_repo(url, target_dir, token):
-    """Clone repository with authentication token."""
-    repo_name = url.split('/')[-1]
+def clone_repo(url, target_dir, token, mirrors=None, refresh=True):
+    """
+    Create a fresh work directory for url. Objects come from a persistent
+    bare mirror that is only fetched incrementally after the first run.
+    """
+    repo_name = repo_name_from_url(url)
     target_path = os.path.join(target_dir, repo_name)
 
-    if not os.path.exists(target_path):
-        authenticated_url = create_authenticated_url(url, token)
-
-        # Set up Git configuration for the process
-        env = os.environ.copy()
-        env['GIT_TERMINAL_PROMPT'] = '0'  # Disable Git credential prompt
-
-        try:
-            subprocess.run(
-                ['git', 'clone', authenticated_url, target_path],
-                check=True,
-                env=env,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE  # Capture stderr to avoid exposing token in logs
-            )
-        except subprocess.CalledProcessError as e:
-            # Clean up error message to avoid exposing token
-            error_msg = str(e.stderr.decode()).replace(token, '***')
-            raise Exception(f"Failed to clone repository: {error_msg}")
+    if mirrors is None:
+        mirrors = MirrorStore(token=token)
+    mirrors.create_workdir(url, target_path, refresh)
 
     return target_path, repo_name
 
-def run_refactoring_miner(repo_path, output_file):
-    refactoring_miner_path = os.path.join('bin', 'RefactoringMiner')
-    command = [
-        refactoring_miner_path,
-        '-a', repo_path,
-        '-json', output_file
-    ]
-    subprocess.run(command, check=True)
-
-def analyze_diffs(repo_path, refactorings_file):
-    with open(refactorings_file, 'r') as f:
-        refactorings_data = json.load(f)
-
-    output_data = []
-
-    for commit_info in refactorings_data['commits']:
-        commit_hash = commit_info['sha1']
-
-        for commit in Repository(repo_path, single=commit_hash).traverse_commits():
-            diff_stats = {}
-            diff_content = {}
-
-            for file in commit.modified_files:
-                diff_stats[file.filename] = {
-                    'insertions': file.added_lines,
-                    'deletions': file.deleted_lines,
-                }
-                diff_content[file.filename] = file.diff
-
-            output_data.append({
-                'commit_hash': commit_hash,
-                'previous_commit_hash': commit.parents[0],
-                'diff_stats': diff_stats,
-                'diff_content': diff_content
-            })
+def run_refactoring_miner(repo_path, output_file, branch=None, shards=1, heap_mb=None, since=None,
+                          timeout=None, on_timeout=None):
+    """
+    Detect refactorings in the commits reachable from branch, or only in
+    since..branch. Every mode (one JVM, sharded, incremental) covers these
+    same commits; without a branch all branches are mined. With shards > 1
+    the history of branch is split into ranges that are mined by parallel
+    JVMs. With a timeout (seconds per JVM) a range that takes too long is
+    split and retried, and commits that still time out on their own are
+    skipped and passed to on_timeout.
+    """
+    if branch and (shards > 1 or timeout):
+        run_sharded_refactoring_miner(repo_path, output_file, branch, shards, heap_mb, since, timeout, on_timeout)
+        return
+
+    if since:
+        command = [
+            REFACTORING_MINER_PATH,
+            '-bc', repo_path, since, branch,
+            '-json', output_file
+        ]
+    else:
+        command = [
+            REFACTORING_MINER_PATH,
+            '-a', repo_path, *([branch] if branch else []),
+            '-json', output_file
+        ]
+    METRICS.run(command, check=True, timeout=timeout, env=refactoring_miner_env(heap_mb))
 
-    return output_data
+def analyze_diffs(repo_path, refactorings_file, commit_index=None):
+    """
+    Yield per-file diff stats for every refactoring commit. Patches for all
+    commits come from one git pass; pass the shared commit_index to avoid
+    re-reading the RefactoringMiner output.
+    """
+    if commit_index is None:
+        commit_index = build_commit_index(repo_path, refactorings_file)
+
+    commit_hashes = (commit_ref.sha for commit_ref in commit_index)
+    for commit in iter_commits(repo_path, commit_hashes):
+        diff_stats = {}
+        diff_content = {}
+
+        for file in commit['files']:
+            diff_stats[file['filename']] = {
+                'insertions': file['insertions'],
+                'deletions': file['deletions'],
+            }
+            diff_content[file['filename']] = file['diff']
+
+        yield {
+            'commit_hash': commit['hash'],
+            'previous_commit_hash': commit['parents'][0],
+            'author_time': commit['author_time'],
+            'diff_stats': diff_stats,
+            'diff_content': diff_content
+        }
 
 def safe_git_checkout(repo_path, commit_hash):
     """
@@ -190,78 +173,59 @@ def get_main_branch(repo_path):
 
     raise Exception("Could not determine or checkout main branch")
 
-def get_loc(repo_path, commit_hash):
-    """Modified to use safe checkout"""
-    if not safe_git_checkout(repo_path, commit_hash):
-        # If checkout fails, return 0 or raise an exception based on your needs
-        return 0
-
-    scc_output = subprocess.check_output(
-        [os.path.join('bin', 'scc'), '-f', 'json', repo_path],
-        universal_newlines=True
-    )
-    scc_data = json.loads(scc_output)
-
-    total_loc = 0
-    for lang_data in scc_data:
-        lang_name = lang_data['Name']
-        if any(pl.lower() in lang_name.lower() for pl in PROGRAMMING_LANGUAGES):
-            total_loc += lang_data['Code']
-
-    return total_loc
-
-def analyze_developer_effort(repo_path, refactorings_file):
-    with open(refactorings_file, 'r') as f:
-        refactorings_data = json.load(f)
-
-    effort_data = []
+def analyze_developer_effort(repo_path, refactorings_file, loc_cache_file=None, commit_index=None,
+                             loc_backend='blob', loc_workers=1, worktree_root=None, loc_counter=None,
+                             commit_timeout=None, on_timeout=None):
+    """
+    Yield LOC before and after each refactoring commit. The default 'blob'
+    backend counts git objects without checkouts; 'worktree' measures
+    loc_workers git worktrees in parallel. Lines are counted by scc unless
+    loc_counter (a NativeLocCounter) is given. commit_index is built from
+    git metadata when not given. Commits whose scc runs take longer than
+    commit_timeout seconds are skipped and passed to on_timeout.
+    """
+    loc_engine = None
 
     try:
-        for commit_info in refactorings_data['commits']:
-            commit_hash = commit_info['sha1']
-
-            repo = Repository(repo_path, single=commit_hash)
-            for commit in repo.traverse_commits():
-                try:
-                    previous_commit_hash = commit.parents[0]
-                    developer = commit.author.name
-
-                    # Use safe checkout for both commits
-                    if not safe_git_checkout(repo_path, previous_commit_hash):
-                        safe_print(f"Warning: Could not checkout {previous_commit_hash}, skipping...")
-                        continue
-
-                    loc_before = get_loc(repo_path, previous_commit_hash)
-
-                    if not safe_git_checkout(repo_path, commit_hash):
-                        safe_print(f"Warning: Could not checkout {commit_hash}, skipping...")
-                        continue
-
-                    loc_after = get_loc(repo_path, commit_hash)
-                    tloc = abs(loc_after - loc_before)
-
-                    effort_data.append({
-                        'commit_hash': commit_hash,
-                        'previous_commit_hash': previous_commit_hash,
-                        'developer': developer,
-                        'loc_before': loc_before,
-                        'loc_after': loc_after,
-                        'tloc': tloc
-                    })
-                except Exception as e:
-                    safe_print(f"Warning: Error processing commit {commit_hash}: {str(e)}")
-                break  # We only need to process the single commit
+        if commit_index is None:
+            commit_index = build_commit_index(repo_path, refactorings_file)
+
+        if loc_backend == 'worktree':
+            measure = loc_counter.tree_loc if loc_counter else scc_tree_loc
+            measurements = iter_worktree_locs(
+                repo_path, commit_index, measure, loc_workers, worktree_root, commit_timeout
+            )
+        else:
+            counter = loc_counter.count_blobs if loc_counter else count_blobs_scc
+            loc_engine = BlobLocEngine(repo_path, BlobLocCache(loc_cache_file), counter)
+            measurements = iter_blob_locs(loc_engine, commit_index, commit_timeout)
+
+        for (commit_hash, previous_commit_hash, developer), loc_before, loc_after, error in measurements:
+            if isinstance(error, DeadlineExceeded):
+                check_deadline()  # Once the stage itself is out of time, stop instead of skipping the rest
+                safe_print(f"Warning: Skipping commit {commit_hash}: {str(error)}")
+                if on_timeout:
+                    on_timeout(commit_hash)
+                continue
+            if error is not None:
+                safe_print(f"Warning: Error processing commit {commit_hash}: {str(error)}")
+                continue
+
+            yield {
+                'commit_hash': commit_hash,
+                'previous_commit_hash': previous_commit_hash,
+                'developer': developer,
+                'loc_before': loc_before,
+                'loc_after': loc_after,
+                'tloc': abs(loc_after - loc_before)
+            }
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         safe_print(f"Warning: Error in analyze_developer_effort: {str(e)}")
-
-    try:
-        # Try to return to main branch, but don't fail if we can't
-        main_branch = get_main_branch(repo_path)
-        safe_git_checkout(repo_path, main_branch)
-    except Exception:
-        pass
-
-    return effort_data
+    finally:
+        if loc_engine:
+            loc_engine.close()
 
 print_lock = threading.Lock()
 
@@ -269,45 +233,470 @@ def safe_print(*args, **kwargs):
     with print_lock:
         print(*args, **kwargs)
 
-def process_repository(url, repos_dir, results_dir, token):
-    repo_path = None
-    try:
-        repo_path, repo_name = clone_repo(url, repos_dir, token)
+def repo_name_from_url(url):
+    return url.split('/')[-1]
 
-        main_branch = get_main_branch(repo_path)
+def load_manifest(results_dir, url):
+    repo_name = repo_name_from_url(url)
+    return RepoManifest(os.path.join(results_dir, repo_name, f'{repo_name}_manifest.json'), url)
 
-        repo_results_dir = os.path.join(results_dir, repo_name)
-        os.makedirs(repo_results_dir, exist_ok=True)
+def prepare_repository(task, repos_dir, results_dir, token, mirrors=None):
+    """
+    Clone stage: work directory, main branch, result paths and manifest.
+    Repositories analysed in an earlier run only get the commits added
+    since then; if there are none, the task is skipped.
+    """
+    if mirrors is None:
+        mirrors = MirrorStore(token=token)
+    mirrors.ensure_mirror(task.url)
+    task.head = mirrors.head(task.url)
+
+    task.repo_name = repo_name_from_url(task.url)
+    task.results_dir = os.path.join(results_dir, task.repo_name)
+    os.makedirs(task.results_dir, exist_ok=True)
+    task.refactorings_file = result_file(task, 'refactorings.json')
+    task.manifest = load_manifest(results_dir, task.url)
+
+    manifest = task.manifest
+    if manifest.completed and manifest.analysed_head:
+        if manifest.analysed_head == task.head:
+            task.skip = True
+            return
+        offsets = {
+            stage: os.path.getsize(path) if os.path.exists(path) else 0
+            for stage, path in (
+                ('diff', result_file(task, 'diff_analysis.ndjson')),
+                ('effort', result_file(task, 'effort_analysis.ndjson'))
+            )
+        }
+        manifest.start_incremental(manifest.analysed_head, task.head, offsets)
+    elif manifest.completed:
+        # Completed before heads were recorded: no base to continue from
+        manifest.restart_from('mine')
+
+    incremental_range = manifest.incremental_range
+    if incremental_range:
+        task.since, task.head = incremental_range
+
+    task.repo_path, _ = clone_repo(task.url, repos_dir, token, mirrors, refresh=False)
+    task.main_branch = get_main_branch(task.repo_path)
+    task.workdir_bytes = directory_size(task.repo_path)
+    METRICS.current_span().bytes_written = task.workdir_bytes
+
+def mine_repository(task, rm_shards=1, rm_heap_mb=None, rm_timeout=None):
+    """
+    Mine stage. For an incremental run only since..head is mined, and the
+    new commits are merged into the existing refactorings file. Ranges that
+    RefactoringMiner could not finish within rm_timeout are recorded in
+    the manifest.
+    """
+    manifest = task.manifest
+    on_timeout = None
+    if manifest:
+        def on_timeout(commit_range):
+            safe_print(f"Warning: RefactoringMiner timed out on {commit_range} of {task.repo_name}, skipped")
+            manifest.record_timeout('mine', commit_range)
+    if not (manifest and manifest.stage_done('mine') and os.path.exists(task.refactorings_file)):
+        if manifest:
+            manifest.restart_from('mine')
+        # RefactoringMiner output only appears under its final name once complete
+        tmp_file = f'{task.refactorings_file}.tmp'
+        if task.since:
+            new_file = result_file(task, 'refactorings_new.json')
+            run_refactoring_miner(
+                task.repo_path, tmp_file, task.head, rm_shards, rm_heap_mb, task.since, rm_timeout, on_timeout
+            )
+            os.replace(tmp_file, new_file)
+            merge_refactoring_files([task.refactorings_file, new_file], tmp_file)
+            os.replace(tmp_file, task.refactorings_file)
+            os.remove(new_file)
+        else:
+            run_refactoring_miner(
+                task.repo_path, tmp_file, task.main_branch, rm_shards, rm_heap_mb, None, rm_timeout, on_timeout
+            )
+            os.replace(tmp_file, task.refactorings_file)
+        if manifest:
+            manifest.mark_stage_done('mine')
+
+    # Compact (sha, parent, developer) index shared by both analyses
+    task.commit_index = build_commit_index(task.repo_path, task.refactorings_file)
+    if task.since:
+        new_commits = set(subprocess.check_output(
+            ['git', 'rev-list', f'{task.since}..{task.head}'],
+            cwd=task.repo_path,
+            universal_newlines=True
+        ).split())
+        task.commit_index = [commit_ref for commit_ref in task.commit_index if commit_ref.sha in new_commits]
+    METRICS.current_span().commits = len(task.commit_index)
+
+def result_file(task, suffix):
+    return os.path.join(task.results_dir, f'{task.repo_name}_{suffix}')
+
+def write_records(records, writer, write_stage=None):
+    """Write records through the shared write stage if there is one."""
+    if write_stage is None:
+        with writer:
+            for record in records:
+                writer.write(record)
+        return
 
-        refactorings_file = os.path.join(repo_results_dir, f'{repo_name}_refactorings.json')
-        run_refactoring_miner(repo_path, refactorings_file)
+    try:
+        for record in records:
+            write_stage.write(writer, record)
+    finally:
+        write_stage.close(writer)
 
-        diff_analysis = analyze_diffs(repo_path, refactorings_file)
+def run_resumable_stage(task, stage, suffix, analyze, write_stage=None, store=None, before_checkpoint=None):
+    """
+    Run an analysis stage that continues after the last checkpointed commit
+    of an interrupted run, and mark it done in the manifest at the end.
+    Records also go to store, a ResultsStore, when one is given, and
+    before_checkpoint runs before each checkpoint is recorded.
+    """
+    manifest = task.manifest
+    if manifest and manifest.stage_done(stage):
+        return
+
+    start, offset = manifest.resume_point(stage, task.commit_index) if manifest else (0, None)
+    if start:
+        safe_print(f"Resuming {stage} stage of {task.repo_name} at commit {start}/{len(task.commit_index)}")
+
+    store_writer = None
+    on_checkpoint = None
+    if manifest:
+        def on_checkpoint(record, file_offset):
+            # Rows still batched for the store would be skipped by a resume after this checkpoint
+            if store_writer:
+                store_writer.flush()
+            if before_checkpoint:
+                before_checkpoint()
+            manifest.record_progress(stage, record['commit_hash'], file_offset)
+
+    span = METRICS.current_span()
+    span.total = len(task.commit_index) - start
+
+    def counted(records):
+        for record in records:
+            yield record
+            span.advance()
+            check_deadline()
+
+    output_file = result_file(task, suffix)
+    writer = NdjsonWriter(output_file, resume_offset=offset, on_checkpoint=on_checkpoint)
+    if store:
+        writer = store_writer = StoreWriter(writer, store, task.repo_name, stage)
+    write_records(counted(analyze(task.commit_index[start:])), writer, write_stage)
+    span.bytes_written = os.path.getsize(output_file) - (offset or 0)
+    if manifest:
+        manifest.mark_stage_done(stage)
+
+def write_diff_analysis(task, write_stage=None, store=None, diff_store=False):
+    """With diff_store, diff bodies go to the repository's DiffStore and records keep diff_refs."""
+    if not diff_store:
+        run_resumable_stage(
+            task, 'diff', 'diff_analysis.ndjson',
+            lambda commit_index: analyze_diffs(task.repo_path, task.refactorings_file, commit_index),
+            write_stage, store
+        )
+        return
+
+    with DiffStore(result_file(task, 'diffs')) as diffs:
+        run_resumable_stage(
+            task, 'diff', 'diff_analysis.ndjson',
+            lambda commit_index: store_diff_content(
+                analyze_diffs(task.repo_path, task.refactorings_file, commit_index), diffs
+            ),
+            write_stage, store, diffs.flush
+        )
 
-        diff_analysis_file = os.path.join(repo_results_dir, f'{repo_name}_diff_analysis.json')
-        with open(diff_analysis_file, 'w') as f:
-            json.dump(diff_analysis, f, indent=2)
+def write_effort_analysis(task, write_stage=None, loc_backend='blob', loc_workers=1, worktree_root=None,
+                          loc_counter=None, store=None, commit_timeout=None):
+    on_timeout = None
+    if task.manifest:
+        def on_timeout(commit_hash):
+            task.manifest.record_timeout('effort', commit_hash)
+
+    run_resumable_stage(
+        task, 'effort', 'effort_analysis.ndjson',
+        lambda commit_index: analyze_developer_effort(
+            task.repo_path, task.refactorings_file,
+            result_file(task, 'loc_cache.json'), commit_index,
+            loc_backend, loc_workers, worktree_root, loc_counter, commit_timeout, on_timeout
+        ),
+        write_stage, store
+    )
 
-        effort_analysis = analyze_developer_effort(repo_path, refactorings_file)
+def write_effort_sample(task, loc_counter=None, error_target=0.1, time_budget=None, confidence=0.95,
+                        period='quarter', seed=None, commit_timeout=None):
+    """
+    Effort stage in sampling mode: measure a stratified random sample of
+    the refactoring commits (by developer and period) until every
+    developer's total is known to within error_target, or time_budget
+    seconds are spent. Writes the sampled commits and the per-developer
+    estimates with confidence intervals.
+    """
+    manifest = task.manifest
+    if manifest and manifest.stage_done('effort'):
+        return
+
+    # Estimates cover the whole history, also when only new commits were mined
+    commit_index = task.commit_index
+    if task.since:
+        commit_index = build_commit_index(task.repo_path, task.refactorings_file)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    strata = stratify(commit_index, commit_times(task.repo_path, commit_index), period, seed)
+
+    counter = loc_counter.count_blobs if loc_counter else count_blobs_scc
+    loc_engine = BlobLocEngine(task.repo_path, BlobLocCache(result_file(task, 'loc_cache.json')), counter)
+    span = METRICS.current_span()
+    span.total = len(commit_index)
+
+    # Failing commits leave the sample; they are reported like in write_effort_analysis
+    def measure(commit_ref):
+        try:
+            with deadline(commit_timeout, 'commit'):
+                loc_before, loc_after = loc_engine.commit_loc(commit_ref.parent, commit_ref.sha)
+        except DeadlineExceeded as error:
+            check_deadline()  # Once the stage itself is out of time, stop instead of skipping the rest
+            safe_print(f"Warning: Skipping commit {commit_ref.sha}: {str(error)}")
+            if manifest:
+                manifest.record_timeout('effort', commit_ref.sha)
+            raise
+        except Exception as error:
+            safe_print(f"Warning: Error processing commit {commit_ref.sha}: {str(error)}")
+            raise
+        return abs(loc_after - loc_before)
+
+    with NdjsonWriter(result_file(task, 'effort_sample.ndjson')) as writer:
+        def on_sample(commit_ref, stratum, tloc):
+            writer.write({
+                'commit_hash': commit_ref.sha,
+                'previous_commit_hash': commit_ref.parent,
+                'developer': commit_ref.developer,
+                'period': stratum.period,
+                'tloc': tloc
+            })
+            span.advance()
 
-        effort_analysis_file = os.path.join(repo_results_dir, f'{repo_name}_effort_analysis.json')
-        with open(effort_analysis_file, 'w') as f:
-            json.dump(effort_analysis, f, indent=2)
+        try:
+            estimates, stopped_because = sample_effort(
+                strata, measure, error_target, time_budget, confidence, on_sample
+            )
+        finally:
+            loc_engine.close()
+
+    developers = sorted(estimates.items(), key=lambda item: item[1]['estimated_tloc'], reverse=True)
+    atomic_write_json(result_file(task, 'effort_estimate.json'), {
+        'confidence': confidence,
+        'error_target': error_target,
+        'time_budget': time_budget,
+        'period': period,
+        'seed': seed,
+        'stopped_because': stopped_because,
+        'sampled_commits': sum(estimate['sampled_commits'] for estimate in estimates.values()),
+        'total_commits': sum(estimate['total_commits'] for estimate in estimates.values()),
+        'developers': [dict(developer=developer, **estimate) for developer, estimate in developers]
+    })
+    safe_print(f"Sampled effort of {task.repo_name}: stopped at {stopped_because}")
+    if manifest:
+        manifest.mark_stage_done('effort')
+
+def finish_repository(task, legacy_json=False, store=None, aggregates=None):
+    """
+    Last stage, run even after failures: report and drop the work directory.
+    Finished results are also added to aggregates, an EffortAggregates.
+    """
+    if task.skip:
+        safe_print(f"{task.url} is up to date, nothing to analyse")
+        return
 
-        safe_print(f"Processed {repo_name} successfully. Main branch: {main_branch}")
-    except subprocess.CalledProcessError as e:
-        safe_print(f"Error processing {url}: {e}")
-    except Exception as e:
-        safe_print(f"Unexpected error processing {url}: {e}")
+    try:
+        if task.error is None and legacy_json:
+            diffs = open_diff_store(result_file(task, 'diffs'))
+            if diffs:
+                with diffs:
+                    write_json_array(
+                        (with_diff_content(record, diffs, lazy=False)
+                         for record in iter_ndjson(result_file(task, 'diff_analysis.ndjson'))),
+                        result_file(task, 'diff_analysis.json')
+                    )
+            else:
+                ndjson_to_json(result_file(task, 'diff_analysis.ndjson'), result_file(task, 'diff_analysis.json'))
+            # A sampled run has no full effort analysis to export
+            if os.path.exists(result_file(task, 'effort_analysis.ndjson')):
+                ndjson_to_json(result_file(task, 'effort_analysis.ndjson'), result_file(task, 'effort_analysis.json'))
+
+        if task.error is None and store:
+            store.load_refactorings(task.repo_name, task.refactorings_file)
+
+        if task.error is None and aggregates:
+            aggregates.update_repo(task.results_dir, task.repo_name)
+            aggregates.save()
+
+        if task.error is None:
+            if task.manifest:
+                task.manifest.mark_completed(task.head)
+            safe_print(f"Processed {task.repo_name} successfully. Main branch: {task.main_branch}")
+        elif isinstance(task.error, (subprocess.CalledProcessError, DeadlineExceeded)):
+            safe_print(f"Error processing {task.url}: {task.error}")
+        else:
+            safe_print(f"Unexpected error processing {task.url}: {task.error}")
     finally:
-        if repo_path and os.path.exists(repo_path):
-            shutil.rmtree(repo_path)
-            safe_print(f"Cleaned up repository folder for {url}")
+        if task.repo_path and os.path.exists(task.repo_path):
+            shutil.rmtree(task.repo_path)
+            safe_print(f"Cleaned up repository folder for {task.url}")
+
+def queued_tasks(worker, mirrors, total_cores, total_heap_mb, rm_shards=None, rm_heap_mb=None):
+    """RepoTasks for the repositories worker claims from the shared queue, estimated one at a time."""
+    for url in worker.urls():
+        try:
+            job = estimate_repo(mirrors, url)
+        except Exception as e:
+            safe_print(f"Warning: Could not estimate {url}: {e}")
+            job = RepoJob(url)
+        yield RepoTask(url, job.plan(total_cores, total_heap_mb, rm_shards, rm_heap_mb))
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Mine refactorings, diffs and developer effort for the repositories in urls.txt.'
+    )
+    parser.add_argument(
+        '--queue', metavar='DB', default=None,
+        help='take repositories from this shared work queue (see work_queue.py) instead of urls.txt'
+    )
+    parser.add_argument(
+        '--collect', metavar='DIR', default=None,
+        help='with --queue, copy the results of every finished repository to DIR/<repo>'
+    )
+    parser.add_argument(
+        '--lease-seconds', type=float, default=600,
+        help='with --queue, how long a claimed repository stays leased without heartbeats'
+    )
+    parser.add_argument(
+        '--legacy-json', action='store_true',
+        help='also write the indented *_analysis.json files next to the NDJSON output'
+    )
+    parser.add_argument(
+        '--effort-sample', action='store_true',
+        help='estimate per-developer effort from a stratified sample of commits instead of measuring all'
+    )
+    parser.add_argument(
+        '--sample-error', type=float, default=0.1,
+        help='stop sampling once every developer total is within this relative error (default 0.1)'
+    )
+    parser.add_argument(
+        '--sample-budget', type=float, default=None,
+        help='stop sampling a repository after this many seconds'
+    )
+    parser.add_argument(
+        '--sample-confidence', type=float, default=0.95,
+        help='confidence level of the reported intervals'
+    )
+    parser.add_argument(
+        '--sample-period', choices=PERIODS, default='quarter',
+        help='length of the time periods commits are stratified by'
+    )
+    parser.add_argument(
+        '--sample-seed', type=int, default=None,
+        help='random seed, for a reproducible sample (recorded in the estimate file either way)'
+    )
+    parser.add_argument(
+        '--trace', metavar='PATH', default=None,
+        help='append a JSON line with timing and resource usage for every stage of every repository'
+    )
+    parser.add_argument(
+        '--prometheus', metavar='PATH', default=None,
+        help='keep per-stage totals in this Prometheus textfile (node_exporter textfile collector)'
+    )
+    parser.add_argument(
+        '--progress-interval', type=float, default=30,
+        help='seconds between progress/ETA lines of the diff and effort stages (0 disables them)'
+    )
+    parser.add_argument(
+        '--diff-store', action='store_true',
+        help='store each distinct diff once, compressed, in <repo>_diffs.pack; records keep diff_refs'
+    )
+    parser.add_argument(
+        '--aggregate', metavar='PATH', default=None,
+        help='keep per-developer, per-repo and per-period rollups in PATH, updated as repositories finish'
+    )
+    parser.add_argument(
+        '--sqlite', metavar='PATH', default=None,
+        help='also store all results in this SQLite database (see results_store.py for JSON export)'
+    )
+    parser.add_argument(
+        '--rm-shards', type=int, default=1,
+        help='at most this many history ranges mined by parallel RefactoringMiner JVMs per repository'
+    )
+    parser.add_argument(
+        '--rm-timeout', type=float, default=None,
+        help='seconds one RefactoringMiner JVM may run; slower ranges are split, single slow commits skipped'
+    )
+    parser.add_argument(
+        '--commit-timeout', type=float, default=None,
+        help='seconds the effort stage may spend counting one commit before skipping it'
+    )
+    parser.add_argument(
+        '--stage-timeout', metavar='STAGE=SECONDS', action='append', default=[],
+        help='time budget of one repository in a stage, e.g. mine=7200 (repeatable); '
+             'a repository that runs out fails and resumes from its last checkpoint next time'
+    )
+    parser.add_argument(
+        '--rm-heap-mb', type=int, default=None,
+        help='fixed Java heap (MB) for each RefactoringMiner JVM instead of the size-based estimate'
+    )
+    parser.add_argument(
+        '--cores', type=int, default=os.cpu_count() or 1,
+        help='CPU cores shared by all concurrently processed repositories'
+    )
+    parser.add_argument(
+        '--clone-workers', type=int, default=2,
+        help='repositories cloned or fetched in parallel ahead of mining'
+    )
+    parser.add_argument(
+        '--prefetch-mb', type=int, default=10240,
+        help='disk (MB) that prepared but not yet mined work directories may use'
+    )
+    parser.add_argument(
+        '--analysis-workers', type=int, default=1,
+        help='repositories analysed concurrently in each of the diff and effort stages'
+    )
+    parser.add_argument(
+        '--loc-backend', choices=['blob', 'worktree'], default='blob',
+        help="'blob' counts LOC from git objects; 'worktree' runs scc on checked-out git worktrees"
+    )
+    parser.add_argument(
+        '--loc-counter', choices=['scc', 'native'], default='scc',
+        help="'scc' runs bin/scc; 'native' counts lines in-process over a pool of --loc-workers processes"
+    )
+    parser.add_argument(
+        '--loc-workers', type=int, default=os.cpu_count() or 1,
+        help='worktrees measured in parallel by the worktree LOC backend'
+    )
+    parser.add_argument(
+        '--worktree-root', default=None,
+        help='directory for the LOC worktrees, e.g. a tmpfs such as /dev/shm'
+    )
+    parser.add_argument(
+        '--heap-mb', type=int, default=total_memory_mb() * 3 // 4,
+        help='total Java heap (MB) shared by all concurrent RefactoringMiner JVMs'
+    )
+    args = parser.parse_args()
+    try:
+        args.stage_timeout = {
+            stage: float(seconds) for stage, seconds in (item.split('=', 1) for item in args.stage_timeout)
+        }
+    except ValueError:
+        parser.error('--stage-timeout expects STAGE=SECONDS')
+    return args
 
 def main():
+    args = parse_args()
     urls_file = 'urls.txt'
     repos_dir = 'repos'
     results_dir = 'results'
+    mirrors_dir = 'mirrors'
 
     # Get token from environment variable for security
     token = os.getenv('GITHUB_TOKEN')
@@ -316,15 +705,82 @@ def main():
 
     os.makedirs(repos_dir, exist_ok=True)
     os.makedirs(results_dir, exist_ok=True)
+    METRICS.configure(args.trace, args.prometheus, args.progress_interval, safe_print)
+
+    mirrors = MirrorStore(mirrors_dir, token)
+    worker = None
+    if args.queue:
+        # Repositories are claimed one by one as the pipeline has room for them
+        worker = QueueWorker(WorkQueue(args.queue, args.lease_seconds), log=safe_print).start()
+        tasks = queued_tasks(worker, mirrors, args.cores, args.heap_mb, args.rm_shards, args.rm_heap_mb)
+    else:
+        # The same URL twice would make concurrent jobs share a work directory
+        urls = list(dict.fromkeys(read_urls(urls_file)))
+
+        # Cost estimates come from GitHub's API or from mirrors of earlier runs
+        jobs = estimate_repos(mirrors, urls, log=safe_print)
+        for job in jobs:
+            job.plan(args.cores, args.heap_mb, args.rm_shards, args.rm_heap_mb)
+        jobs.sort(key=lambda job: job.cost, reverse=True)
+        tasks = [RepoTask(job.url, job) for job in jobs]
+
+    # clone -> mine -> diff -> effort -> finish, linked by bounded queues.
+    # Clones run ahead of mining, up to --prefetch-mb of prepared work directories.
+    scheduler = ResourceScheduler(args.cores, args.heap_mb, log=safe_print)
+    write_stage = WriteStage().start()
+    loc_counter = NativeLocCounter(args.loc_workers) if args.loc_counter == 'native' else None
+    store = ResultsStore(args.sqlite) if args.sqlite else None
+    aggregates = EffortAggregates(args.aggregate) if args.aggregate else None
+    pipeline = Pipeline()
+    pipeline.add_stage(Stage(
+        'clone', lambda task: prepare_repository(task, repos_dir, results_dir, token, mirrors),
+        workers=args.clone_workers, budget=PrefetchBudget(args.prefetch_mb * 1024 * 1024),
+        timeout=args.stage_timeout.get('clone'), ordered=True  # Keep the largest-first order for mining
+    ))
+    pipeline.add_stage(ScheduledStage(
+        'mine', lambda task: mine_repository(task, task.job.cores, task.job.heap_per_jvm_mb, args.rm_timeout),
+        scheduler, timeout=args.stage_timeout.get('mine')
+    ))
+    pipeline.add_stage(Stage(
+        'diff', lambda task: write_diff_analysis(task, write_stage, store, args.diff_store),
+        workers=args.analysis_workers, timeout=args.stage_timeout.get('diff')
+    ))
+    if args.effort_sample:
+        def effort_stage(task):
+            write_effort_sample(
+                task, loc_counter, args.sample_error, args.sample_budget, args.sample_confidence,
+                args.sample_period, args.sample_seed, args.commit_timeout
+            )
+    else:
+        def effort_stage(task):
+            write_effort_analysis(
+                task, write_stage, args.loc_backend, args.loc_workers, args.worktree_root, loc_counter, store,
+                args.commit_timeout
+            )
+    pipeline.add_stage(Stage(
+        'effort', effort_stage, workers=args.analysis_workers, timeout=args.stage_timeout.get('effort')
+    ))
 
-    urls = read_urls(urls_file)
+    def finish_stage(task):
+        try:
+            finish_repository(task, args.legacy_json, store, aggregates)
+        finally:
+            if worker:
+                worker.finish(task.url, task.error, task.results_dir, args.collect)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        futures = [
-            executor.submit(process_repository, url, repos_dir, results_dir, token)
-            for url in urls
-        ]
-        concurrent.futures.wait(futures)
+    pipeline.add_stage(Stage('finish', finish_stage, always=True))
+
+    try:
+        pipeline.run(tasks)
+    finally:
+        if worker:
+            worker.stop()
+            worker.queue.close()
+    write_stage.stop()
+    if loc_counter:
+        loc_counter.close()
+    if store:
+        store.close()
 
     if os.path.exists(repos_dir):
         shutil.rmtree(repos_dir)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+
+STAGES = ['mine', 'diff', 'effort']
+
+def atomic_write_json(path, data):
+    """Replace path with data so a crash leaves either the old or the new file."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class RepoManifest:
+    """
+    Durable record of how far a repository got: which stages finished and,
+    inside the diff and effort stages, the last commit whose record is safely
+    on disk together with the byte offset of the output file at that point.
+    Completed runs also remember the head they analysed, so a later run only
+    needs to look at the commits after it.
+    """
+
+    def __init__(self, path, url=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'url': url, 'stages': {}, 'progress': {}, 'completed': False}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data.update(json.load(f))
+            except (IOError, ValueError):
+                pass
+
+    @property
+    def completed(self):
+        return self.data.get('completed', False)
+
+    def save(self):
+        with self.lock:
+            atomic_write_json(self.path, self.data)
+
+    def stage_done(self, stage):
+        return stage in self.data['stages']
+
+    def mark_stage_done(self, stage):
+        with self.lock:
+            self.data['stages'][stage] = {'finished_at': time.time()}
+            self.data['progress'].pop(stage, None)
+        self.save()
+
+    def _base_progress(self, stage):
+        """Where a stage starts from: nothing, or the end of earlier results."""
+        incremental = self.data.get('incremental')
+        if incremental and stage in incremental['offsets']:
+            return {'last_sha': None, 'offset': incremental['offsets'][stage]}
+        return None
+
+    def restart_from(self, stage):
+        """Forget stage and everything after it, e.g. when mining reruns."""
+        with self.lock:
+            for later in STAGES[STAGES.index(stage):]:
+                self.data['stages'].pop(later, None)
+                self.data['progress'].pop(later, None)
+                base = self._base_progress(later)
+                if base:
+                    self.data['progress'][later] = base
+            self.data['completed'] = False
+        self.save()
+
+    def mark_completed(self, head=None):
+        """Finish the run; head is the commit the results now cover."""
+        with self.lock:
+            self.data['completed'] = True
+            self.data['completed_at'] = time.time()
+            if head:
+                self.data['analysed_head'] = head
+            self.data.pop('incremental', None)
+        self.save()
+
+    @property
+    def analysed_head(self):
+        return self.data.get('analysed_head')
+
+    @property
+    def incremental_range(self):
+        """(base, head) of an incremental run in progress, or None."""
+        incremental = self.data.get('incremental')
+        if incremental:
+            return incremental['base'], incremental['head']
+        return None
+
+    def start_incremental(self, base, head, offsets):
+        """
+        Begin analysing base..head on top of complete results. offsets maps
+        the diff and effort stages to the current size of their output, so
+        new records are appended after the existing ones.
+        """
+        with self.lock:
+            self.data['incremental'] = {'base': base, 'head': head, 'offsets': offsets}
+            self.data['completed'] = False
+            self.data['stages'] = {}
+            self.data['progress'] = {stage: self._base_progress(stage) for stage in offsets}
+        self.save()
+
+    def record_timeout(self, stage, item):
+        """Remember a commit or commit range that stage skipped after it ran out of time."""
+        with self.lock:
+            timeouts = self.data.setdefault('timeouts', {}).setdefault(stage, [])
+            if item not in timeouts:
+                timeouts.append(item)
+        self.save()
+
+    def progress(self, stage):
+        """{'last_sha': ..., 'offset': ...} of the last checkpoint, or None."""
+        return self.data['progress'].get(stage)
+
+    def record_progress(self, stage, last_sha, offset):
+        with self.lock:
+            self.data['progress'][stage] = {'last_sha': last_sha, 'offset': offset}
+        self.save()
+
+    def resume_point(self, stage, commit_index):
+        """
+        Return (position in commit_index to continue from, output offset).
+        A checkpoint that does not match the index restarts the stage.
+        """
+        progress = self.progress(stage) or self._base_progress(stage)
+        if progress and progress['last_sha']:
+            for position, commit_ref in enumerate(commit_index):
+                if commit_ref.sha == progress['last_sha']:
+                    return position + 1, progress['offset']
+            progress = self._base_progress(stage)
+        if progress:
+            return 0, progress['offset']
+        return 0, None
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+from deadlines import finish_watched, start_watched
+
+PROMETHEUS_PREFIX = 'refactoring_effort'
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f'{hours}h{minutes:02d}m'
+    if minutes:
+        return f'{minutes}m{seconds:02d}s'
+    return f'{seconds}s'
+
+class Span:
+    """Measurements of one stage of one repository while it runs."""
+
+    def __init__(self, metrics, stage, repo):
+        self.metrics = metrics
+        self.stage = stage
+        self.repo = repo
+        self.total = None  # Commits expected, for progress and ETA
+        self.commits = 0
+        self.bytes_written = 0
+        self.child_cpu_s = 0.0
+        self.child_max_rss_kb = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.lock = threading.Lock()
+
+    def advance(self, count=1):
+        self.commits += count
+        self.metrics.report_progress(self)
+
+    def record_child(self, rusage):
+        """Attribute a finished child process (os.wait4 rusage) to this span."""
+        with self.lock:
+            self.child_cpu_s += rusage.ru_utime + rusage.ru_stime
+            self.child_max_rss_kb = max(self.child_max_rss_kb, rusage.ru_maxrss)
+
+class NullSpan(Span):
+    """Stands in when no span is open, so callers never need to check."""
+
+    def __init__(self):
+        super().__init__(None, None, None)
+
+    def advance(self, count=1):
+        self.commits += count
+
+class Metrics:
+    """
+    Per-stage timing and resource usage. Finished spans are appended to a
+    JSON-lines trace and summed into a Prometheus textfile; long stages
+    log a progress line with an ETA every progress_interval seconds.
+    """
+
+    def __init__(self):
+        self.trace_path = None
+        self.prometheus_path = None
+        self.progress_interval = 0
+        self.log = print
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.totals = {}
+
+    def configure(self, trace_path=None, prometheus_path=None, progress_interval=0, log=print):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.progress_interval = progress_interval
+        self.log = log
+
+    def current_span(self):
+        stack = getattr(self.local, 'spans', None)
+        return stack[-1] if stack else NullSpan()
+
+    @contextmanager
+    def span(self, stage, repo):
+        """Measure the enclosed block as stage of repo; nested spans are allowed."""
+        span = Span(self, stage, repo)
+        stack = self.local.__dict__.setdefault('spans', [])
+        stack.append(span)
+        cpu_start = time.thread_time()
+        children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            stack.pop()
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.finish(span, time.thread_time() - cpu_start, children_start, children, error)
+
+    def finish(self, span, cpu_s, children_start, children, error):
+        wall_s = time.monotonic() - span.started
+        # Children not waited for through run() are only known process-wide
+        child_cpu_s = span.child_cpu_s or (
+            children.ru_utime + children.ru_stime - children_start.ru_utime - children_start.ru_stime
+        )
+        record = {
+            'time': time.time(),
+            'stage': span.stage,
+            'repo': span.repo,
+            'wall_s': round(wall_s, 3),
+            'cpu_s': round(cpu_s, 3),
+            'child_cpu_s': round(child_cpu_s, 3),
+            'child_max_rss_kb': span.child_max_rss_kb or (
+                children.ru_maxrss if children.ru_maxrss > children_start.ru_maxrss else 0
+            ),
+            'commits': span.commits,
+            'commits_per_s': round(span.commits / wall_s, 3) if wall_s > 0 else None,
+            'bytes_written': span.bytes_written,
+            'error': repr(error) if error is not None else None
+        }
+        self.emit(record)
+
+    def observe(self, stage, repo, wall_s, commits=0, bytes_written=0):
+        """Record a measurement taken outside a span, e.g. the write stage's busy time."""
+        self.emit({
+            'time': time.time(), 'stage': stage, 'repo': repo, 'wall_s': round(wall_s, 3),
+            'cpu_s': 0.0, 'child_cpu_s': 0.0, 'child_max_rss_kb': 0, 'commits': commits,
+            'commits_per_s': round(commits / wall_s, 3) if wall_s > 0 else None,
+            'bytes_written': bytes_written, 'error': None
+        })
+
+    def emit(self, record):
+        with self.lock:
+            totals = self.totals.setdefault(record['stage'], {
+                'wall_s': 0.0, 'cpu_s': 0.0, 'child_cpu_s': 0.0, 'child_max_rss_kb': 0,
+                'commits': 0, 'bytes_written': 0, 'runs': 0, 'errors': 0
+            })
+            for key in ('wall_s', 'cpu_s', 'child_cpu_s', 'commits', 'bytes_written'):
+                totals[key] += record[key]
+            totals['child_max_rss_kb'] = max(totals['child_max_rss_kb'], record['child_max_rss_kb'])
+            totals['runs'] += 1
+            totals['errors'] += record['error'] is not None
+
+            if self.trace_path:
+                with open(self.trace_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+            if self.prometheus_path:
+                self.write_prometheus()
+
+    def write_prometheus(self):
+        """Rewrite the textfile for node_exporter's textfile collector."""
+        metrics = [
+            ('stage_wall_seconds_total', 'counter', 'Wall-clock seconds spent in the stage', 'wall_s', 1),
+            ('stage_cpu_seconds_total', 'counter', 'CPU seconds of the stage threads', 'cpu_s', 1),
+            ('stage_child_cpu_seconds_total', 'counter', 'CPU seconds of child processes', 'child_cpu_s', 1),
+            ('stage_child_max_rss_bytes', 'gauge', 'Peak RSS of a child process', 'child_max_rss_kb', 1024),
+            ('stage_commits_total', 'counter', 'Commits processed by the stage', 'commits', 1),
+            ('stage_bytes_written_total', 'counter', 'Result bytes written by the stage', 'bytes_written', 1),
+            ('stage_runs_total', 'counter', 'Repositories that went through the stage', 'runs', 1),
+            ('stage_errors_total', 'counter', 'Repositories that failed in the stage', 'errors', 1),
+        ]
+        lines = []
+        for name, kind, help_text, key, scale in metrics:
+            lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {kind}')
+            for stage, totals in sorted(self.totals.items()):
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{stage="{stage}"}} {totals[key] * scale}')
+
+        tmp_path = f'{self.prometheus_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
+
+    def report_progress(self, span):
+        if not self.progress_interval:
+            return
+        now = time.monotonic()
+        if now - span.last_report < self.progress_interval:
+            return
+        span.last_report = now
+        elapsed = now - span.started
+        rate = span.commits / elapsed if elapsed > 0 else 0
+        line = f"{span.repo} {span.stage}: {span.commits}"
+        if span.total:
+            line += f"/{span.total} commits ({100 * span.commits / span.total:.0f}%)"
+        else:
+            line += " commits"
+        line += f", {rate:.1f} commits/s"
+        if span.total and rate > 0:
+            line += f", ETA {format_duration((span.total - span.commits) / rate)}"
+        self.log(line)
+
+    def run(self, command, check=False, span=None, timeout=None, **kwargs):
+        """
+        subprocess.run() that also records the child's CPU time and peak RSS
+        on span (default: the current one). Meant for the heavy tools such as
+        RefactoringMiner. The process tree is killed after timeout seconds or
+        when the enclosing deadline runs out.
+        """
+        process, watch = start_watched(command, timeout, **kwargs)
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            finish_watched(process, watch)
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+        (span or self.current_span()).record_child(rusage)
+        finish_watched(process, watch)
+        if check and process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+        return subprocess.CompletedProcess(command, process.returncode)
+
+# Shared by every stage; main() points it at the output files
+METRICS = Metrics()
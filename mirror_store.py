@@ -0,0 +1,109 @@
+import os
+import re
+import base64
+import shutil
+import hashlib
+import subprocess
+import threading
+from urllib.parse import urlparse
+
+MIRRORS_DIR = 'mirrors'
+
+# Only branches and tags; GitHub's refs/pull/* would bloat every mirror
+FETCH_REFSPECS = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
+
+def git_auth_args(url, token):
+    """git -c options that authenticate against GitHub without putting the token in a URL."""
+    hostname = urlparse(url).hostname
+    if not token or not hostname or 'github.com' not in hostname:
+        return []
+    credentials = base64.b64encode(f'x-access-token:{token}'.encode()).decode()
+    return ['-c', f'http.extraHeader=Authorization: Basic {credentials}']
+
+def mirror_key(url):
+    """Stable, filesystem-safe directory name for a repository URL."""
+    parsed = urlparse(url)
+    name = f"{parsed.hostname or 'local'}_{parsed.path.strip('/')}"
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', name)
+    digest = hashlib.sha1(url.rstrip('/').encode()).hexdigest()[:8]
+    return f'{name}_{digest}'
+
+class MirrorStore:
+    """
+    Bare mirrors of remote repositories, keyed by URL, that persist across
+    runs. Existing mirrors are refreshed with an incremental fetch and work
+    directories are cheap clones that borrow the mirror's objects.
+    """
+
+    def __init__(self, root=MIRRORS_DIR, token=None):
+        self.root = root
+        self.token = token
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _lock(self, key):
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def mirror_path(self, url):
+        return os.path.join(self.root, mirror_key(url) + '.git')
+
+    def _git(self, args, cwd=None, url=None):
+        env = os.environ.copy()
+        env['GIT_TERMINAL_PROMPT'] = '0'  # Disable Git credential prompt
+        auth_args = git_auth_args(url, self.token) if url else []
+        try:
+            subprocess.run(
+                ['git'] + auth_args + args,
+                cwd=cwd,
+                check=True,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE  # Capture stderr to avoid exposing token in logs
+            )
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr.decode(errors='replace')
+            if self.token:
+                error_msg = error_msg.replace(self.token, '***')
+            raise Exception(f"git {args[0]} failed: {error_msg}")
+
+    def ensure_mirror(self, url):
+        """Return the path of an up-to-date bare mirror of url."""
+        path = self.mirror_path(url)
+        with self._lock(path):
+            if os.path.exists(path):
+                self._git(['fetch', '--prune', '--quiet', 'origin'], cwd=path, url=url)
+                return path
+
+            tmp_path = f'{path}.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            self._git(['clone', '--bare', '--quiet', url, tmp_path], url=url)
+
+            # A bare clone has no fetch refspec; add one so later fetches update in place
+            for index, refspec in enumerate(FETCH_REFSPECS):
+                option = '--add' if index else '--replace-all'
+                self._git(['config', option, 'remote.origin.fetch', refspec], cwd=tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    def head(self, url):
+        """Commit at the tip of the mirror's default branch."""
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=self.mirror_path(url),
+            universal_newlines=True
+        ).strip()
+
+    def create_workdir(self, url, target_path, refresh=True):
+        """
+        Check out a work directory that borrows objects from the full mirror.
+        Pass refresh=False if the mirror was just fetched.
+        """
+        mirror_path = self.ensure_mirror(url) if refresh else self.mirror_path(url)
+        if os.path.exists(target_path):
+            shutil.rmtree(target_path)
+        self._git(['clone', '--shared', '--quiet', os.path.abspath(mirror_path), target_path])
+        return target_path
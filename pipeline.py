@@ -0,0 +1,304 @@
+import os
+import time
+import queue
+import threading
+from metrics import METRICS
+from deadlines import deadline
+
+# Marks the end of the task stream on a queue
+END = object()
+
+class RepoTask:
+    """State of one repository as it moves through the pipeline stages."""
+
+    def __init__(self, url, job=None):
+        self.url = url
+        self.job = job
+        self.repo_path = None
+        self.repo_name = None
+        self.results_dir = None
+        self.main_branch = None
+        self.head = None
+        self.since = None  # Set when only commits after an earlier run are analysed
+        self.refactorings_file = None
+        self.commit_index = None
+        self.manifest = None
+        self.workdir_bytes = 0
+        self.error = None
+        self.failed_stage = None
+        self.skip = False  # Nothing to do; later stages pass the task through
+
+def directory_size(path):
+    """Bytes used by the files under path, without following symlinks."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class PrefetchBudget:
+    """
+    Caps the disk held by work directories that are prepared but not yet
+    picked up by the next stage. One task is always allowed through so a
+    single oversized repository cannot stall the pipeline.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.held = {}
+        self.condition = threading.Condition()
+
+    def wait_for_room(self):
+        with self.condition:
+            while self.held and self.used_bytes >= self.max_bytes:
+                self.condition.wait()
+
+    def hold(self, task, nbytes):
+        with self.condition:
+            self.held[id(task)] = nbytes
+            self.used_bytes += nbytes
+
+    def release(self, task):
+        with self.condition:
+            self.used_bytes -= self.held.pop(id(task), 0)
+            self.condition.notify_all()
+
+class Stage:
+    """
+    Run func(task) on worker threads between two bounded queues. An ordered
+    stage passes tasks on in the order it received them, so the order the
+    feeder chose survives stages whose tasks finish at different speeds.
+    """
+
+    def __init__(self, name, func, workers=1, always=False, budget=None, timeout=None, ordered=False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.always = always  # Also run for tasks that failed earlier (cleanup)
+        self.budget = budget  # Limits how far this stage may run ahead of the next
+        self.timeout = timeout  # Seconds one task may spend in this stage
+        self.ordered = ordered
+        self.upstream_budget = None
+        self.inbox = None
+        self.outbox = None
+        self.alive = 0
+        self.lock = threading.Lock()
+        self.take_lock = threading.Lock()
+        self.emitted = threading.Condition()
+        self.taken = 0
+        self.next_out = 0
+        self.finished = {}
+
+    def _process(self, task):
+        if self.upstream_budget:
+            self.upstream_budget.release(task)
+        if (task.error is not None or task.skip) and not self.always:
+            return
+        if self.budget:
+            self.budget.wait_for_room()
+        try:
+            with METRICS.span(self.name, task.repo_name or task.url) as span, deadline(self.timeout, self.name):
+                self.func(task)
+                span.repo = task.repo_name or task.url
+        except Exception as e:
+            if task.error is None:
+                task.error = e
+                task.failed_stage = self.name
+
+    def _emit(self, task):
+        # The budget is charged when the task is handed on, so finished tasks
+        # parked behind a slower one do not keep the slower one from starting
+        if self.budget:
+            self.budget.hold(task, task.workdir_bytes)
+        self.outbox.put(task)
+
+    def _emit_in_order(self, number, task):
+        """Hand on every finished task whose turn has come, then wait for this one's."""
+        with self.emitted:
+            self.finished[number] = task
+            while self.next_out in self.finished:
+                self._emit(self.finished.pop(self.next_out))
+                self.next_out += 1
+            self.emitted.notify_all()
+            # Waiting here keeps at most one parked task per worker
+            while self.next_out <= number:
+                self.emitted.wait()
+
+    def _work(self):
+        while True:
+            with self.take_lock:
+                task = self.inbox.get()
+                number = self.taken
+                self.taken += 1
+            if task is END:
+                self.inbox.put(END)  # Let sibling workers see it too
+                break
+            self._process(task)
+            if self.ordered:
+                self._emit_in_order(number, task)
+            else:
+                self._emit(task)
+        with self.lock:
+            self.alive -= 1
+            if self.alive == 0:
+                self.outbox.put(END)
+
+    def start(self):
+        self.alive = self.workers
+        threads = []
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+class ScheduledStage(Stage):
+    """A stage whose tasks run through a ResourceScheduler instead of fixed workers."""
+
+    def __init__(self, name, func, scheduler, always=False, timeout=None):
+        super().__init__(name, func, always=always, timeout=timeout)
+        self.scheduler = scheduler
+
+    def _feed(self):
+        while True:
+            task = self.inbox.get()
+            if task is END:
+                break
+            if (task.error is not None or task.skip) and not self.always:
+                if self.upstream_budget:
+                    self.upstream_budget.release(task)
+                self.handoff.put(task)
+                continue
+            task.job.task = task
+            self.scheduler.submit(task.job)
+        self.scheduler.close()
+
+    def _run_job(self, job):
+        self._process(job.task)
+        # Hand off without blocking so the job's cores and heap are freed now
+        self.handoff.put(job.task)
+
+    def _serve(self):
+        self.scheduler.serve(self._run_job)
+        self.handoff.put(END)
+
+    def _forward(self):
+        while True:
+            task = self.handoff.get()
+            self.outbox.put(task)
+            if task is END:
+                break
+
+    def start(self):
+        self.handoff = queue.Queue()
+        threads = []
+        for target in (self._feed, self._serve, self._forward):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+class WriteStage:
+    """
+    One thread that owns the result writers, fed through a bounded queue, so
+    analysis threads do not wait on disk and memory stays bounded.
+    """
+
+    def __init__(self, queue_size=1000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.errors = {}
+        self.thread = None
+        self.busy_s = 0.0
+        self.records = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+        return self
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is END:
+                break
+            writer, payload = item
+            started = time.monotonic()
+            try:
+                if isinstance(payload, threading.Event):
+                    writer.close()
+                elif id(writer) not in self.errors:
+                    writer.write(payload)
+                    self.records += 1
+            except Exception as e:
+                self.errors[id(writer)] = e
+            finally:
+                self.busy_s += time.monotonic() - started
+                if isinstance(payload, threading.Event):
+                    payload.set()
+
+    def write(self, writer, record):
+        self.queue.put((writer, record))
+
+    def close(self, writer):
+        """Wait until everything queued for writer is written, then close it."""
+        done = threading.Event()
+        self.queue.put((writer, done))
+        done.wait()
+        error = self.errors.pop(id(writer), None)
+        if error is not None:
+            raise error
+
+    def stop(self):
+        self.queue.put(END)
+        self.thread.join()
+        METRICS.observe('write', None, self.busy_s, self.records)
+
+class Pipeline:
+    """
+    Stages linked by bounded queues, so that e.g. the next repositories are
+    cloned while the current one is still being mined.
+    """
+
+    def __init__(self, queue_size=2):
+        self.queue_size = queue_size
+        self.stages = []
+
+    def add_stage(self, stage):
+        if self.stages:
+            stage.upstream_budget = self.stages[-1].budget
+        self.stages.append(stage)
+        return stage
+
+    def run(self, tasks):
+        """Push tasks through every stage and return them once all are done."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        queues[-1] = queue.Queue()  # Finished tasks are only collected
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage.inbox = queues[index]
+            stage.outbox = queues[index + 1]
+            threads += stage.start()
+
+        def feed():
+            for task in tasks:
+                queues[0].put(task)
+            queues[0].put(END)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        finished = []
+        while True:
+            task = queues[-1].get()
+            if task is END:
+                break
+            finished.append(task)
+
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        return finished
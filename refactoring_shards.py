@@ -0,0 +1,159 @@
+import os
+import json
+import shutil
+import subprocess
+import concurrent.futures
+from metrics import METRICS
+from deadlines import DeadlineExceeded, check_deadline, current_deadlines, inherited_deadlines
+from result_streams import iter_refactoring_commits
+
+REFACTORING_MINER_PATH = os.path.join('bin', 'RefactoringMiner')
+
+def refactoring_miner_env(heap_mb=None):
+    """Environment for a RefactoringMiner JVM, with an optional -Xmx budget."""
+    env = os.environ.copy()
+    if heap_mb:
+        env['JAVA_OPTS'] = f"{env.get('JAVA_OPTS', '')} -Xmx{int(heap_mb)}m".strip()
+    return env
+
+def shard_ranges(repo_path, branch, shard_count, since=None):
+    """
+    Split the first-parent history of branch into up to shard_count
+    (start, end) ranges. Each range covers start..end (start excluded), so
+    together they cover every commit reachable from the branch tip, or only
+    those after since when it is given.
+    """
+    command = ['git', 'rev-list', '--first-parent', '--reverse', branch]
+    if since:
+        command[-1] = f'{since}..{branch}'
+    output = subprocess.check_output(command, cwd=repo_path, universal_newlines=True)
+    first_parent = ([since] if since else []) + output.split()
+    if len(first_parent) < 2:
+        return []
+
+    shard_count = max(1, min(shard_count, len(first_parent) - 1))
+    last = len(first_parent) - 1
+    boundaries = sorted({round(i * last / shard_count) for i in range(shard_count + 1)})
+    return [
+        (first_parent[start], first_parent[end])
+        for start, end in zip(boundaries, boundaries[1:])
+    ]
+
+def create_shard_worktree(repo_path, shard_path):
+    """Cheap private clone for one shard; objects are shared with repo_path."""
+    if os.path.exists(shard_path):
+        shutil.rmtree(shard_path)
+    subprocess.run(
+        ['git', 'clone', '--shared', '--no-checkout', '--quiet', repo_path, shard_path],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return shard_path
+
+def run_shard(repo_path, shard_path, start_commit, end_commit, output_file, heap_mb=None, span=None,
+              timeout=None):
+    create_shard_worktree(repo_path, shard_path)
+    command = [
+        REFACTORING_MINER_PATH,
+        '-bc', shard_path, start_commit, end_commit,
+        '-json', output_file
+    ]
+    METRICS.run(command, check=True, span=span, timeout=timeout, env=refactoring_miner_env(heap_mb))
+    return output_file
+
+def split_range(repo_path, start_commit, end_commit):
+    """Two halves of start..end along the first-parent chain, or None for a single commit."""
+    first_parent = subprocess.check_output(
+        ['git', 'rev-list', '--first-parent', '--reverse', f'{start_commit}..{end_commit}'],
+        cwd=repo_path,
+        universal_newlines=True
+    ).split()
+    if len(first_parent) < 2:
+        return None
+    middle = first_parent[len(first_parent) // 2 - 1]
+    return (start_commit, middle), (middle, end_commit)
+
+def mine_range(repo_path, shard_path, start_commit, end_commit, output_file, heap_mb=None, span=None,
+               timeout=None, on_timeout=None):
+    """
+    Mine start..end and return the output files. A range that runs past
+    timeout is split in half and retried; a single commit that still times
+    out is skipped and reported as on_timeout('start..end').
+    """
+    try:
+        return [run_shard(repo_path, shard_path, start_commit, end_commit, output_file, heap_mb, span, timeout)]
+    except DeadlineExceeded:
+        check_deadline()  # Splitting is pointless once the stage itself is out of time
+        halves = split_range(repo_path, start_commit, end_commit)
+        if halves is None:
+            if on_timeout:
+                on_timeout(f'{start_commit}..{end_commit}')
+            return []
+        base, _ = os.path.splitext(output_file)
+        output_files = []
+        for index, (start, end) in enumerate(halves):
+            output_files += mine_range(
+                repo_path, shard_path, start, end, f'{base}_{index}.json', heap_mb, span, timeout, on_timeout
+            )
+        return output_files
+
+def merge_refactoring_files(refactoring_files, output_file):
+    """Stream RefactoringMiner outputs into one {'commits': [...]} file, dropping duplicates."""
+    seen = set()
+    with open(output_file, 'w', encoding='utf-8') as out:
+        out.write('{\n"commits":[')
+        first = True
+        for refactoring_file in refactoring_files:
+            if not os.path.exists(refactoring_file):
+                continue
+            for commit_info in iter_refactoring_commits(refactoring_file):
+                if commit_info.get('sha1') in seen:
+                    continue
+                seen.add(commit_info.get('sha1'))
+                out.write('' if first else ',')
+                out.write(json.dumps(commit_info))
+                first = False
+        out.write(']\n}')
+    return len(seen)
+
+def run_sharded_refactoring_miner(repo_path, output_file, branch, shard_count, heap_mb=None, since=None,
+                                  timeout=None, on_timeout=None):
+    """
+    Run RefactoringMiner's between-commits mode over shard_count ranges of
+    branch (after since, if given) in parallel JVMs, each on its own clone
+    with heap_mb of heap, and merge the results into output_file. A shard
+    that takes longer than timeout seconds is retried in smaller ranges.
+    """
+    ranges = shard_ranges(repo_path, branch, shard_count, since)
+    shards_dir = f'{os.path.normpath(repo_path)}.shards'
+    os.makedirs(shards_dir, exist_ok=True)
+    # Shards run on pool threads but count toward the caller's stage and its deadline
+    span = METRICS.current_span()
+    deadlines = current_deadlines()
+
+    def mine_shard(index, start_commit, end_commit):
+        with inherited_deadlines(deadlines):
+            return mine_range(
+                repo_path,
+                os.path.join(shards_dir, f'shard_{index}'),
+                start_commit,
+                end_commit,
+                os.path.abspath(os.path.join(shards_dir, f'shard_{index}.json')),
+                heap_mb,
+                span,
+                timeout,
+                on_timeout
+            )
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(ranges))) as executor:
+            futures = [
+                executor.submit(mine_shard, index, start_commit, end_commit)
+                for index, (start_commit, end_commit) in enumerate(ranges)
+            ]
+            shard_files = [path for future in futures for path in future.result()]
+
+        return merge_refactoring_files(shard_files, output_file)
+    finally:
+        shutil.rmtree(shards_dir, ignore_errors=True)
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+from collections import namedtuple
+from git_commits import iter_commits
+
+# Compact per-commit entry shared by the diff and effort stages
+CommitRef = namedtuple('CommitRef', ['sha', 'parent', 'developer'])
+
+CHUNK_SIZE = 1 << 16
+
+def iter_refactoring_commits(refactorings_file, chunk_size=CHUNK_SIZE):
+    """
+    Yield the entries of RefactoringMiner's {"commits": [...]} output one at
+    a time, so only a single commit is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(refactorings_file, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = -1
+        while pos < 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            key_pos = buffer.find('"commits"')
+            if key_pos >= 0:
+                pos = buffer.find('[', key_pos)
+
+        buffer = buffer[pos + 1:]
+        eof = False
+        while True:
+            stripped = buffer.lstrip(' \t\r\n,')
+            if stripped.startswith(']'):
+                return
+            if stripped:
+                try:
+                    commit_info, end = decoder.raw_decode(stripped)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield commit_info
+                    buffer = stripped[end:]
+                    continue
+            if eof:
+                return
+            # Read at least as much as is buffered so huge entries stay linear
+            chunk = f.read(max(chunk_size, len(stripped)))
+            eof = not chunk
+            buffer = stripped + chunk
+
+def iter_refactoring_shas(refactorings_file):
+    for commit_info in iter_refactoring_commits(refactorings_file):
+        yield commit_info['sha1']
+
+def build_commit_index(repo_path, refactorings_file):
+    """
+    Return a CommitRef for every refactoring commit that has a parent, in
+    RefactoringMiner order. Only metadata is read from git here.
+    """
+    commit_index = []
+    for commit in iter_commits(repo_path, iter_refactoring_shas(refactorings_file), patches=False):
+        if not commit['parents']:
+            continue
+        commit_index.append(CommitRef(
+            sys.intern(commit['hash']),
+            sys.intern(commit['parents'][0]),
+            sys.intern(commit['author_name'])
+        ))
+    return commit_index
+
+class NdjsonWriter:
+    """
+    Write one JSON record per line, flushing as records arrive. With
+    on_checkpoint, every checkpoint_every records the file is synced and
+    on_checkpoint(last_record, offset) is called; resume_offset truncates
+    an existing file back to such a checkpoint and appends from there.
+    """
+
+    def __init__(self, path, append=False, resume_offset=None, on_checkpoint=None, checkpoint_every=100):
+        self.path = path
+        if resume_offset is not None and os.path.exists(path):
+            self.file = open(path, 'a', encoding='utf-8')
+            self.file.truncate(resume_offset)
+        else:
+            self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self.count = 0
+        self.on_checkpoint = on_checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.last_record = None
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n')
+        self.file.flush()
+        self.count += 1
+        self.last_record = record
+        if self.on_checkpoint and self.count % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.on_checkpoint is None or self.last_record is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.on_checkpoint(self.last_record, self.file.tell())
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def iter_ndjson(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def write_json_array(records, json_path, indent=2):
+    """Write records as the legacy indented JSON array, one record at a time."""
+    pad = ' ' * indent
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for index, record in enumerate(records):
+            f.write(f',\n{pad}' if index else f'\n{pad}')
+            f.write(json.dumps(record, indent=indent, ensure_ascii=False).replace('\n', f'\n{pad}'))
+        f.write('\n]' if f.tell() > 1 else ']')
+
+def ndjson_to_json(ndjson_path, json_path):
+    """Write the legacy indented JSON array without loading every record."""
+    write_json_array(iter_ndjson(ndjson_path), json_path)
@@ -0,0 +1,266 @@
+"""
+SQLite store for the analysis results of every repository.
+
+    python results_store.py results/results.db --export exported/
+
+writes the legacy <repo>_diff_analysis.json and <repo>_effort_analysis.json
+files for every repository in the store.
+"""
+import os
+import sqlite3
+import argparse
+import threading
+from diff_store import open_diff_store
+from result_streams import iter_refactoring_commits, write_json_array
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS commits (
+    repo TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    previous_commit_hash TEXT,
+    developer TEXT,
+    PRIMARY KEY (repo, commit_hash)
+);
+CREATE TABLE IF NOT EXISTS file_diffs (
+    repo TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    insertions INTEGER,
+    deletions INTEGER,
+    diff_content TEXT,
+    diff_ref TEXT,
+    PRIMARY KEY (repo, commit_hash, filename)
+);
+CREATE TABLE IF NOT EXISTS effort (
+    repo TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    previous_commit_hash TEXT,
+    developer TEXT,
+    loc_before INTEGER,
+    loc_after INTEGER,
+    tloc INTEGER,
+    PRIMARY KEY (repo, commit_hash)
+);
+CREATE TABLE IF NOT EXISTS refactorings (
+    repo TEXT NOT NULL,
+    commit_hash TEXT NOT NULL,
+    type TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS commits_hash ON commits (commit_hash);
+CREATE INDEX IF NOT EXISTS commits_developer ON commits (developer);
+CREATE INDEX IF NOT EXISTS file_diffs_hash ON file_diffs (commit_hash);
+CREATE INDEX IF NOT EXISTS file_diffs_filename ON file_diffs (filename);
+CREATE INDEX IF NOT EXISTS effort_hash ON effort (commit_hash);
+CREATE INDEX IF NOT EXISTS effort_developer ON effort (developer);
+CREATE INDEX IF NOT EXISTS refactorings_commit ON refactorings (repo, commit_hash);
+CREATE INDEX IF NOT EXISTS refactorings_type ON refactorings (type);
+'''
+
+# Records buffered per writer before they go to SQLite in one transaction
+BATCH_SIZE = 500
+
+class ResultsStore:
+    """
+    One SQLite database (WAL mode) shared by all repositories. A single
+    connection is guarded by a lock; rows are upserted, so records written
+    again after a resume replace the earlier copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(file_diffs)')]
+        if 'diff_ref' not in columns:
+            self.connection.execute('ALTER TABLE file_diffs ADD COLUMN diff_ref TEXT')
+        self.connection.commit()
+
+    def insert_diffs(self, repo, records):
+        commits = []
+        files = []
+        for record in records:
+            commits.append((repo, record['commit_hash'], record['previous_commit_hash'], None))
+            for filename, stats in record['diff_stats'].items():
+                files.append((
+                    repo, record['commit_hash'], filename,
+                    stats['insertions'], stats['deletions'],
+                    record.get('diff_content', {}).get(filename),
+                    record.get('diff_refs', {}).get(filename)
+                ))
+        with self.lock, self.connection:
+            self._upsert_commits(commits)
+            self.connection.executemany(
+                '''INSERT OR REPLACE INTO file_diffs
+                   (repo, commit_hash, filename, insertions, deletions, diff_content, diff_ref)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''', files
+            )
+
+    def insert_effort(self, repo, records):
+        rows = [
+            (repo, record['commit_hash'], record['previous_commit_hash'], record['developer'],
+             record['loc_before'], record['loc_after'], record['tloc'])
+            for record in records
+        ]
+        with self.lock, self.connection:
+            self._upsert_commits([row[:4] for row in rows])
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO effort VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+            )
+
+    def _upsert_commits(self, rows):
+        self.connection.executemany(
+            '''INSERT INTO commits VALUES (?, ?, ?, ?)
+               ON CONFLICT (repo, commit_hash) DO UPDATE SET
+                   previous_commit_hash = COALESCE(excluded.previous_commit_hash, previous_commit_hash),
+                   developer = COALESCE(excluded.developer, developer)''',
+            rows
+        )
+
+    def load_refactorings(self, repo, refactorings_file):
+        """Replace the repository's refactorings with those in a RefactoringMiner output file."""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM refactorings WHERE repo = ?', (repo,))
+            batch = []
+            for commit_info in iter_refactoring_commits(refactorings_file):
+                for refactoring in commit_info.get('refactorings', []):
+                    batch.append((repo, commit_info['sha1'], refactoring.get('type'),
+                                  refactoring.get('description')))
+                if len(batch) >= BATCH_SIZE:
+                    self.connection.executemany('INSERT INTO refactorings VALUES (?, ?, ?, ?)', batch)
+                    batch = []
+            self.connection.executemany('INSERT INTO refactorings VALUES (?, ?, ?, ?)', batch)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def repos(self):
+        return [row[0] for row in self.query('SELECT DISTINCT repo FROM commits ORDER BY repo')]
+
+    def iter_diff_records(self, repo, diffs=None):
+        """
+        Yield diff records of a repository in the analysis output format.
+        Diffs kept in a DiffStore are read from diffs when it is given.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            '''SELECT c.commit_hash, c.previous_commit_hash, f.filename, f.insertions, f.deletions,
+                      f.diff_content, f.diff_ref
+               FROM commits c LEFT JOIN file_diffs f ON f.repo = c.repo AND f.commit_hash = c.commit_hash
+               WHERE c.repo = ? ORDER BY c.rowid, f.rowid''',
+            (repo,)
+        )
+        record = None
+        for commit_hash, previous_commit_hash, filename, insertions, deletions, diff_content, diff_ref in cursor:
+            if record is None or record['commit_hash'] != commit_hash:
+                if record is not None:
+                    yield record
+                record = {
+                    'commit_hash': commit_hash,
+                    'previous_commit_hash': previous_commit_hash,
+                    'diff_stats': {},
+                    'diff_content': {}
+                }
+            if filename is not None:
+                record['diff_stats'][filename] = {'insertions': insertions, 'deletions': deletions}
+                if diff_content is None and diff_ref and diffs:
+                    diff_content = diffs.get(diff_ref)
+                record['diff_content'][filename] = diff_content
+        if record is not None:
+            yield record
+
+    def iter_effort_records(self, repo):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            '''SELECT commit_hash, previous_commit_hash, developer, loc_before, loc_after, tloc
+               FROM effort WHERE repo = ? ORDER BY rowid''',
+            (repo,)
+        )
+        for commit_hash, previous_commit_hash, developer, loc_before, loc_after, tloc in cursor:
+            yield {
+                'commit_hash': commit_hash,
+                'previous_commit_hash': previous_commit_hash,
+                'developer': developer,
+                'loc_before': loc_before,
+                'loc_after': loc_after,
+                'tloc': tloc
+            }
+
+    def export_json(self, repo, output_dir, results_dir='results'):
+        """Write the legacy JSON files of one repository, with diffs inline."""
+        os.makedirs(output_dir, exist_ok=True)
+        diffs = open_diff_store(os.path.join(results_dir, repo, f'{repo}_diffs'))
+        try:
+            with self.lock:
+                write_json_array(self.iter_diff_records(repo, diffs),
+                                 os.path.join(output_dir, f'{repo}_diff_analysis.json'))
+                write_json_array(self.iter_effort_records(repo),
+                                 os.path.join(output_dir, f'{repo}_effort_analysis.json'))
+        finally:
+            if diffs:
+                diffs.close()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class StoreWriter:
+    """
+    Wraps a result writer and also sends its records to a ResultsStore in
+    batches. Records written again after a resume simply replace their rows.
+    A checkpoint of the wrapped writer should flush the batch first.
+    """
+
+    def __init__(self, writer, store, repo, kind):
+        self.writer = writer
+        self.store = store
+        self.repo = repo
+        self.insert = store.insert_diffs if kind == 'diff' else store.insert_effort
+        self.batch = []
+
+    def write(self, record):
+        # Batched before the wrapped write, which may checkpoint this very record
+        self.batch.append(record)
+        self.writer.write(record)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.insert(self.repo, self.batch)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Export analysis results from the SQLite store.')
+    parser.add_argument('database', help='path of the results database')
+    parser.add_argument('--export', metavar='DIR', required=True,
+                        help='directory for the <repo>_*_analysis.json files')
+    parser.add_argument('--repo', action='append', help='only export this repository (repeatable)')
+    parser.add_argument('--results-dir', default='results',
+                        help='where the per-repo diff stores live, for results stored with --diff-store')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.database)
+    try:
+        for repo in args.repo or store.repos():
+            store.export_json(repo, args.export, args.results_dir)
+            print(f"Exported {repo}")
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import math
+import time
+import subprocess
+import threading
+import concurrent.futures
+import urllib.request
+from urllib.parse import parse_qs, urlencode, urlparse
+
+MIN_HEAP_MB = 1024
+# Rough RefactoringMiner heap needs, fitted so apache/camel lands near the
+# 14 GB it needed in practice
+HEAP_MB_PER_COMMIT = 0.125
+HEAP_MB_PER_PACK_MB = 2
+COMMITS_PER_SHARD = 5000
+
+GITHUB_API = 'https://api.github.com'
+
+def total_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 8192
+
+class RepoJob:
+    """A repository waiting to be processed, with its estimated cost and budget."""
+
+    def __init__(self, url, commits=0, pack_mb=0):
+        self.url = url
+        self.commits = commits
+        self.pack_mb = pack_mb
+        self.cores = 1
+        self.heap_mb = MIN_HEAP_MB
+        self.task = None  # Pipeline state attached while the job is scheduled
+
+    @property
+    def cost(self):
+        return self.commits + self.pack_mb * 10
+
+    @property
+    def heap_per_jvm_mb(self):
+        return self.heap_mb // self.cores
+
+    def plan(self, total_cores, total_heap_mb, max_shards=None, heap_per_jvm_mb=None):
+        """Pick the number of RefactoringMiner shards and the heap they share."""
+        shards = max(1, math.ceil(self.commits / COMMITS_PER_SHARD))
+        if max_shards:
+            shards = min(shards, max_shards)
+        self.cores = max(1, min(shards, total_cores))
+
+        if heap_per_jvm_mb:
+            heap_mb = heap_per_jvm_mb * self.cores
+        else:
+            heap_mb = MIN_HEAP_MB + self.commits * HEAP_MB_PER_COMMIT + self.pack_mb * HEAP_MB_PER_PACK_MB
+            heap_mb = max(heap_mb, MIN_HEAP_MB * self.cores)
+        self.heap_mb = int(min(heap_mb, total_heap_mb))
+        return self
+
+def github_get(url, headers, timeout):
+    """(decoded JSON body, {rel: url} of the Link header) of one API request."""
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+        links = dict(
+            (rel, link) for link, rel in re.findall(r'<([^>]*)>;\s*rel="([^"]*)"', response.headers.get('Link', ''))
+        )
+        return json.load(response), links
+
+def github_estimate(url, token=None, api_url=GITHUB_API, timeout=30):
+    """
+    (commits on the default branch, repository size in MB) of a GitHub URL
+    from two API requests: the repository's size and the last page number
+    of its commits listed one per page. None for other hosts.
+    """
+    parsed = urlparse(url)
+    if not parsed.hostname or 'github.com' not in parsed.hostname:
+        return None
+    path = parsed.path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    headers = {'Accept': 'application/vnd.github+json'}
+    if token:
+        headers['Authorization'] = f'token {token}'
+
+    repo, _ = github_get(f'{api_url}/repos/{path}', headers, timeout)
+    query = urlencode({'per_page': 1, 'sha': repo['default_branch']})
+    first_page, links = github_get(f'{api_url}/repos/{path}/commits?{query}', headers, timeout)
+    if 'last' in links:
+        commits = int(parse_qs(urlparse(links['last']).query)['page'][0])
+    else:
+        commits = len(first_page)
+    return commits, repo['size'] // 1024
+
+def estimate_repo(mirrors, url):
+    """
+    Commit count and pack size of url. A mirror left by an earlier run is
+    read as it is; otherwise GitHub's API answers without downloading
+    anything. Only when that fails is the full mirror fetched early, which
+    the clone stage needs anyway.
+    """
+    if not os.path.exists(mirrors.mirror_path(url)):
+        try:
+            estimate = github_estimate(url, mirrors.token)
+        # URLError and timeouts are OSErrors
+        except (OSError, ValueError, KeyError):
+            estimate = None
+        if estimate:
+            return RepoJob(url, *estimate)
+        mirrors.ensure_mirror(url)
+
+    mirror_path = mirrors.mirror_path(url)
+    commits = subprocess.check_output(
+        ['git', 'rev-list', '--count', 'HEAD'],
+        cwd=mirror_path,
+        universal_newlines=True
+    )
+    count_objects = subprocess.check_output(
+        ['git', 'count-objects', '-v'],
+        cwd=mirror_path,
+        universal_newlines=True
+    )
+    pack_kb = 0
+    for line in count_objects.splitlines():
+        if line.startswith('size-pack:'):
+            pack_kb = int(line.split(':')[1])
+    return RepoJob(url, int(commits.strip() or 0), pack_kb // 1024)
+
+def estimate_repos(mirrors, urls, workers=4, log=print):
+    jobs = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(estimate_repo, mirrors, url): url for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            try:
+                jobs.append(future.result())
+            except Exception as e:
+                log(f"Warning: Could not estimate {url}: {e}")
+                jobs.append(RepoJob(url))
+    return jobs
+
+class ResourceScheduler:
+    """
+    Run jobs concurrently within a budget of CPU cores and JVM heap. Jobs
+    start largest-first; whenever the largest waiting job does not fit,
+    smaller ones are started to use the idle capacity. Jobs can be given up
+    front with run() or streamed in with submit() while serve() runs.
+    """
+
+    def __init__(self, total_cores, total_heap_mb, report_interval=60, log=print):
+        self.total_cores = total_cores
+        self.total_heap_mb = total_heap_mb
+        self.report_interval = report_interval
+        self.log = log
+        self.condition = threading.Condition()
+        self.pending = []
+        self.running = {}
+        self.closed = False
+        self.done = 0
+        self.failed = 0
+        self.used_cores = 0
+        self.used_heap_mb = 0
+        self.busy_core_seconds = 0.0
+        self.started_at = None
+        self._last_change = None
+
+    def status(self):
+        """Snapshot of the queue and of resource utilisation."""
+        with self.condition:
+            now = time.time()
+            elapsed = now - self.started_at if self.started_at else 0
+            busy = self.busy_core_seconds
+            if self._last_change:
+                busy += self.used_cores * (now - self._last_change)
+            return {
+                'queued': len(self.pending),
+                'running': sorted(self.running),
+                'done': self.done,
+                'failed': self.failed,
+                'cores_used': self.used_cores,
+                'cores_total': self.total_cores,
+                'heap_used_mb': self.used_heap_mb,
+                'heap_total_mb': self.total_heap_mb,
+                'core_utilisation': (
+                    busy / (elapsed * self.total_cores) if elapsed else 0.0
+                )
+            }
+
+    def report(self):
+        status = self.status()
+        self.log(
+            f"Scheduler: {status['queued']} queued, {len(status['running'])} running, "
+            f"{status['done']} done, {status['failed']} failed | "
+            f"cores {status['cores_used']}/{status['cores_total']}, "
+            f"heap {status['heap_used_mb']}/{status['heap_total_mb']} MB, "
+            f"utilisation {status['core_utilisation']:.0%}"
+        )
+
+    def _fits(self, job):
+        return (self.used_cores + job.cores <= self.total_cores
+                and self.used_heap_mb + job.heap_mb <= self.total_heap_mb)
+
+    def _next_job(self):
+        for job in self.pending:
+            if self._fits(job):
+                return job
+        # Nothing fits and nothing runs: a job bigger than the budget goes alone
+        if not self.running and self.pending:
+            return self.pending[0]
+        return None
+
+    def _account(self):
+        now = time.time()
+        self.busy_core_seconds += self.used_cores * (now - self._last_change)
+        self._last_change = now
+
+    def _run_job(self, job, worker):
+        start = time.time()
+        ok = False
+        try:
+            worker(job)
+            ok = True
+        except Exception as e:
+            self.log(f"Error processing {job.url}: {e}")
+        finally:
+            with self.condition:
+                self._account()
+                del self.running[job.url]
+                self.used_cores -= job.cores
+                self.used_heap_mb -= job.heap_mb
+                if ok:
+                    self.done += 1
+                else:
+                    self.failed += 1
+                self.condition.notify_all()
+            self.log(f"Finished {job.url} in {time.time() - start:.0f}s")
+
+    def submit(self, job):
+        """Queue a job; it is placed by cost among the jobs still waiting."""
+        with self.condition:
+            self.pending.append(job)
+            self.pending.sort(key=lambda pending_job: pending_job.cost, reverse=True)
+            self.condition.notify_all()
+
+    def close(self):
+        """Declare that no more jobs will be submitted."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def run(self, jobs, worker):
+        """Run worker(job) for every job and return when all have finished."""
+        for job in jobs:
+            self.submit(job)
+        self.close()
+        self.serve(worker)
+
+    def serve(self, worker):
+        """Start submitted jobs as capacity allows until closed and drained."""
+        with self.condition:
+            self.started_at = self._last_change = time.time()
+
+        threads = []
+        last_report = 0
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None and (self.pending or self.running or not self.closed):
+                    self.condition.wait(timeout=self.report_interval)
+                    if time.time() - last_report >= self.report_interval:
+                        break
+                    job = self._next_job()
+                if self.closed and not self.pending and not self.running:
+                    break
+                if job is not None:
+                    self._account()
+                    self.pending.remove(job)
+                    self.running[job.url] = job
+                    self.used_cores += job.cores
+                    self.used_heap_mb += job.heap_mb
+                    self.log(
+                        f"Starting {job.url} ({job.commits} commits, {job.pack_mb} MB pack) "
+                        f"with {job.cores} cores and {job.heap_mb} MB heap"
+                    )
+                    thread = threading.Thread(target=self._run_job, args=(job, worker), daemon=True)
+                    thread.start()
+                    threads.append(thread)
+
+            if time.time() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.time()
+
+        for thread in threads:
+            thread.join()
+        self.report()
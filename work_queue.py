@@ -0,0 +1,291 @@
+"""
+Lease-based queue of repositories shared by main.py workers on many hosts.
+
+    python work_queue.py /shared/queue.db --add urls.txt
+    python work_queue.py /shared/queue.db --status
+    python work_queue.py /shared/queue.db --requeue-failed
+
+Workers started with `main.py --queue /shared/queue.db` claim one
+repository at a time. A claim is a lease that the worker's heartbeat
+thread keeps extending; when a worker dies its leases run out and the
+repositories go back to the queue, up to max_attempts claims each.
+Lease times are wall-clock times, so the hosts' clocks must be in sync
+(NTP). The database may live on a shared filesystem with working locks;
+it uses SQLite's rollback journal because WAL needs shared memory that
+network filesystems do not provide.
+"""
+import os
+import time
+import shutil
+import socket
+import sqlite3
+import argparse
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    heartbeat_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    finished_at REAL,
+    results_path TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, position);
+CREATE INDEX IF NOT EXISTS jobs_worker ON jobs (worker);
+'''
+
+STATES = ['pending', 'leased', 'done', 'failed']
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class WorkQueue:
+    """
+    The jobs table of one queue database. Every change is a short
+    transaction, so many workers can share the file; claims take the write
+    lock up front (BEGIN IMMEDIATE) so two workers never get the same job.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=DELETE')
+        self.connection.executescript(SCHEMA)
+
+    def _transaction(self, statements):
+        """Run statements(cursor) in one write transaction and return its result."""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(cursor)
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return result
+
+    def add(self, urls):
+        """Queue urls that are not in the queue yet; returns how many were added."""
+        def statements(cursor):
+            position = cursor.execute('SELECT COALESCE(MAX(position), 0) FROM jobs').fetchone()[0]
+            added = 0
+            for url in urls:
+                position += 1
+                cursor.execute('INSERT OR IGNORE INTO jobs (url, position) VALUES (?, ?)', (url, position))
+                added += cursor.rowcount
+            return added
+        return self._transaction(statements)
+
+    def _expire_leases(self, cursor, now):
+        """Give up the leases of workers that stopped sending heartbeats."""
+        cursor.execute(
+            '''UPDATE jobs SET
+                   state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   error = 'lease of ' || worker || ' expired',
+                   worker = NULL, lease_expires = NULL
+               WHERE state = 'leased' AND lease_expires < ?''',
+            (self.max_attempts, now)
+        )
+
+    def claim(self, worker):
+        """Lease the next pending repository to worker; returns its url or None."""
+        def statements(cursor):
+            now = time.time()
+            self._expire_leases(cursor, now)
+            row = cursor.execute(
+                "SELECT url FROM jobs WHERE state = 'pending' ORDER BY position LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            cursor.execute(
+                '''UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, heartbeat_at = ?,
+                       attempts = attempts + 1, error = NULL
+                   WHERE url = ?''',
+                (worker, now + self.lease_seconds, now, row[0])
+            )
+            return row[0]
+        return self._transaction(statements)
+
+    def heartbeat(self, worker):
+        """Extend every lease held by worker; returns how many it still holds."""
+        def statements(cursor):
+            now = time.time()
+            cursor.execute(
+                "UPDATE jobs SET lease_expires = ?, heartbeat_at = ? WHERE worker = ? AND state = 'leased'",
+                (now + self.lease_seconds, now, worker)
+            )
+            return cursor.rowcount
+        return self._transaction(statements)
+
+    def complete(self, url, worker, error=None, results_path=None):
+        """
+        Mark url done, or failed with error. Returns False, changing
+        nothing, if worker lost the lease in the meantime.
+        """
+        def statements(cursor):
+            cursor.execute(
+                '''UPDATE jobs SET state = ?, error = ?, results_path = ?, finished_at = ?,
+                       worker = NULL, lease_expires = NULL
+                   WHERE url = ? AND worker = ? AND state = 'leased' ''',
+                ('failed' if error else 'done', error, results_path, time.time(), url, worker)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(statements)
+
+    def release(self, worker):
+        """Put the unfinished repositories of a stopping worker back into the queue."""
+        def statements(cursor):
+            cursor.execute(
+                '''UPDATE jobs SET state = 'pending', worker = NULL, lease_expires = NULL,
+                       attempts = MAX(attempts - 1, 0)
+                   WHERE worker = ? AND state = 'leased' ''',
+                (worker,)
+            )
+            return cursor.rowcount
+        return self._transaction(statements)
+
+    def requeue(self, state='failed'):
+        """Send every job in state back to pending with a fresh attempt count."""
+        def statements(cursor):
+            cursor.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, error = NULL WHERE state = ?", (state,)
+            )
+            return cursor.rowcount
+        return self._transaction(statements)
+
+    def leased_elsewhere(self, worker):
+        """Repositories other workers are still on; one of them may come back."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND worker != ?", (worker,)
+            ).fetchone()[0]
+
+    def status(self):
+        """{state: number of repositories}."""
+        with self.lock:
+            counts = dict(self.connection.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def failures(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT url, attempts, error FROM jobs WHERE state = 'failed' ORDER BY position"
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class QueueWorker:
+    """
+    This process's side of a WorkQueue: claims repositories one at a time,
+    keeps their leases alive from a heartbeat thread and reports each one
+    as done or failed, copying its results to a shared directory.
+    """
+
+    def __init__(self, work_queue, worker_id=None, poll_interval=30, log=print):
+        self.queue = work_queue
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.log = log
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self.thread.start()
+        return self
+
+    def _heartbeat(self):
+        # Three beats per lease, so one slow write does not lose it
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(self.worker_id)
+            except sqlite3.Error as e:
+                self.log(f"Warning: Queue heartbeat failed: {e}")
+
+    def urls(self):
+        """
+        Yield claimed urls until the queue is drained. While other workers
+        still hold leases, keep polling: a crashed worker's repositories
+        come back once its leases expire.
+        """
+        while not self.stopped.is_set():
+            url = self.queue.claim(self.worker_id)
+            if url is not None:
+                yield url
+            elif self.queue.leased_elsewhere(self.worker_id):
+                self.stopped.wait(self.poll_interval)
+            else:
+                return
+
+    def finish(self, url, error=None, results_dir=None, collect_dir=None):
+        """
+        Report url to the queue. With collect_dir the results of a finished
+        repository are copied to collect_dir/<repo>, replacing older ones,
+        as long as this worker still held the lease.
+        """
+        staged = None
+        target = None
+        if collect_dir and error is None and results_dir and os.path.isdir(results_dir):
+            target = os.path.join(collect_dir, os.path.basename(os.path.normpath(results_dir)))
+            staged = f'{target}.{self.worker_id.replace(os.sep, "_")}.tmp'
+            shutil.rmtree(staged, ignore_errors=True)
+            shutil.copytree(results_dir, staged)
+
+        if not self.queue.complete(url, self.worker_id, str(error) if error else None, target):
+            self.log(f"Warning: Lost the lease on {url}; another worker owns it now")
+            if staged:
+                shutil.rmtree(staged, ignore_errors=True)
+            return False
+
+        if staged:
+            old = f'{staged}.old'
+            if os.path.exists(target):
+                os.rename(target, old)
+            os.rename(staged, target)
+            shutil.rmtree(old, ignore_errors=True)
+        return True
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        released = self.queue.release(self.worker_id)
+        if released:
+            self.log(f"Returned {released} unfinished repositories to the queue")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('database', help='path of the queue database')
+    parser.add_argument('--add', metavar='URLS_FILE', help='queue the repositories listed in this file')
+    parser.add_argument('--requeue-failed', action='store_true', help='retry every failed repository')
+    parser.add_argument('--status', action='store_true', help='print the number of repositories per state')
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(args.database)
+    try:
+        if args.add:
+            with open(args.add, 'r') as f:
+                urls = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+            print(f"Queued {work_queue.add(urls)} of {len(urls)} repositories")
+        if args.requeue_failed:
+            print(f"Requeued {work_queue.requeue('failed')} failed repositories")
+        if args.status or not (args.add or args.requeue_failed):
+            print(', '.join(f'{state}: {count}' for state, count in work_queue.status().items()))
+            for url, attempts, error in work_queue.failures():
+                print(f"  failed after {attempts} attempts: {url}: {error}")
+    finally:
+        work_queue.close()
+
+if __name__ == '__main__':
+    main()
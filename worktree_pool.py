@@ -0,0 +1,114 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import collections
+import concurrent.futures
+from contextlib import contextmanager
+from deadlines import current_deadlines, deadline, inherited_deadlines
+
+class WorktreePool:
+    """
+    A fixed set of `git worktree`s of one repository. Each worker borrows a
+    worktree and only moves it between commits; nothing is fetched, cleaned
+    or reset per checkout. root can point at a tmpfs such as /dev/shm.
+    """
+
+    def __init__(self, repo_path, size, root=None):
+        self.repo_path = repo_path
+        name = os.path.basename(os.path.normpath(repo_path))
+        if root:
+            self.root = os.path.join(root, f'{name}_{os.getpid()}_worktrees')
+        else:
+            self.root = f'{os.path.normpath(repo_path)}.worktrees'
+        self.paths = [os.path.join(self.root, f'worktree_{index}') for index in range(max(1, size))]
+        self.free = queue.Queue()
+
+    def _git(self, args, cwd=None):
+        subprocess.run(
+            ['git'] + args,
+            cwd=cwd or self.repo_path,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    def open(self):
+        os.makedirs(self.root, exist_ok=True)
+        for path in self.paths:
+            self._git(['worktree', 'add', '--detach', '--no-checkout', os.path.abspath(path)])
+            self.free.put(path)
+        return self
+
+    def close(self):
+        for path in self.paths:
+            try:
+                self._git(['worktree', 'remove', '--force', os.path.abspath(path)])
+            except subprocess.CalledProcessError:
+                pass
+        shutil.rmtree(self.root, ignore_errors=True)
+        try:
+            self._git(['worktree', 'prune'])
+        except subprocess.CalledProcessError:
+            pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def worktree(self):
+        path = self.free.get()
+        try:
+            yield path
+        finally:
+            self.free.put(path)
+
+    def checkout(self, path, commit_hash):
+        self._git(['checkout', '--detach', '--force', '--quiet', commit_hash], cwd=path)
+
+def iter_worktree_locs(repo_path, commit_index, measure, workers, root=None, commit_timeout=None):
+    """
+    Yield (commit_ref, loc_before, loc_after, error) for every entry of
+    commit_index, in order, measuring measure(worktree_path) on the parent
+    and the commit across a pool of worktrees. Tools that run past
+    commit_timeout seconds for a commit, or past the caller's deadlines,
+    end in DeadlineExceeded.
+    """
+    # Pool threads still count toward the caller's stage deadline
+    deadlines = current_deadlines()
+    memo = {}
+    memo_lock = threading.Lock()
+
+    with WorktreePool(repo_path, workers, root) as pool:
+        def commit_loc(path, commit_hash):
+            with memo_lock:
+                if commit_hash in memo:
+                    return memo[commit_hash]
+            pool.checkout(path, commit_hash)
+            loc = measure(path)
+            with memo_lock:
+                memo[commit_hash] = loc
+            return loc
+
+        def measure_pair(commit_ref):
+            try:
+                with inherited_deadlines(deadlines), pool.worktree() as path, deadline(commit_timeout, 'commit'):
+                    loc_before = commit_loc(path, commit_ref.parent)
+                    loc_after = commit_loc(path, commit_ref.sha)
+                return commit_ref, loc_before, loc_after, None
+            except Exception as e:
+                return commit_ref, None, None, e
+
+        # A bounded window of in-flight pairs keeps results in order and memory flat
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(pool.paths)) as executor:
+            in_flight = collections.deque()
+            for commit_ref in commit_index:
+                in_flight.append(executor.submit(measure_pair, commit_ref))
+                if len(in_flight) >= len(pool.paths) * 4:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()